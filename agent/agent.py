@@ -1,37 +1,121 @@
+import os
 import re
 import json
+import time
+import asyncio
+import threading
+from contextlib import asynccontextmanager
 from typing import TypedDict, Annotated, Any, Dict, List
 
 from langgraph.graph import START, StateGraph
 from langgraph.prebuilt import tools_condition, ToolNode
 from langgraph.graph.message import add_messages
-from langchain_core.messages import AIMessage
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.runnables import RunnableLambda
 
 from agent.nodes.planning import PlanningNode, ensure_planning_state
 from agent.utils import prewarm
+from agent.utils.session import SESSION_LOCKS, new_session_id
+from agent.utils.cancel import CancelToken, RunCancelled, bind_token, raise_if_cancelled, record_cancelled_run
+from agent.utils.metrics import PLANNING_EXHAUSTED, TurnTimer, track_node
+from agent.utils import deadline, http
+from agent.utils.deadline import DeadlineExceeded, bind_deadline
+from agent.utils.llm import ainvoke_llm, invoke_llm
+from agent.utils.scheduler import priority_scope
+from agent.utils.usage import SESSION_USAGE, TurnUsage, bind_usage
+from agent.utils.answer_cache import ANSWER_CACHE, ENABLED as ANSWER_CACHE_ENABLED
+from agent.utils import compaction
+from agent.utils.tool_budget import budgeted
 from agent.utils.message import filter_messages_for_prompt, is_final_agent_reply, get_tool_query
 from agent import config as agent_config
+from agent.tools.web_search import relevance, sensitive_filter
 
 # --------------------------
 # State 定义
 # --------------------------
+def _merge_ids(left: List[str] | None, right: List[str] | None) -> List[str]:
+    left = list(left or [])
+    return left + [i for i in (right or []) if i not in left]
+
+
 class AgentState(TypedDict, total=False):
     messages: Annotated[List[Any], add_messages]
     next: str
     planning: Dict[str, Any]
+    # 已被判定无效的 tool_call_id：planning 状态每轮重置，这里跨轮累积，历史消息的过滤结果保持不变
+    hidden_tool_call_ids: Annotated[List[str], _merge_ids]
+    # 历史压缩：{"summary": 较早轮次的摘要, "covered": 已折叠进摘要的消息数}（见 agent.utils.compaction）
+    compaction: Dict[str, Any]
 
 # --------------------------
 # Graph 节点
 # --------------------------
-def chatbot(state: AgentState):
+def _chatbot_prompt(state: AgentState):
+    # 运行已被取消（客户端断开）时不再发起新的 LLM 调用
+    raise_if_cancelled()
     pl = ensure_planning_state(state)
-    messages = filter_messages_for_prompt(state["messages"], pl)
+    hidden = state.get("hidden_tool_call_ids") or ()
+    # 时间预算将尽：不再发起新的工具调用，直接基于已有信息作答
+    if not pl.get("exhausted") and deadline.budget_low():
+        PLANNING_EXHAUSTED.inc(reason="deadline")
+        pl = {**pl, "exhausted": True, "enable": False}
+
+    # 超出 token 预算时压缩发给模型的历史（checkpoint 中的完整历史不变）
+    compact = compaction.plan([agent_config.SYS_MSG_WITH_TOOLS], state["messages"], state.get("compaction"),
+                              lambda messages: filter_messages_for_prompt(messages, pl, hidden))
+    model = agent_config.LLM_TOOLS_DISABLED if pl.get("exhausted") else agent_config.LLM_WITH_TOOLS
+    return pl, model, compact
+
+
+def _chatbot_messages(pl: Dict[str, Any], compact: compaction.CompactionPlan) -> List[Any]:
+    # 提示前缀（工具定义 + SYS_MSG_WITH_TOOLS + 历史）在各轮间保持一致以命中前缀缓存；
+    # 兜底阶段只禁止工具调用，并把无工具说明追加在末尾
+    if pl.get("exhausted"):
+        return [*compact.messages(), agent_config.SYS_MSG_NO_TOOLS]
+    return compact.messages()
+
+
+# 摘要调用不挂回调：其 token 不作为 chatbot 的回答增量下发
+_SUMMARY_CONFIG = {"callbacks": []}
+
+
+def _summarize(compact: compaction.CompactionPlan) -> Dict[str, Any]:
+    if not compact.fold:
+        return {"compaction": compact.apply_summary(compact.summary or "")}
+    summary = None
+    if not deadline.budget_low():
+        try:
+            summary = invoke_llm("compaction", compaction.build_summary_prompt(compact.summary, compact.fold),
+                                 config=_SUMMARY_CONFIG).content
+        except RunCancelled:
+            raise
+        except Exception as e:
+            print(f"[compaction] 总结失败，使用截断摘要: {e}")
+    summary = summary or compaction.fallback_summary(compact.summary, compact.fold)
+    return {"compaction": compact.apply_summary(summary)}
+
 
-    model = agent_config.LLM_NO_TOOLS if pl.get("exhausted") else agent_config.LLM_WITH_TOOLS
-    sys_msg = agent_config.SYS_MSG_NO_TOOLS if pl.get("exhausted") else agent_config.SYS_MSG_WITH_TOOLS
+async def _asummarize(compact: compaction.CompactionPlan) -> Dict[str, Any]:
+    if not compact.fold:
+        return {"compaction": compact.apply_summary(compact.summary or "")}
+    summary = None
+    if not deadline.budget_low():
+        try:
+            response = await deadline.wait_for(
+                ainvoke_llm("compaction", compaction.build_summary_prompt(compact.summary, compact.fold),
+                            config=_SUMMARY_CONFIG),
+                reserve=deadline.ANSWER_RESERVE_SECONDS)
+            summary = response.content
+        except RunCancelled:
+            raise
+        except Exception as e:
+            print(f"[compaction] 总结失败，使用截断摘要: {e}")
+    summary = summary or compaction.fallback_summary(compact.summary, compact.fold)
+    return {"compaction": compact.apply_summary(summary)}
 
-    reply = model.invoke([sys_msg] + messages)
 
+def _chatbot_reply(pl: Dict[str, Any], reply):
+    hidden = {"hidden_tool_call_ids": pl["invalid_tool_call_ids"]} if pl.get("invalid_tool_call_ids") else {}
     if pl.get("exhausted"):
         def _strip_tool_markup(s: str) -> str:
             if not isinstance(s, str): return s
@@ -40,8 +124,23 @@ def chatbot(state: AgentState):
         cleaned = _strip_tool_markup(getattr(reply, "content", str(reply)))
         cleaned = cleaned or "当前无法继续调用工具检索，我将基于已知信息作答。如需我继续搜索，请重新提问或允许继续检索。"
         reply = AIMessage(content=cleaned)
+        return {"messages": [reply], "planning": pl, **hidden}
 
-    return {"messages": [reply]}
+    return {"messages": [reply], **hidden}
+
+
+def chatbot(state: AgentState):
+    pl, model, compact = _chatbot_prompt(state)
+    update = _summarize(compact) if compact.fold_count else {}
+    reply = invoke_llm("chatbot", _chatbot_messages(pl, compact), model=model)
+    return {**_chatbot_reply(pl, reply), **update}
+
+
+async def achatbot(state: AgentState):
+    pl, model, compact = _chatbot_prompt(state)
+    update = await _asummarize(compact) if compact.fold_count else {}
+    reply = await deadline.wait_for(ainvoke_llm("chatbot", _chatbot_messages(pl, compact), model=model))
+    return {**_chatbot_reply(pl, reply), **update}
 
 
 def select(state: AgentState):
@@ -53,16 +152,37 @@ def select(state: AgentState):
 # --------------------------
 # Graph 构建
 # --------------------------
+def _instrumented_node(name: str, runnable):
+    """
+    包装图节点：记录节点耗时与异常次数（/metrics 中的 agent_node_duration_seconds）。
+    """
+    def run(state, config):
+        with track_node(name):
+            return runnable.invoke(state, config)
+
+    async def arun(state, config):
+        with track_node(name):
+            return await runnable.ainvoke(state, config)
+
+    return RunnableLambda(run, afunc=arun, name=name)
+
+
 def create_graph():
     graph_builder = StateGraph(AgentState)
 
     tool_node = ToolNode(agent_config.TOOLS)
-    planning_node = PlanningNode(llm_instance=agent_config.LLM_WITH_TOOLS, date_tool=agent_config.TOOLS[0])
+    # 判定/选择只需要很短的输出：路由到不绑定工具的 fast 档模型（config.MODEL_ROUTES）
+    planning_node = PlanningNode(llm_instance=agent_config.get_llm("planning.judge"),
+                                 select_llm=agent_config.get_llm("planning.select"),
+                                 date_tool=agent_config.TOOLS[0])
 
-    graph_builder.add_node("chatbot", chatbot)
-    graph_builder.add_node("tools", tool_node)
-    graph_builder.add_node("planning", planning_node)
-    graph_builder.add_node("select", select)
+    # 同时提供同步/异步实现：graph.stream 走同步函数，graph.astream 走协程，避免占用线程池
+    graph_builder.add_node("chatbot", _instrumented_node("chatbot", RunnableLambda(chatbot, afunc=achatbot)))
+    # 工具结果按工具的 token 上限精简后再写入消息（agent/utils/tool_budget.py）
+    graph_builder.add_node("tools", _instrumented_node("tools", budgeted(tool_node)))
+    graph_builder.add_node("planning", _instrumented_node(
+        "planning", RunnableLambda(planning_node, afunc=planning_node.acall)))
+    graph_builder.add_node("select", _instrumented_node("select", RunnableLambda(select)))
 
     graph_builder.add_edge(START, "chatbot")
     graph_builder.add_conditional_edges("chatbot", tools_condition)
@@ -73,55 +193,464 @@ def create_graph():
     return graph_builder.compile(checkpointer=agent_config.MEMORY)
 
 
-graph = create_graph()
+# graph 延迟编译：首次运行或预热阶段才构建（会触发 LLM 客户端创建）
+_graph = None
+_graph_lock = threading.Lock()
+
+
+def get_graph():
+    global _graph
+    if _graph is None:
+        with _graph_lock:
+            if _graph is None:
+                _graph = create_graph()
+    return _graph
+
+
+def __getattr__(name: str):
+    # 兼容旧用法 `from agent.agent import graph`
+    if name == "graph":
+        return get_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # --------------------------
 # 外部交互接口
 # --------------------------
-def agent_respond_stream(user_input: str, deep_thinking: bool = False, web_search_mode: str = "auto"):
-    init_state: AgentState = {
+def _init_state(user_input: str, deep_thinking: bool) -> AgentState:
+    return {
         "messages": [("user", user_input)],
         "planning": {"enable": deep_thinking, "exhausted": False, "tried_count": 0, "tried_urls": [],
                      "invalid_tool_call_ids": []}
     }
-    for event in graph.stream(init_state, agent_config.GRAPH_CONFIG):
-        for node, value in event.items():
-            if node == "tools":
-                tool_msg = value.get("messages", [])[-1] if value.get("messages") else None
-                if tool_msg:
-                    yield {
-                        "type": "tool_result", "tool": getattr(tool_msg, "name", "unknown"),
-                        "content": getattr(tool_msg, "content", str(tool_msg)),
-                        "meta": {"tool_call_id": getattr(tool_msg, "tool_call_id", None),
-                                 "id": getattr(tool_msg, "id", None)},
-                        "is_final": False
-                    }
-            elif node == "chatbot":
-                bot_msg = value.get("messages", [])[-1]
-                content = getattr(bot_msg, "content", str(bot_msg))
-                final = is_final_agent_reply(bot_msg)
-                yield {
-                    "type": "chat" if final else "intermediate_step",
-                    "role": getattr(bot_msg, "role", "assistant"), "content": content,
-                    "query": get_tool_query(bot_msg) if hasattr(bot_msg, "tool_calls") else None,
-                    "is_final": final
-                }
+
+
+# 事件中 url_summary 等长文本工具结果的预览长度（完整内容仍在会话状态中供模型使用）
+EVENT_PREVIEW_CHARS = int(os.getenv("AGENT_EVENT_PREVIEW_CHARS", "300"))
+# google_search 结果下发到前端的字段；favicon 由前端按链接域名生成，score 仅用于排序
+SEARCH_RESULT_FIELDS = ("title", "link", "snippet", "date", "index")
+
+
+def _compact(event: Dict[str, Any]) -> Dict[str, Any]:
+    # 去掉值为 None 或空 dict 的字段，减少每帧的重复内容
+    return {k: v for k, v in event.items() if v is not None and v != {}}
+
+
+def _tool_event(tool: str, content: Any) -> Dict[str, Any]:
+    """
+    工具结果 -> 事件字段：google_search 以原生数组下发（不再是 JSON 字符串），
+    长文本只下发预览并标记 truncated。
+    """
+    if tool == "google_search" and isinstance(content, str):
+        try:
+            items = json.loads(content)
+        except ValueError:
+            items = None
+        if isinstance(items, list):
+            return {"content": [{k: item[k] for k in SEARCH_RESULT_FIELDS if item.get(k) not in (None, "")}
+                                for item in items if isinstance(item, dict)]}
+    if isinstance(content, str) and len(content) > EVENT_PREVIEW_CHARS:
+        return {"content": content[:EVENT_PREVIEW_CHARS], "truncated": True, "length": len(content)}
+    return {"content": content}
+
+
+def _events_from_update(event: Dict[str, Any]):
+    """
+    把 graph 每一步的增量更新转换为前端流式事件。
+    """
+    for node, value in event.items():
+        if node == "tools":
+            tool_msg = value.get("messages", [])[-1] if value.get("messages") else None
+            if tool_msg:
+                tool = getattr(tool_msg, "name", "unknown")
+                yield _compact({
+                    "type": "tool_result", "tool": tool,
+                    **_tool_event(tool, getattr(tool_msg, "content", str(tool_msg))),
+                    "meta": _compact({"tool_call_id": getattr(tool_msg, "tool_call_id", None),
+                                      "id": getattr(tool_msg, "id", None)}),
+                    "is_final": False
+                })
+        elif node == "chatbot":
+            bot_msg = value.get("messages", [])[-1]
+            content = getattr(bot_msg, "content", str(bot_msg))
+            final = is_final_agent_reply(bot_msg)
+            yield _compact({
+                "type": "chat" if final else "intermediate_step",
+                "content": content,
+                "query": get_tool_query(bot_msg) if hasattr(bot_msg, "tool_calls") else None,
+                # 与 chat_delta 的 meta.id 对应：若该消息最终是工具调用，前端据此丢弃已流出的增量文本
+                "meta": _compact({"id": getattr(bot_msg, "id", None)}),
+                "is_final": final
+            })
+
+
+def _delta_from_message(payload) -> Dict[str, Any] | None:
+    """
+    stream_mode="messages" 的 token 分片 -> chat_delta 事件；只转发 chatbot 节点的文本增量，
+    planning 节点的判定/选择调用与工具调用参数分片不下发。
+    """
+    chunk, metadata = payload
+    if (metadata or {}).get("langgraph_node") != "chatbot":
+        return None
+    if not isinstance(chunk, AIMessageChunk) or getattr(chunk, "tool_call_chunks", None):
+        return None
+    content = chunk.content if isinstance(chunk.content, str) else ""
+    if not content:
+        return None
+    return {"type": "chat_delta", "content": content, "meta": {"id": chunk.id}, "is_final": False}
+
+
+def _events_from_stream(mode: str, payload):
+    if mode == "messages":
+        delta = _delta_from_message(payload)
+        if delta:
+            yield delta
+    elif mode == "updates":
+        yield from _events_from_update(payload)
+
+
+# 同时订阅节点增量与 LLM token：最终回答边生成边以 chat_delta 下发，节点结束后再发收尾的 chat 事件
+STREAM_MODES = ["updates", "messages"]
+
+
+class _PartialAnswer:
+    """
+    记录正在流式输出的回答文本；超出时间预算时用它拼出截断的最终回答。
+    """
+    def __init__(self):
+        self.text = ""
+
+    def feed(self, entry: Dict[str, Any]):
+        if entry["type"] == "chat_delta":
+            self.text += entry["content"]
+        else:
+            self.text = ""
+
+    def timeout_reply(self, budget: float) -> Dict[str, Any]:
+        note = f"（本轮处理超出时间预算 {budget:.0f} 秒，回答被截断）"
+        content = f"{self.text}\n\n{note}" if self.text else f"抱歉，{note[1:-1]}，请缩小问题范围或稍后重试。"
+        return {"type": "chat", "content": content, "meta": {"timeout": True}, "is_final": True}
+
+
+def _with_usage(entry: Dict[str, Any], usage: TurnUsage) -> Dict[str, Any]:
+    # 最终回答附带本轮 LLM 用量：prompt/completion/缓存命中 token 合计，以及按节点（chatbot / planning）的明细
+    if entry["type"] == "chat":
+        entry["usage"] = usage.snapshot()
+    return entry
+
+
+# --------------------------
+# 答案缓存（见 agent.utils.answer_cache）：只用于会话的第一轮，命中时不执行图
+# --------------------------
+# 用到这些工具的回答依赖工作区文件/知识库内容，不写入缓存
+UNCACHEABLE_TOOLS = {"docs_use", "kb_search"}
+
+
+def _cache_mode(deep_thinking: bool, web_search_mode: str) -> str:
+    return f"{'deep' if deep_thinking else 'fast'}:{web_search_mode}"
+
+
+def _first_turn(state) -> bool:
+    return ANSWER_CACHE_ENABLED and not (state.values or {}).get("messages")
+
+
+def _cached_reply(hit: Dict[str, Any]) -> Dict[str, Any]:
+    return {"type": "chat", "content": hit["answer"],
+            "meta": {"cached": True, "category": hit["category"], "similarity": hit["similarity"],
+                     "cached_at": round(hit["cached_at"], 3)},
+            "is_final": True}
+
+
+def _cached_update(user_input: str, deep_thinking: bool, hit: Dict[str, Any]) -> Dict[str, Any]:
+    # 命中时把本轮问答写入会话历史，后续追问仍有上下文
+    return {**_init_state(user_input, deep_thinking),
+            "messages": [("user", user_input), AIMessage(content=hit["answer"])]}
+
+
+class _AnswerRecorder:
+    """
+    记录本轮的最终回答及用到的工具，决定是否写入答案缓存。
+    兜底作答的轮次（planning.exhausted，或作答时时间预算将尽）信息不全，不写入缓存。
+    """
+    def __init__(self, first_turn: bool):
+        self.cacheable = first_turn
+        self.answer = None
+
+    def observe(self, mode: str, payload):
+        if mode != "updates" or not isinstance(payload, dict):
+            return
+        for update in payload.values():
+            if isinstance(update, dict) and (update.get("planning") or {}).get("exhausted"):
+                self.cacheable = False
+
+    def feed(self, entry: Dict[str, Any]):
+        if entry["type"] == "tool_result" and entry.get("tool") in UNCACHEABLE_TOOLS:
+            self.cacheable = False
+        elif entry["type"] == "chat":
+            self.answer = entry["content"]
+            if deadline.budget_low():
+                self.cacheable = False
+
+    def cacheable_answer(self) -> str | None:
+        return self.answer if self.cacheable and self.answer else None
+
+
+def _time_budget(time_budget: float | None) -> float:
+    return deadline.DEFAULT_TIME_BUDGET_SECONDS if time_budget is None else time_budget
+
+
+def agent_respond_stream(user_input: str, deep_thinking: bool = False, web_search_mode: str = "auto",
+                         session_id: str | None = None, time_budget: float | None = None):
+    """
+    time_budget 为本轮时间预算（秒，默认 AGENT_TIME_BUDGET_SECONDS，<=0 不限）：工具超时收缩到剩余预算内，
+    预算将尽时 planning/chatbot 转为无工具作答；预算用完则结束本轮并给出截断的最终回答。
+    会话第一轮命中答案缓存时直接产出带 meta.cached 的 chat 事件。
+    """
+    init_state = _init_state(user_input, deep_thinking)
+    config = agent_config.make_graph_config(session_id)
+    timer = TurnTimer()
+    outcome = "error"
+    partial = _PartialAnswer()
+    budget = _time_budget(time_budget)
+    usage = TurnUsage()
+    cache_mode = _cache_mode(deep_thinking, web_search_mode)
+    try:
+        with bind_deadline(budget) as dl, bind_usage(usage), \
+                SESSION_LOCKS.hold_sync(config["configurable"]["thread_id"]):
+            first_turn = _first_turn(get_graph().get_state(config))
+            hit = ANSWER_CACHE.lookup(user_input, cache_mode) if first_turn else None
+            if hit is not None:
+                get_graph().update_state(config, _cached_update(user_input, deep_thinking, hit), as_node="chatbot")
+                outcome = "cached"
+                timer.event()
+                yield _with_usage(_cached_reply(hit), usage)
+                return
+            recorder = _AnswerRecorder(first_turn)
+            try:
+                for mode, payload in get_graph().stream(init_state, config, stream_mode=STREAM_MODES):
+                    recorder.observe(mode, payload)
+                    for entry in _events_from_stream(mode, payload):
+                        partial.feed(entry)
+                        recorder.feed(entry)
+                        timer.event()
+                        yield _with_usage(entry, usage)
+                    if dl is not None and dl.expired:
+                        raise DeadlineExceeded("time budget exhausted")
+                outcome = "ok"
+                if recorder.cacheable_answer():
+                    ANSWER_CACHE.put(user_input, cache_mode, recorder.cacheable_answer())
+            except DeadlineExceeded:
+                outcome = "timeout"
+                yield _with_usage(partial.timeout_reply(budget), usage)
+    except GeneratorExit:
+        outcome = "cancelled"
+        raise
+    finally:
+        timer.finish(outcome)
+        SESSION_USAGE.record(config["configurable"]["thread_id"], usage.snapshot())
+
+
+async def agent_respond_astream(user_input: str, deep_thinking: bool = False, web_search_mode: str = "auto",
+                                session_id: str | None = None, cancel_token: CancelToken | None = None,
+                                time_budget: float | None = None):
+    """
+    agent_respond_stream 的异步版本：基于 graph.astream 驱动，chatbot/planning 使用 ainvoke，
+    ToolNode 走其异步入口，整个对话只占用事件循环而不长期占用线程池 worker。
+    session_id 决定 checkpointer 中的 thread_id：不同会话并行执行，同一会话的轮次（含同步调用）按到达顺序串行；
+    为空时使用新会话。
+    cancel_token 被取消、或生成器被关闭/所在任务被取消（客户端断开）时，停止图的执行：
+    进行中的 LLM 请求随任务取消而中断，线程中的工具在下一次检查点通过令牌提前退出。
+    time_budget 同 agent_respond_stream；LLM 调用在剩余预算内 wait_for，超时即中断。
+    答案缓存同 agent_respond_stream。
+    """
+    init_state = _init_state(user_input, deep_thinking)
+    config = agent_config.make_graph_config(session_id)
+    token = cancel_token or CancelToken()
+    timer = TurnTimer()
+    outcome = "error"
+    last_step = None
+    partial = _PartialAnswer()
+    budget = _time_budget(time_budget)
+    usage = TurnUsage()
+    cache_mode = _cache_mode(deep_thinking, web_search_mode)
+    try:
+        with bind_token(token), bind_deadline(budget) as dl, bind_usage(usage):
+            async with SESSION_LOCKS.hold(config["configurable"]["thread_id"]):
+                # 查询可能调用嵌入模型，放到线程中执行
+                first_turn = _first_turn(await get_graph().aget_state(config))
+                hit = await asyncio.to_thread(ANSWER_CACHE.lookup, user_input, cache_mode) if first_turn else None
+                if hit is not None:
+                    await get_graph().aupdate_state(config, _cached_update(user_input, deep_thinking, hit),
+                                                    as_node="chatbot")
+                    outcome = "cached"
+                    timer.event()
+                    yield _with_usage(_cached_reply(hit), usage)
+                    return
+                recorder = _AnswerRecorder(first_turn)
+                try:
+                    async for mode, payload in get_graph().astream(init_state, config, stream_mode=STREAM_MODES):
+                        token.raise_if_cancelled()
+                        recorder.observe(mode, payload)
+                        for entry in _events_from_stream(mode, payload):
+                            if entry["type"] != "chat_delta":
+                                last_step = entry.get("tool") or entry["type"]
+                            partial.feed(entry)
+                            recorder.feed(entry)
+                            timer.event()
+                            yield _with_usage(entry, usage)
+                        if dl is not None and dl.expired:
+                            raise DeadlineExceeded("time budget exhausted")
+                    outcome = "ok"
+                    if recorder.cacheable_answer():
+                        await asyncio.to_thread(ANSWER_CACHE.put, user_input, cache_mode, recorder.cacheable_answer())
+                except DeadlineExceeded:
+                    outcome = "timeout"
+                    yield _with_usage(partial.timeout_reply(budget), usage)
+    except (asyncio.CancelledError, GeneratorExit, RunCancelled):
+        outcome = "cancelled"
+        token.cancel(token.reason or "client_disconnected")
+        record_cancelled_run(config["configurable"]["thread_id"], token.reason, timer.elapsed(), last_step)
+        raise
+    finally:
+        timer.finish(outcome)
+        # 被取消/超时的轮次已消耗的 token 同样计入会话累计
+        SESSION_USAGE.record(config["configurable"]["thread_id"], usage.snapshot())
+
+def agent_respond(user_input: str, deep_thinking: bool = False, web_search_mode: str = "auto",
+                  session_id: str | None = None, time_budget: float | None = None) -> str:
+    """
+    非流式调用：执行一轮对话并返回最终回答文本（没有最终回答时返回空字符串）。
+    未传 session_id 时每次调用都是独立的新会话；多轮对话需传入同一个 session_id。
+    """
+    answer = ""
+    for entry in agent_respond_stream(user_input, deep_thinking, web_search_mode, session_id, time_budget):
+        if entry["type"] == "chat":
+            answer = entry["content"]
+    return answer
+
+
+async def agent_arespond(user_input: str, deep_thinking: bool = False, web_search_mode: str = "auto",
+                         session_id: str | None = None, cancel_token: CancelToken | None = None,
+                         time_budget: float | None = None) -> str:
+    """
+    agent_respond 的异步版本。
+    """
+    answer = ""
+    async for entry in agent_respond_astream(user_input, deep_thinking, web_search_mode, session_id, cancel_token,
+                                             time_budget):
+        if entry["type"] == "chat":
+            answer = entry["content"]
+    return answer
+
+
+async def _delete_session(session_id: str):
+    SESSION_USAGE.discard(session_id)
+    delete = getattr(agent_config.MEMORY, "adelete_thread", None)
+    if delete is not None:
+        try:
+            await delete(session_id)
+        except NotImplementedError:
+            pass
+
+
+@asynccontextmanager
+async def _no_gate():
+    yield
+
+
+async def agent_respond_batch(questions: List[str], concurrency: int = 4, deep_thinking: bool = False,
+                              web_search_mode: str = "auto", keep_sessions: bool = False, gate=None,
+                              time_budget: float | None = None):
+    """
+    批量提问：最多 concurrency 个问题并发执行，每个问题使用独立的新会话，按完成先后逐个产出结果：
+    {"index", "question", "session_id", "ok", "answer" | "error", "elapsed"}。
+    keep_sessions=False 时问题完成后删除其会话 checkpoint。
+    gate 为可选的异步上下文管理器工厂，每个问题执行前进入（如服务端的准入控制）。
+    生成器被提前关闭时取消尚未完成的问题。
+    批量问题的 LLM 调用以 batch 优先级排队，不与交互式对话争抢限额。
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    gate = gate or _no_gate
+
+    async def run_one(index: int, question: str) -> Dict[str, Any]:
+        session_id = f"batch-{new_session_id()}"
+        async with semaphore, gate():
+            started = time.perf_counter()
+            try:
+                with priority_scope("batch"):
+                    answer = await agent_arespond(question, deep_thinking, web_search_mode, session_id,
+                                                  time_budget=time_budget)
+                result = {"ok": True, "answer": answer}
+            except Exception as e:
+                result = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            finally:
+                if not keep_sessions:
+                    await _delete_session(session_id)
+        return {"index": index, "question": question, "session_id": session_id, **result,
+                "elapsed": round(time.perf_counter() - started, 3)}
+
+    tasks = [asyncio.create_task(run_one(i, q)) for i, q in enumerate(questions)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 # --------------------------
-# 预加载嵌入模型
+# 预热组件（显式预热阶段或首次使用时初始化）
 # --------------------------
-prewarm.start()
+prewarm.register("llm_clients", agent_config.get_llms)
+prewarm.register("graph", get_graph)
+prewarm.register("sensitive_filter", sensitive_filter.warmup)
+prewarm.register("jieba", relevance.warmup)
+prewarm.register("html_parser", lambda: prewarm.import_module_timed("bs4"))
+
+
+# 外部连接：预热阶段建立到 LLM 与搜索端点的池化连接（离线模式下为本地替身服务），并由 keep-warm 定期保活；
+# 连接未就绪的 worker 不接流量（AGENT_READY_REQUIRE_CONNECTIONS=0 时仅作观测）
+_CONNECTIONS_REQUIRED = os.getenv("AGENT_READY_REQUIRE_CONNECTIONS", "1") != "0"
+
+
+def _warm_llm_connection():
+    agent_config.get_llms()["LLM_BASE"].root_client.models.list()
+
+
+async def _awarm_llm_connection():
+    # ainvoke 使用独立的异步 HTTP 客户端，需要在服务的事件循环上单独预热
+    llms = await asyncio.to_thread(agent_config.get_llms)
+    await llms["LLM_BASE"].root_async_client.models.list()
+
+
+prewarm.register("llm_connection", _warm_llm_connection, required=_CONNECTIONS_REQUIRED, refresh=True)
+prewarm.register_async("llm_connection_async", _awarm_llm_connection, required=_CONNECTIONS_REQUIRED, refresh=True)
+prewarm.register("search_connection", lambda: http.warm(http.SEARCH_URL), required=_CONNECTIONS_REQUIRED,
+                 refresh=True)
+
+
+def warmup():
+    """
+    显式预热阶段：构建 LLM 客户端与 graph、敏感词自动机、gfwlist，加载 jieba 词典与嵌入模型，
+    并建立到 LLM / 搜索端点的连接（异步客户端的连接由服务端在事件循环上调用 prewarm.awarmup() 预热）。
+    """
+    return prewarm.warmup()
 
 # --------------------------
 # CLI程序入口
 # --------------------------
 if __name__ == "__main__":
+    warmup()
+    # 一次 CLI 运行对应一个会话
+    cli_session_id = f"cli-{new_session_id()}"
     while True:
         user_input = input("用户> ")
         if user_input.strip().lower() in ("exit", "quit"):
             break
-        for entry in agent_respond_stream(user_input):
+        for entry in agent_respond_stream(user_input, session_id=cli_session_id):
+            if entry["type"] == "chat_delta":
+                print(entry["content"], end="", flush=True)
+                continue
             print(json.dumps(entry, ensure_ascii=False), flush=True)
             if entry["type"] == "chat":
                 print(f'[CHATBOT] {entry["content"]}', flush=True)
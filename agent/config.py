@@ -1,13 +1,17 @@
 import os
+import threading
 from langchain_core.messages import SystemMessage
-from langchain_deepseek import ChatDeepSeek
-from langgraph.checkpoint.memory import MemorySaver
 
 from agent.tools.date.date_tool import today_date
 from agent.tools.spider.spider_tool import url_summary
 from agent.tools.web_search.web_search_tool import google_search
-from agent.tools.docs.docs_tool import docs_use
+from agent.tools.docs.docs_tool import docs_use, PROJECT_ROOT
 from agent.tools.knowledge_base.kb_tool import kb_search
+from agent.utils.checkpoint import BoundedMemorySaver
+from agent.utils.sqlite_checkpoint import SqliteCheckpointSaver
+from agent.utils.metrics import METRICS_CALLBACK
+from agent.utils.session import SESSION_LOCKS, new_session_id
+from agent.utils import http
 
 # --- 工具定义 ---
 TOOLS = [today_date, google_search, url_summary, docs_use, kb_search]
@@ -15,16 +19,124 @@ TOOLS = [today_date, google_search, url_summary, docs_use, kb_search]
 # --- 模型配置 ---
 API_KEY = os.getenv("DEEPSEEK_API_KEY_FROM_ENV")
 
-# 基础模型
-LLM_BASE = ChatDeepSeek(
-    api_base="https://api.deepseek.com",
-    api_key=API_KEY,
-    model="deepseek-chat",
-)
+# --- 模型分级 ---
+# strong：最终回答（绑定工具）；fast：planning 的判定/选择等短分类调用，不绑定工具、输出很短
+MODEL_TIERS = {
+    "strong": {
+        "model": os.getenv("AGENT_STRONG_MODEL", "deepseek-chat"),
+    },
+    "fast": {
+        "model": os.getenv("AGENT_FAST_MODEL", "deepseek-chat"),
+        "temperature": 0,
+        "max_tokens": int(os.getenv("AGENT_FAST_MAX_TOKENS", "128")),
+    },
+}
+
+
+def _parse_routes(raw: str) -> dict:
+    # AGENT_MODEL_ROUTES="planning.judge=strong,planning.select=fast"
+    routes = {}
+    for part in raw.split(","):
+        purpose, _, tier = part.partition("=")
+        if purpose.strip() and tier.strip() in MODEL_TIERS:
+            routes[purpose.strip()] = tier.strip()
+    return routes
+
+
+# 调用用途 -> 模型档位；未列出的用途使用 strong
+MODEL_ROUTES = {
+    "chatbot": "strong",
+    "planning.judge": "fast",
+    "planning.select": "fast",
+    # 历史压缩的增量摘要需要较长输出
+    "compaction": "strong",
+    **_parse_routes(os.getenv("AGENT_MODEL_ROUTES", "")),
+}
+
+
+def tier_for(purpose: str) -> str:
+    return MODEL_ROUTES.get(purpose, "strong")
+
+
+# 模型客户端延迟构建：首次访问 LLM_BASE / LLM_WITH_TOOLS / LLM_TOOLS_DISABLED / LLM_NO_TOOLS 或预热阶段才创建，
+# 避免 import agent.config 时就导入 langchain_deepseek 并初始化 HTTP 客户端
+_LLM_NAMES = ("LLM_BASE", "LLM_WITH_TOOLS", "LLM_TOOLS_DISABLED", "LLM_NO_TOOLS")
+_llms = None
+_llms_lock = threading.Lock()
+
+
+# 备用端点/模型：主端点重试仍失败时切换（未配置则不启用）
+FALLBACK_BASE_URL = os.getenv("AGENT_LLM_FALLBACK_BASE_URL")
+FALLBACK_MODEL = os.getenv("AGENT_LLM_FALLBACK_MODEL")
+FALLBACK_API_KEY = os.getenv("AGENT_LLM_FALLBACK_API_KEY") or API_KEY
+
+
+def _build_llms() -> dict:
+    from langchain_deepseek import ChatDeepSeek
+
+    def build(base_url: str, api_key: str, params: dict):
+        return ChatDeepSeek(
+            api_base=base_url,
+            api_key=api_key,
+            # 流式输出时在最后一个分片中返回 usage
+            stream_usage=True,
+            # 重试由 agent.utils.llm 统一负责（带抖动退避与备用端点），客户端自身不再重试
+            max_retries=0,
+            **params,
+        )
 
-# 带工具和不带工具的模型实例
-LLM_WITH_TOOLS = LLM_BASE.bind_tools(TOOLS)
-LLM_NO_TOOLS = LLM_BASE
+    tiers = {name: build(http.LLM_BASE_URL, API_KEY, params) for name, params in MODEL_TIERS.items()}
+    # 基础模型
+    llm_base = tiers["strong"]
+    llm_with_tools = llm_base.bind_tools(TOOLS)
+    # 兜底阶段仍携带同样的工具定义（工具 schema 属于提示前缀，去掉会使服务端前缀缓存整体失效），只禁止调用
+    llm_tools_disabled = llm_base.bind_tools(TOOLS, tool_choice="none")
+    # 主模型实例 id -> 备用实例（绑定方式相同）
+    fallbacks = {}
+    if FALLBACK_BASE_URL or FALLBACK_MODEL:
+        for name, params in MODEL_TIERS.items():
+            fallbacks[id(tiers[name])] = build(FALLBACK_BASE_URL or http.LLM_BASE_URL, FALLBACK_API_KEY,
+                                               {**params, "model": FALLBACK_MODEL or params["model"]})
+        fallbacks[id(llm_with_tools)] = fallbacks[id(llm_base)].bind_tools(TOOLS)
+        fallbacks[id(llm_tools_disabled)] = fallbacks[id(llm_base)].bind_tools(TOOLS, tool_choice="none")
+    # 带工具和不带工具的模型实例
+    return {
+        "LLM_BASE": llm_base,
+        "LLM_WITH_TOOLS": llm_with_tools,
+        "LLM_TOOLS_DISABLED": llm_tools_disabled,
+        "LLM_NO_TOOLS": llm_base,
+        "tiers": tiers,
+        "fallbacks": fallbacks,
+    }
+
+
+def get_llms() -> dict:
+    global _llms
+    if _llms is None:
+        with _llms_lock:
+            if _llms is None:
+                _llms = _build_llms()
+    return _llms
+
+
+def get_llm(purpose: str):
+    """
+    按用途返回（不绑定工具的）模型实例，见 MODEL_ROUTES。
+    """
+    return get_llms()["tiers"][tier_for(purpose)]
+
+
+def get_fallback(model):
+    """
+    返回 model 对应的备用端点实例；未配置备用端点时返回 None。
+    """
+    return get_llms()["fallbacks"].get(id(model))
+
+
+def __getattr__(name: str):
+    if name in _LLM_NAMES:
+        return get_llms()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # --- 系统提示 ---
 SYS_MSG_WITH_TOOLS = SystemMessage(content=
@@ -92,6 +204,7 @@ SYS_MSG_WITH_TOOLS = SystemMessage(content=
 """
 )
 
+# 兜底阶段追加在消息末尾（而不是替换开头的 SYS_MSG_WITH_TOOLS），保持提示前缀在各轮、各会话间逐字节一致
 SYS_MSG_NO_TOOLS = SystemMessage(content=
 """
 你现在处于兜底阶段，禁止调用任何工具（包括 today_date、google_search、url_summary）。
@@ -105,8 +218,39 @@ SYS_MSG_NO_TOOLS = SystemMessage(content=
 )
 
 # --- Graph 配置 ---
-MEMORY = MemorySaver()
-GRAPH_CONFIG = {
-    "recursion_limit": 100,
-    "configurable": {"thread_id": "1"}
-}
\ No newline at end of file
+# checkpointer：
+# - memory（默认）：有界内存 checkpointer，限制总字节数/会话数，闲置会话超时淘汰，每个会话只保留最近若干 checkpoint
+# - sqlite：本机 SQLite 文件（WAL），多个 uvicorn worker 共享会话，可多进程部署
+CHECKPOINTER = os.getenv("AGENT_CHECKPOINTER", "memory").lower()
+CHECKPOINT_KEEP_LAST = int(os.getenv("AGENT_MEMORY_KEEP_LAST", "10"))
+SQLITE_CHECKPOINT_PATH = os.getenv("AGENT_SQLITE_PATH", str(PROJECT_ROOT / ".state" / "checkpoints.sqlite"))
+
+
+def create_checkpointer():
+    if CHECKPOINTER == "sqlite":
+        return SqliteCheckpointSaver(SQLITE_CHECKPOINT_PATH, keep_last=CHECKPOINT_KEEP_LAST)
+    return BoundedMemorySaver(
+        max_bytes=int(os.getenv("AGENT_MEMORY_MAX_MB", "256")) * 1024 * 1024,
+        max_sessions=int(os.getenv("AGENT_MEMORY_MAX_SESSIONS", "1000")),
+        ttl_seconds=float(os.getenv("AGENT_MEMORY_TTL_SECONDS", str(6 * 3600))),
+        keep_last=CHECKPOINT_KEEP_LAST,
+        # 有轮次正在执行或排队的会话不淘汰
+        in_use=SESSION_LOCKS.is_busy,
+    )
+
+
+MEMORY = create_checkpointer()
+RECURSION_LIMIT = 100
+
+
+def make_graph_config(session_id: str | None = None) -> dict:
+    """
+    为单次请求构建 graph 配置；每个会话使用独立的 thread_id，互不共享消息与 planning 状态。
+    session_id 为空时分配一个新会话（不会落到任何共享的默认会话上）。
+    """
+    return {
+        "recursion_limit": RECURSION_LIMIT,
+        "configurable": {"thread_id": session_id or new_session_id()},
+        # 工具耗时/异常指标
+        "callbacks": [METRICS_CALLBACK],
+    }
\ No newline at end of file
@@ -4,6 +4,14 @@ import uuid
 from typing import Any, Dict, List
 from langchain_core.messages import AIMessage
 from agent.tools.date.date_tool import date_diff_days, date_diff_hint
+from agent.utils.cancel import raise_if_cancelled
+from agent.utils import deadline
+from agent.utils.llm import ainvoke_llm, invoke_llm
+from agent.utils.metrics import PLANNING_EXHAUSTED, PLANNING_RETRIES
+from agent.utils.singleflight import SingleFlight
+
+# 不同会话对同一摘要的相同判定（同一问题、同一网页、同一天）只调用一次 LLM
+JUDGE_FLIGHT = SingleFlight("planning.judge")
 
 # ----------------------------------------------------------------------
 # planning 节点简介
@@ -53,8 +61,10 @@ def reset_planning(pl: Dict[str, Any]) -> Dict[str, Any]:
 # planning 节点类
 # --------------------------
 class PlanningNode:
-    def __init__(self, llm_instance, date_tool):
+    def __init__(self, llm_instance, date_tool, select_llm=None):
+        # llm_instance 用于判定，select_llm 用于重选链接（缺省同 llm_instance）；二者通常为不绑定工具的 fast 档模型
         self.llm = llm_instance
+        self.select_llm = select_llm or llm_instance
         self.date_tool = date_tool
 
     # ---- 内部辅助：消息/判断 ----
@@ -161,7 +171,8 @@ class PlanningNode:
         return []
 
     # ---- 内部辅助：评估/选择 ----
-    def _llm_judge_content(self, user_question: str, summary_dict: dict, date: str) -> (bool, str):
+    @staticmethod
+    def _build_judge_prompt(user_question: str, summary_dict: dict, date: str) -> str:
         summary = summary_dict.get("summary", "")
         summary_date_str = summary_dict.get("date", "")
         if summary_date_str and date:
@@ -175,7 +186,7 @@ class PlanningNode:
             )
         else:
             date_info = f"网页摘要日期：{summary_date_str}\n当前日期：{date}\n"
-        prompt = (
+        return (
             f"用户问题：{user_question}\n"
             f"网页摘要内容：{summary}\n"
             f"{date_info}"
@@ -184,9 +195,9 @@ class PlanningNode:
             "只需回答“是”或“否”，并在“否”后补充原因（20字左右）。\n"
             "例如：“否、你的原因” 或 “是、你的原因”。\n"
         )
-        if self.llm is None:
-            raise ValueError("没有可用的llm实例")
-        llm_response = self.llm.invoke(prompt)
+
+    @staticmethod
+    def _parse_judge_response(llm_response) -> (bool, str):
         llm_response_text = getattr(llm_response, "content", str(llm_response)).strip()
         print(f"LLM judge_content response: {llm_response_text}\n")
         if llm_response_text.startswith("是"):
@@ -196,14 +207,39 @@ class PlanningNode:
             return False, reason or "LLM判定该摘要内容无法回答用户问题"
         return False, f"LLM返回无法解析：{llm_response_text}"
 
-    def _judge_content(self, user_question: str, summary_dict: dict, date: str) -> (bool, str):
-        result, llm_reason = self._llm_judge_content(user_question, summary_dict, date)
+    def _llm_judge_content(self, user_question: str, summary_dict: dict, date: str) -> (bool, str):
+        if self.llm is None:
+            raise ValueError("没有可用的llm实例")
+        prompt = self._build_judge_prompt(user_question, summary_dict, date)
+        llm_response = JUDGE_FLIGHT.do((id(self.llm), prompt),
+                                       lambda: invoke_llm("planning.judge", prompt, model=self.llm))
+        return self._parse_judge_response(llm_response)
+
+    async def _allm_judge_content(self, user_question: str, summary_dict: dict, date: str) -> (bool, str):
+        if self.llm is None:
+            raise ValueError("没有可用的llm实例")
+        prompt = self._build_judge_prompt(user_question, summary_dict, date)
+        llm_response = await JUDGE_FLIGHT.ado((id(self.llm), prompt),
+                                              lambda: ainvoke_llm("planning.judge", prompt, model=self.llm))
+        return self._parse_judge_response(llm_response)
+
+    @staticmethod
+    def _judge_reason(result: bool, llm_reason: str) -> str:
         reason = llm_reason.strip() if llm_reason and llm_reason.strip() else ("内容可以回答用户问题" if result else "LLM判定该网页摘要内容无法回答用户问题")
         print(f"judge_content: LLM判断结果为 {result}, 原因: {reason}")
-        return result, reason
+        return reason
 
-    def _llm_select_next_url(self, user_question, search_results, tried_urls, date) -> int:
-        prompt = (
+    def _judge_content(self, user_question: str, summary_dict: dict, date: str) -> (bool, str):
+        result, llm_reason = self._llm_judge_content(user_question, summary_dict, date)
+        return result, self._judge_reason(result, llm_reason)
+
+    async def _ajudge_content(self, user_question: str, summary_dict: dict, date: str) -> (bool, str):
+        result, llm_reason = await self._allm_judge_content(user_question, summary_dict, date)
+        return result, self._judge_reason(result, llm_reason)
+
+    @staticmethod
+    def _build_select_prompt(user_question, search_results, tried_urls, date) -> str:
+        return (
             "1. 已尝试过的链接不选，选择最可能回答用户问题的编号（index），只回复数字编号。\n"
             "2. 如果是实时类问题（新闻、天气、股票），那么snippet中的应该和当前日期相近。\n"
             "3. snippet、title、score都是你的评价指标，尽量选择和问题相关的链接。如果所有都不合适请回复-1。\n"
@@ -213,9 +249,9 @@ class PlanningNode:
             f"以下是已经尝试过的链接：{tried_urls}\n"
             f"以下是搜索到的网页链接列表：{search_results}\n"
         )
-        if self.llm is None:
-            raise ValueError("必须传入 llm_instance")
-        llm_response = self.llm.invoke(prompt)
+
+    @staticmethod
+    def _parse_select_response(llm_response, search_results, tried_urls) -> int:
         llm_response_text = getattr(llm_response, "content", str(llm_response)).strip()
         print(f"LLM select_next_url response: {llm_response_text}\n")
         match = re.search(r"-?\d+", llm_response_text)
@@ -238,6 +274,22 @@ class PlanningNode:
             choose_index = untried[0][0]
         return choose_index
 
+    def _llm_select_next_url(self, user_question, search_results, tried_urls, date) -> int:
+        if self.select_llm is None:
+            raise ValueError("必须传入 llm_instance")
+        llm_response = invoke_llm("planning.select",
+                                  self._build_select_prompt(user_question, search_results, tried_urls, date),
+                                  model=self.select_llm)
+        return self._parse_select_response(llm_response, search_results, tried_urls)
+
+    async def _allm_select_next_url(self, user_question, search_results, tried_urls, date) -> int:
+        if self.select_llm is None:
+            raise ValueError("必须传入 llm_instance")
+        llm_response = await ainvoke_llm("planning.select",
+                                         self._build_select_prompt(user_question, search_results, tried_urls, date),
+                                         model=self.select_llm)
+        return self._parse_select_response(llm_response, search_results, tried_urls)
+
     # ---- 内部辅助：消息编辑
     @staticmethod
     def _remove_url_summary_by_id(messages: List[Any], target_id: str) -> List[Any]:
@@ -250,105 +302,173 @@ class PlanningNode:
                 item["selectable"] = False
         return search_results
 
-    # ---- 节点可调用入口 ----
-    def __call__(self, state: Dict[str, Any]):
+    # ---- 内部辅助：决策流程（同步/异步入口共用，LLM 调用由入口负责）----
+    def _prepare_round(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        读取本轮判定所需的上下文；无需判定时直接在 ctx["done"] 中给出节点返回值。
+        """
+        # 运行已被取消（客户端断开）时不再发起判定/选择调用
+        raise_if_cancelled()
         messages = state["messages"]
         pl = ensure_planning_state(state)
 
         # 若已耗尽，直接进入 chatbot（兜底，防止循环）
         if pl.get("exhausted"):
-            return {"next": "chatbot", "planning": pl}
-
-        if self._should_judge(messages):
-            user_question = self._get_user_question(messages)
-            url_summary_results, url, tool_call_id = self._get_url_summary(messages)
-            print("url=", url)
-            print("tool_call_id=", tool_call_id)
-
-            search_results = self._get_search_results(messages, "google_search")
-            today_str = self.date_tool.invoke({})
-
-            for item in search_results:
-                item["selectable"] = True
-
-            summary_date = None
-            for item in search_results:
-                if item.get("link") == url:
-                    summary_date = item.get("date", None)
-                    break
-            url_summary_dict = {"summary": url_summary_results, "date": summary_date}
-
-            is_satisfied, reason = self._judge_content(user_question, url_summary_dict, today_str)
-            print(f"[planning] judge_content结果: is_satisfied={is_satisfied}, reason={reason}")
-            if is_satisfied:
-                next_node = "chatbot"
-                pl = reset_planning(pl)
-            else:
-                # 记录无效的 url_summary 调用，供 chatbot 过滤
-                if tool_call_id and tool_call_id not in pl["invalid_tool_call_ids"]:
-                    pl["invalid_tool_call_ids"].append(tool_call_id)
-                    print(f"[planning] 标记无效 tool_call_id={tool_call_id}")
-
-                if url:
-                    if url not in pl["tried_urls"]:
-                        pl["tried_urls"].append(url)
-                    search_results = self._mark_unselectable(search_results, url)
-
-                # 兜底1：达到最大重选次数 -> 停止 planning，进入 chatbot（避免无限循环）
-                if pl["tried_count"] >= pl["max_retry"]:
-                    print(f"[planning] 已达到最大重选次数({pl['max_retry']})，停止重选，进入chatbot（无工具）")
-                    pl["exhausted"] = True
-                    pl["enable"] = False
-                    next_node = "chatbot"
-                    return {"next": next_node, "planning": pl}
-
-                # 兜底2：无可选搜索结果 -> 停止 planning
-                if not search_results:
-                    print("[planning] 无可用搜索结果，停止重选，进入chatbot（无工具）")
-                    pl["exhausted"] = True
-                    pl["enable"] = False
-                    next_node = "chatbot"
-                    return {"next": next_node, "planning": pl}
-
-                choose_index = self._llm_select_next_url(
-                    user_question=user_question,
-                    search_results=search_results,
-                    tried_urls=pl["tried_urls"],
-                    date=today_str,
-                )
-                if choose_index == -1:
-                    print("[planning] LLM判定没有合适链接，停止重选，进入chatbot（无工具）")
-                    pl["exhausted"] = True
-                    pl["enable"] = False
-                    next_node = "chatbot"
-                    return {"next": next_node, "planning": pl}
-
-                # 正常重选：触发新的 url_summary（仅返回增量消息，避免重复追加）
-                next_url = search_results[choose_index].get("link")
-                print(f"[planning] LLM选择第{choose_index}个google_search结果: {next_url}")
-                new_tool_call_id = f"call_{uuid.uuid4()}"
-                new_msg = AIMessage(
-                    content='',
-                    additional_kwargs={
-                        "tool_calls": [
-                            {
-                                "id": new_tool_call_id,
-                                "function": {
-                                    "name": "url_summary",
-                                    "arguments": json.dumps({"url": next_url}, ensure_ascii=False),
-                                },
-                                "type": "function",
-                                "index": 0,
-                            }
-                        ],
-                        "refusal": None
-                    }
-                )
-                pl["tried_count"] += 1
-                next_node = "tools"
-                return {"next": next_node, "messages": [new_msg], "planning": pl}
-        else:
-            next_node = "chatbot"
+            return {"done": {"next": "chatbot", "planning": pl}}
 
         # 其余路径不返回 messages，避免重复追加
-        return {"next": next_node, "planning": pl}
\ No newline at end of file
+        if not self._should_judge(messages):
+            return {"done": {"next": "chatbot", "planning": pl}}
+
+        # 时间预算将尽：不再判定/重选，留出时间给最终回答
+        if deadline.budget_low():
+            print("[planning] 剩余时间预算不足，停止重选，进入chatbot（无工具）")
+            return {"done": self._exhaust(pl, "deadline")}
+
+        user_question = self._get_user_question(messages)
+        url_summary_results, url, tool_call_id = self._get_url_summary(messages)
+        print("url=", url)
+        print("tool_call_id=", tool_call_id)
+
+        search_results = self._get_search_results(messages, "google_search")
+        today_str = self.date_tool.invoke({})
+
+        for item in search_results:
+            item["selectable"] = True
+
+        summary_date = None
+        for item in search_results:
+            if item.get("link") == url:
+                summary_date = item.get("date", None)
+                break
+        return {
+            "pl": pl,
+            "user_question": user_question,
+            "url": url,
+            "tool_call_id": tool_call_id,
+            "search_results": search_results,
+            "today_str": today_str,
+            "summary": {"summary": url_summary_results, "date": summary_date},
+        }
+
+    @staticmethod
+    def _exhaust(pl: Dict[str, Any], reason: str) -> Dict[str, Any]:
+        PLANNING_EXHAUSTED.inc(reason=reason)
+        pl["exhausted"] = True
+        pl["enable"] = False
+        return {"next": "chatbot", "planning": pl}
+
+    def _after_judge(self, ctx: Dict[str, Any], is_satisfied: bool, reason: str) -> Dict[str, Any]:
+        """
+        根据判定结果更新规划状态；需要重选链接时返回的 ctx 不含 "done"。
+        """
+        pl = ctx["pl"]
+        print(f"[planning] judge_content结果: is_satisfied={is_satisfied}, reason={reason}")
+        if is_satisfied:
+            return {"done": {"next": "chatbot", "planning": reset_planning(pl)}}
+
+        # 记录无效的 url_summary 调用，供 chatbot 过滤
+        tool_call_id = ctx["tool_call_id"]
+        if tool_call_id and tool_call_id not in pl["invalid_tool_call_ids"]:
+            pl["invalid_tool_call_ids"].append(tool_call_id)
+            print(f"[planning] 标记无效 tool_call_id={tool_call_id}")
+
+        url = ctx["url"]
+        if url:
+            if url not in pl["tried_urls"]:
+                pl["tried_urls"].append(url)
+            ctx["search_results"] = self._mark_unselectable(ctx["search_results"], url)
+
+        # 判定耗时后预算已不足以再摘要一个网页
+        if deadline.budget_low():
+            print("[planning] 剩余时间预算不足，停止重选，进入chatbot（无工具）")
+            return {"done": self._exhaust(pl, "deadline")}
+
+        # 兜底1：达到最大重选次数 -> 停止 planning，进入 chatbot（避免无限循环）
+        if pl["tried_count"] >= pl["max_retry"]:
+            print(f"[planning] 已达到最大重选次数({pl['max_retry']})，停止重选，进入chatbot（无工具）")
+            return {"done": self._exhaust(pl, "max_retry")}
+
+        # 兜底2：无可选搜索结果 -> 停止 planning
+        if not ctx["search_results"]:
+            print("[planning] 无可用搜索结果，停止重选，进入chatbot（无工具）")
+            return {"done": self._exhaust(pl, "no_results")}
+        return ctx
+
+    def _after_select(self, ctx: Dict[str, Any], choose_index: int) -> Dict[str, Any]:
+        pl = ctx["pl"]
+        if choose_index == -1:
+            print("[planning] LLM判定没有合适链接，停止重选，进入chatbot（无工具）")
+            return self._exhaust(pl, "no_candidate")
+
+        # 正常重选：触发新的 url_summary（仅返回增量消息，避免重复追加）
+        next_url = ctx["search_results"][choose_index].get("link")
+        print(f"[planning] LLM选择第{choose_index}个google_search结果: {next_url}")
+        new_tool_call_id = f"call_{uuid.uuid4()}"
+        new_msg = AIMessage(
+            content='',
+            additional_kwargs={
+                "tool_calls": [
+                    {
+                        "id": new_tool_call_id,
+                        "function": {
+                            "name": "url_summary",
+                            "arguments": json.dumps({"url": next_url}, ensure_ascii=False),
+                        },
+                        "type": "function",
+                        "index": 0,
+                    }
+                ],
+                "refusal": None
+            }
+        )
+        pl["tried_count"] += 1
+        PLANNING_RETRIES.inc()
+        return {"next": "tools", "messages": [new_msg], "planning": pl}
+
+    # ---- 节点可调用入口 ----
+    def __call__(self, state: Dict[str, Any]):
+        ctx = self._prepare_round(state)
+        if "done" in ctx:
+            return ctx["done"]
+
+        is_satisfied, reason = self._judge_content(ctx["user_question"], ctx["summary"], ctx["today_str"])
+        ctx = self._after_judge(ctx, is_satisfied, reason)
+        if "done" in ctx:
+            return ctx["done"]
+
+        choose_index = self._llm_select_next_url(
+            user_question=ctx["user_question"],
+            search_results=ctx["search_results"],
+            tried_urls=ctx["pl"]["tried_urls"],
+            date=ctx["today_str"],
+        )
+        return self._after_select(ctx, choose_index)
+
+    async def acall(self, state: Dict[str, Any]):
+        """
+        异步入口：与 __call__ 流程一致，LLM 判定与选择走 ainvoke，不占用线程池。
+        """
+        ctx = self._prepare_round(state)
+        if "done" in ctx:
+            return ctx["done"]
+
+        # 判定/选择调用最多用到预算中为最终回答预留的部分之前，超时则转入兜底
+        try:
+            is_satisfied, reason = await deadline.wait_for(
+                self._ajudge_content(ctx["user_question"], ctx["summary"], ctx["today_str"]),
+                reserve=deadline.ANSWER_RESERVE_SECONDS)
+            ctx = self._after_judge(ctx, is_satisfied, reason)
+            if "done" in ctx:
+                return ctx["done"]
+
+            choose_index = await deadline.wait_for(self._allm_select_next_url(
+                user_question=ctx["user_question"],
+                search_results=ctx["search_results"],
+                tried_urls=ctx["pl"]["tried_urls"],
+                date=ctx["today_str"],
+            ), reserve=deadline.ANSWER_RESERVE_SECONDS)
+        except deadline.DeadlineExceeded:
+            print("[planning] 判定/选择超出时间预算，停止重选，进入chatbot（无工具）")
+            return self._exhaust(ctx["pl"], "deadline")
+        return self._after_select(ctx, choose_index)
@@ -1,9 +1,13 @@
 import requests
-from bs4 import BeautifulSoup
 import re
 from langchain.tools import Tool
 from langchain_core.tools import tool
 from pydantic import Field, BaseModel
+from agent.utils.cancel import RunCancelled, current_token, raise_if_cancelled, record_aborted_call
+from agent.utils import deadline, http
+from agent.utils.singleflight import SingleFlight, mark_partial
+
+FETCH_FLIGHT = SingleFlight("url_summary")
 
 # 定义需要过滤的正则表达式列表（支持行开头和行中匹配）
 REMOVE_PATTERNS = [
@@ -70,16 +74,31 @@ def extract_pub_date(soup, text):
     return ""
 
 def fetch_webpage_text(url):
+    # BeautifulSoup 延迟导入，避免拖慢 agent 启动
+    from bs4 import BeautifulSoup
     headers = {
         "User-Agent": "Mozilla/5.0 (compatible; SimpleBot/1.0)"
     }
-    proxies = {
-        "http": "http://127.0.0.1:7897",
-        "https": "http://127.0.0.1:7897",
-    }
-    resp = requests.get(url, headers=headers, timeout=15, proxies=proxies)
-    resp.encoding = resp.apparent_encoding
-    soup = BeautifulSoup(resp.text, "html.parser")
+    raise_if_cancelled()
+    # 分块读取响应体：客户端断开（运行被取消）时可以在下载途中放弃
+    # 超时收缩到本轮剩余时间预算内；下载途中预算用尽则只解析已收到的部分
+    with http.get_session().get(url, headers=headers, timeout=deadline.clamp(15), stream=True) as resp:
+        chunks = []
+        for chunk in resp.iter_content(chunk_size=64 * 1024):
+            token = current_token()
+            if token is not None and token.cancelled:
+                record_aborted_call("url_summary", url)
+                token.raise_if_cancelled()
+            chunks.append(chunk)
+            if deadline.budget_low():
+                # 只下载了部分网页：结果不共享给预算充足的合并等待方
+                mark_partial()
+                break
+    raw = b"".join(chunks)
+    # 与 resp.apparent_encoding 相同：按内容探测编码
+    encoding = requests.compat.chardet.detect(raw)["encoding"] or "utf-8"
+    html = raw.decode(encoding, errors="replace")
+    soup = BeautifulSoup(html, "html.parser")
     for tag in soup(["script", "style", "noscript", "header", "footer", "form", "nav", "aside"]):
         tag.decompose()
     text = soup.get_text(separator="\n")
@@ -106,12 +125,15 @@ def url_summary(url):
     调用本工具获取详细内容，否则你的回答会不完整。
     """
     try:
-        text, pub_date = fetch_webpage_text(url)
+        # 其他会话正在抓取同一网页时等待并共享其结果
+        text, pub_date = FETCH_FLIGHT.do(url, lambda: fetch_webpage_text(url))
         summary = simple_summary(text)
         cleaned = clean_text(summary)
         if pub_date:
             return f"发布时间: {pub_date}\n{cleaned}"
         else:
             return cleaned[:800]
+    except RunCancelled:
+        raise
     except Exception as e:
         return f"无法获取摘要：{str(e)}"
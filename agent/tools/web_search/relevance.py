@@ -1,7 +1,16 @@
-import jieba
 import re
 
+def _jieba():
+    # jieba 导入与词典加载较慢，推迟到首次分词或预热阶段
+    import jieba
+    return jieba
+
+def warmup():
+    _jieba().initialize()
+
 def calculate_relevance_score(item, query):
+    jieba = _jieba()
+
     # 中文分词
     def segment(text):
         return set(jieba.lcut(re.sub(r'[^\w\s]', '', text.lower())))
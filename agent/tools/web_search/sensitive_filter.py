@@ -1,4 +1,5 @@
 import os
+import threading
 from collections import deque
 
 class Node:
@@ -73,8 +74,17 @@ def _load_sensitive_words():
                     words.add(word)
     return list(words)
 
-# 初始化自动机，只在模块初始化时构建一次
-_sensitive_automaton = AhoCorasickAutomaton(_load_sensitive_words())
+# 自动机延迟构建：首次过滤或预热阶段构建一次（词库较大，避免拖慢 import）
+_sensitive_automaton = None
+_automaton_lock = threading.Lock()
+
+def _get_sensitive_automaton():
+    global _sensitive_automaton
+    if _sensitive_automaton is None:
+        with _automaton_lock:
+            if _sensitive_automaton is None:
+                _sensitive_automaton = AhoCorasickAutomaton(_load_sensitive_words())
+    return _sensitive_automaton
 
 def filter_sensitive_results(results):
     """
@@ -82,13 +92,14 @@ def filter_sensitive_results(results):
     :param results: [{'title': ..., 'snippet': ..., ...}, ...]
     :return: 过滤后的列表
     """
+    automaton = _get_sensitive_automaton()
     filtered = []
     for item in results:
         title = item.get("title", "")
         snippet = item.get("snippet", "")
-        if _sensitive_automaton.search(title):
+        if automaton.search(title):
             continue
-        if _sensitive_automaton.search(snippet):
+        if automaton.search(snippet):
             continue
         filtered.append(item)
     return filtered
@@ -114,7 +125,16 @@ def _load_blocked_rules():
                 rules.add(line)
     return rules
 
-_blocked_rules = _load_blocked_rules()
+_blocked_rules = None
+_rules_lock = threading.Lock()
+
+def _get_blocked_rules():
+    global _blocked_rules
+    if _blocked_rules is None:
+        with _rules_lock:
+            if _blocked_rules is None:
+                _blocked_rules = _load_blocked_rules()
+    return _blocked_rules
 
 def _get_domain(url: str) -> str:
     """
@@ -138,12 +158,20 @@ def filter_blocked_domains(results):
     :param results: [{'url': ..., ...}, ...]
     :return: 过滤后的列表
     """
+    blocked_rules = _get_blocked_rules()
     filtered = []
     for item in results:
         url = item.get("link", "")
         domain = _get_domain(url)
-        if domain and domain in _blocked_rules:
+        if domain and domain in blocked_rules:
             continue
         filtered.append(item)
 
     return filtered
+
+def warmup():
+    """
+    预热阶段调用：提前构建敏感词自动机并解析 gfwlist。
+    """
+    _get_sensitive_automaton()
+    _get_blocked_rules()
@@ -1,15 +1,19 @@
 import re
 import os
-import requests
 from urllib.parse import urlparse
 from langchain.tools import Tool
 from langchain_core.tools import tool
 from pydantic import BaseModel, Field
+from agent.utils.cancel import current_token, record_aborted_call
+from agent.utils import deadline, http
+from agent.utils.singleflight import SingleFlight, mark_partial
 from ..web_search.authority import calculate_authority_score
 from ..web_search.freshness import calculate_freshness_score, extract_date_from_snippet
 from ..web_search.relevance import calculate_relevance_score
 from ..web_search.sensitive_filter import filter_sensitive_results, filter_blocked_domains
 
+SEARCH_FLIGHT = SingleFlight("google_search")
+
 class GetSearchSchema(BaseModel):
     query: str = Field(description="使用谷歌搜索获取最新信息。输入应为需要搜索的中文问题。")
 
@@ -19,14 +23,15 @@ def google_search(query: str, max_results: int = 10) -> list:
     使用谷歌搜索获取最新信息。输入应为需要搜索的中文问题。输入的问题应该简洁明了，避免使用复杂的语句。
     注意每个项目返回的发布日期是否为用户所需的日期，特别是当用户询问“今天”、“明天”或“后天”等时，确保返回的日期与用户期望一致。
     """
+    # 其他会话正在执行相同查询时等待并共享其结果，不重复消耗搜索配额
+    return SEARCH_FLIGHT.do((query, max_results), lambda: _google_search(query, max_results))
+
+
+def _google_search(query: str, max_results: int) -> list:
     print(f"google_search called with query: {query}, max_results: {max_results}")
-    url = "https://www.googleapis.com/customsearch/v1"
+    url = http.SEARCH_URL
     api_key = os.getenv("GOOGLE_API_KEY")
     cx = os.getenv("SEARCH_ENGINE_ID")
-    proxies = {
-        "http": "http://127.0.0.1:7897",
-        "https": "http://127.0.0.1:7897",
-    }
 
     refs = []
     num_per_page = 10
@@ -42,11 +47,25 @@ def google_search(query: str, max_results: int = 10) -> list:
             "safe": "active"
         }
 
-        response = requests.get(
+        # 运行已取消（客户端断开）时不再请求下一页
+        token = current_token()
+        if token is not None and token.cancelled:
+            record_aborted_call("google_search", query)
+            token.raise_if_cancelled()
+        # 超时收缩到本轮剩余时间预算内；预算已尽时不再翻页，返回已取得的结果
+        try:
+            timeout = deadline.clamp(15)
+        except deadline.DeadlineExceeded:
+            if refs:
+                # 只取到了部分页：结果不共享给预算充足的合并等待方
+                mark_partial()
+                break
+            raise
+        # 共用连接池（代理由 AGENT_HTTP_PROXY 配置），预热阶段已建立到搜索端点的连接
+        response = http.get_session().get(
             url=url,
             params=params,
-            proxies=proxies,
-            timeout=15
+            timeout=timeout
         )
         data = response.json()
         items = data.get("items", [])
@@ -0,0 +1,183 @@
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from agent.tools.web_search.web_search_tool import detect_search_type
+from agent.utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# --------------------------
+# 答案缓存
+# - 放在图之前：会话的第一轮问题若与近期问过的问题相同（归一化文本一致）或足够相似（嵌入余弦相似度），
+#   直接返回缓存的回答，不再执行搜索/摘要/LLM 调用
+# - TTL 按 detect_search_type 分类：天气、新闻很快过期，学术、问答保留更久；
+#   问题含“今天/最新”等时间词时，最迟在当天结束时过期
+# - 嵌入模型可选（知识库的嵌入模型，预热阶段加载）；不可用时只按归一化文本命中
+# - 进程内、按 LRU 淘汰
+# --------------------------
+ENABLED = os.getenv("AGENT_ANSWER_CACHE", "1") != "0"
+MAX_ENTRIES = int(os.getenv("AGENT_ANSWER_CACHE_MAX_ENTRIES", "2000"))
+SIMILARITY_THRESHOLD = float(os.getenv("AGENT_ANSWER_CACHE_SIMILARITY", "0.95"))
+USE_EMBEDDINGS = os.getenv("AGENT_ANSWER_CACHE_EMBEDDINGS", "1") != "0"
+
+# 各搜索类别的缓存时长（秒），可用 AGENT_ANSWER_CACHE_TTLS="weather=600,qa=3600" 覆盖
+CATEGORY_TTLS = {
+    "weather": 30 * 60,
+    "news": 60 * 60,
+    "product": 6 * 3600,
+    "default": 6 * 3600,
+    "qa": 24 * 3600,
+    "academic": 7 * 24 * 3600,
+}
+for _part in os.getenv("AGENT_ANSWER_CACHE_TTLS", "").split(","):
+    _name, _, _seconds = _part.partition("=")
+    if _name.strip() in CATEGORY_TTLS and _seconds.strip():
+        CATEGORY_TTLS[_name.strip()] = float(_seconds)
+
+_TIME_WORDS = re.compile(r"今天|今日|今晚|明天|昨天|现在|当前|目前|最新|最近|实时|本周|这周|今年|本月")
+_NOISE = re.compile(r"[\W_]+", re.UNICODE)
+_NUMBERS = re.compile(r"\d+")
+
+ANSWER_CACHE_LOOKUPS = REGISTRY.counter("agent_answer_cache_total", "Answer cache lookups and stores",
+                                        ["result"])
+
+
+def normalize_question(question: str) -> str:
+    # 全半角统一、小写、去掉空白与标点："北京 今天天气？" == "北京今天天气"
+    return _NOISE.sub("", unicodedata.normalize("NFKC", question or "").lower())
+
+
+def expires_at(question: str, category: str, now: Optional[float] = None) -> float:
+    now = time.time() if now is None else now
+    expiry = now + CATEGORY_TTLS.get(category, CATEGORY_TTLS["default"])
+    if _TIME_WORDS.search(question):
+        midnight = datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        expiry = min(expiry, midnight.timestamp())
+    return expiry
+
+
+class AnswerCache:
+    def __init__(self, max_entries: int, threshold: float, use_embeddings: bool):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.use_embeddings = use_embeddings
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._stats = {"hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0}
+
+    # ---- 嵌入 ----
+    def _embed(self, text: str):
+        if not self.use_embeddings:
+            return None
+        try:
+            from agent.tools.knowledge_base.kb_tool import get_model, DEFAULT_EMB_MODEL
+            return get_model(DEFAULT_EMB_MODEL).encode([text], normalize_embeddings=True)[0]
+        except Exception as e:
+            # 嵌入模型不可用：之后只按归一化文本命中
+            logger.warning(f"[answer_cache] embedding unavailable, falling back to exact match: {e}")
+            self.use_embeddings = False
+            return None
+
+    @staticmethod
+    def _similarity(a, b) -> float:
+        # 向量已归一化，点积即余弦相似度
+        if hasattr(a, "dot"):
+            return float(a.dot(b))
+        return float(sum(x * y for x, y in zip(a, b)))
+
+    # ---- 查询/写入（可能加载/调用嵌入模型，异步调用方应放到线程中执行）----
+    def lookup(self, question: str, mode: str) -> Optional[Dict[str, Any]]:
+        """
+        返回 {"answer", "question", "category", "cached_at", "similarity"}；未命中返回 None。
+        """
+        norm = normalize_question(question)
+        category = detect_search_type(question)
+        now = time.time()
+        with self._lock:
+            self._evict_expired(now)
+            entry = self._entries.get((mode, norm))
+            if entry is not None:
+                self._entries.move_to_end((mode, norm))
+                return self._hit(entry, 1.0, semantic=False)
+            candidates = [e for (m, _), e in self._entries.items()
+                          if m == mode and e["category"] == category and e["vector"] is not None]
+        if candidates:
+            vector = self._embed(norm)
+            if vector is not None:
+                numbers = _NUMBERS.findall(norm)
+                best, score = None, self.threshold
+                for entry in candidates:
+                    # 数字（日期、年份、型号）不同的问题即使语义相近也不复用
+                    if entry["numbers"] != numbers:
+                        continue
+                    similarity = self._similarity(vector, entry["vector"])
+                    if similarity >= score:
+                        best, score = entry, similarity
+                if best is not None:
+                    with self._lock:
+                        return self._hit(best, score, semantic=True)
+        with self._lock:
+            self._stats["misses"] += 1
+        ANSWER_CACHE_LOOKUPS.inc(result="miss")
+        return None
+
+    def _hit(self, entry: Dict[str, Any], similarity: float, semantic: bool) -> Dict[str, Any]:
+        self._stats["hits"] += 1
+        self._stats["semantic_hits"] += int(semantic)
+        ANSWER_CACHE_LOOKUPS.inc(result="semantic_hit" if semantic else "hit")
+        return {"answer": entry["answer"], "question": entry["question"], "category": entry["category"],
+                "cached_at": entry["cached_at"], "similarity": round(similarity, 4)}
+
+    def put(self, question: str, mode: str, answer: str):
+        norm = normalize_question(question)
+        if not norm or not answer:
+            return
+        category = detect_search_type(question)
+        now = time.time()
+        entry = {
+            "question": question,
+            "answer": answer,
+            "category": category,
+            "cached_at": now,
+            "expires_at": expires_at(question, category, now),
+            "numbers": _NUMBERS.findall(norm),
+            "vector": self._embed(norm),
+        }
+        with self._lock:
+            self._entries.pop((mode, norm), None)
+            self._entries[(mode, norm)] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._stats["stores"] += 1
+        ANSWER_CACHE_LOOKUPS.inc(result="store")
+
+    def _evict_expired(self, now: float):
+        expired: List[tuple] = [key for key, entry in self._entries.items() if entry["expires_at"] <= now]
+        for key in expired:
+            del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._evict_expired(time.time())
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "enabled": ENABLED,
+                "entries": len(self._entries),
+                "embeddings": self.use_embeddings,
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+            }
+
+
+ANSWER_CACHE = AnswerCache(MAX_ENTRIES, SIMILARITY_THRESHOLD, USE_EMBEDDINGS)
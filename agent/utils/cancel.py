@@ -0,0 +1,85 @@
+import contextvars
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# --------------------------
+# 运行取消令牌
+# - 每次 agent 运行绑定一个 CancelToken（contextvar），LangChain 在线程池中执行同步工具时会复制上下文，
+#   因此 google_search / url_summary 等同步代码也能读到当前运行的令牌
+# - 客户端断开时由后端调用 token.cancel()，工具在发起/读取 HTTP 请求的间隙检查并提前退出
+# --------------------------
+class RunCancelled(Exception):
+    """当前运行已被取消（客户端断开等）。"""
+
+
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason: Optional[str] = None
+
+    def cancel(self, reason: str = "cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise RunCancelled(self.reason or "cancelled")
+
+
+_current_token: contextvars.ContextVar[Optional[CancelToken]] = contextvars.ContextVar("agent_cancel_token", default=None)
+
+
+def current_token() -> Optional[CancelToken]:
+    return _current_token.get()
+
+
+def raise_if_cancelled():
+    token = _current_token.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+@contextmanager
+def bind_token(token: CancelToken):
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        try:
+            _current_token.reset(reset)
+        except ValueError:
+            # 异步生成器被其他任务关闭时处于不同的 Context，此时无需还原
+            pass
+
+
+# --------------------------
+# 取消统计：被取消的运行数，以及因取消而中止的工具/HTTP 调用数
+# --------------------------
+_stats_lock = threading.Lock()
+_stats = {"cancelled_runs": 0, "aborted_calls": 0}
+
+
+def record_cancelled_run(session_id: str, reason: str, elapsed: float, last_step: Optional[str]):
+    with _stats_lock:
+        _stats["cancelled_runs"] += 1
+    logger.warning(f"[cancel] session={session_id} reason={reason} elapsed={elapsed:.2f}s last_step={last_step}")
+
+
+def record_aborted_call(kind: str, target: str):
+    with _stats_lock:
+        _stats["aborted_calls"] += 1
+    logger.info(f"[cancel] aborted {kind}: {target}")
+
+
+def stats() -> dict:
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,222 @@
+import inspect
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from langgraph.checkpoint.memory import MemorySaver
+
+logger = logging.getLogger(__name__)
+
+# 兼容不带 task_path 参数的旧版本 MemorySaver
+_PUT_WRITES_HAS_TASK_PATH = "task_path" in inspect.signature(MemorySaver.put_writes).parameters
+
+
+def _sizeof(obj: Any) -> int:
+    """
+    估算 checkpointer 中一条存储项的字节数（序列化后的 bytes 为主，其余按近似值计）。
+    """
+    if obj is None:
+        return 0
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return len(obj)
+    if isinstance(obj, str):
+        return len(obj.encode("utf-8", errors="ignore"))
+    if isinstance(obj, (tuple, list)):
+        return sum(_sizeof(o) for o in obj)
+    if isinstance(obj, dict):
+        return sum(_sizeof(k) + _sizeof(v) for k, v in obj.items())
+    return 64
+
+
+# --------------------------
+# 有界内存 checkpointer
+# - 每个 thread（会话）只保留最近 keep_last 个 checkpoint，清理对应的 writes 与不再被引用的 blobs
+# - 按会话做 LRU 记账：超过 max_sessions / max_bytes 时淘汰最久未使用的会话
+# - 会话闲置超过 ttl_seconds 后淘汰
+# - 记账是增量的：put / put_writes 只计算本次新增条目的大小，checkpoint 引用的 channel 版本在 put 时直接记录
+#   （blob 按引用计数清理），热路径上不反序列化历史 checkpoint
+# - in_use(thread_id) 为真的会话（有轮次正在执行或排队）不会被淘汰
+# - stats() 返回当前占用，供监控告警
+# --------------------------
+class BoundedMemorySaver(MemorySaver):
+    def __init__(self, *, max_bytes: int = 256 * 1024 * 1024, max_sessions: int = 1000,
+                 ttl_seconds: float = 6 * 3600, keep_last: int = 10,
+                 in_use: Optional[Callable[[str], bool]] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.max_bytes = max_bytes
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.keep_last = max(1, keep_last)
+        self.in_use = in_use or (lambda thread_id: False)
+        self._lock = threading.RLock()
+        # thread_id -> 最近一次访问时间（OrderedDict 末尾为最近使用）
+        self._last_used: "OrderedDict[str, float]" = OrderedDict()
+        self._thread_bytes: Dict[str, int] = {}
+        self._total_bytes = 0
+        # thread_id -> {存储项 key -> 字节数}：("checkpoint", ns, id) / ("writes", ns, id) / ("blob", ns, channel, version)
+        self._sizes: Dict[str, Dict[Tuple, int]] = {}
+        # thread_id -> {(ns, checkpoint_id) -> 该 checkpoint 引用的 (channel, version)}
+        self._versions: Dict[str, Dict[Tuple, Tuple]] = {}
+        # thread_id -> {(ns, channel, version) -> 引用该 blob 的已保留 checkpoint 数}
+        self._blob_refs: Dict[str, Dict[Tuple, int]] = {}
+        self._evictions = {"lru": 0, "ttl": 0, "bytes": 0}
+        self._trimmed_checkpoints = 0
+
+    # ---- 访问记录与记账 ----
+    def _touch(self, thread_id: str):
+        self._last_used[thread_id] = time.monotonic()
+        self._last_used.move_to_end(thread_id)
+
+    def _account(self, thread_id: str, key: Tuple, size: Optional[int]):
+        # 设置（size 为 None 时删除）一个存储项的字节数，同步更新会话与总量
+        sizes = self._sizes.setdefault(thread_id, {})
+        old = sizes.pop(key, 0)
+        if size is not None:
+            sizes[key] = size
+        delta = (size or 0) - old
+        self._thread_bytes[thread_id] = self._thread_bytes.get(thread_id, 0) + delta
+        self._total_bytes += delta
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._total_bytes
+
+    # ---- 单会话裁剪：只保留最近 keep_last 个 checkpoint ----
+    def _release_versions(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str):
+        # checkpoint 被裁剪：其引用的 blob 引用计数减一，归零的 blob 删除
+        refs = self._blob_refs.get(thread_id, {})
+        blobs = getattr(self, "blobs", None)
+        for channel, version in self._versions.get(thread_id, {}).pop((checkpoint_ns, checkpoint_id), ()):
+            key = (checkpoint_ns, channel, version)
+            count = refs.get(key, 0) - 1
+            if count > 0:
+                refs[key] = count
+                continue
+            refs.pop(key, None)
+            if blobs is not None:
+                blobs.pop((thread_id, checkpoint_ns, channel, version), None)
+            self._account(thread_id, ("blob", checkpoint_ns, channel, version), None)
+
+    def _trim(self, thread_id: str, checkpoint_ns: str):
+        saved = self.storage.get(thread_id, {}).get(checkpoint_ns)
+        if not saved or len(saved) <= self.keep_last:
+            return
+        # checkpoint id 为 uuid6，字典序即时间序；每次 put 只会多出一个，排序的是 keep_last + 1 个 id
+        stale = sorted(saved.keys())[:-self.keep_last]
+        for cid in stale:
+            saved.pop(cid, None)
+            self.writes.pop((thread_id, checkpoint_ns, cid), None)
+            self._account(thread_id, ("checkpoint", checkpoint_ns, cid), None)
+            self._account(thread_id, ("writes", checkpoint_ns, cid), None)
+            self._release_versions(thread_id, checkpoint_ns, cid)
+        self._trimmed_checkpoints += len(stale)
+
+    # ---- 跨会话淘汰 ----
+    def _drop_thread(self, thread_id: str):
+        self.storage.pop(thread_id, None)
+        blobs = getattr(self, "blobs", None)
+        for key in self._sizes.pop(thread_id, {}):
+            if key[0] == "writes":
+                self.writes.pop((thread_id, key[1], key[2]), None)
+            elif key[0] == "blob" and blobs is not None:
+                blobs.pop((thread_id, *key[1:]), None)
+        self._versions.pop(thread_id, None)
+        self._blob_refs.pop(thread_id, None)
+        self._total_bytes -= self._thread_bytes.pop(thread_id, 0)
+        self._last_used.pop(thread_id, None)
+
+    def _evictable(self, thread_id: str, keep: Optional[str]) -> bool:
+        # 正在执行/排队的会话不淘汰，避免进行中的轮次丢失状态
+        return thread_id != keep and not self.in_use(thread_id)
+
+    def _evict(self, keep: Optional[str] = None):
+        now = time.monotonic()
+        # 1) 闲置超时
+        if self.ttl_seconds:
+            for thread_id, ts in list(self._last_used.items()):
+                if now - ts <= self.ttl_seconds:
+                    break
+                if self._evictable(thread_id, keep):
+                    self._drop_thread(thread_id)
+                    self._evictions["ttl"] += 1
+        # 2) 会话数上限 / 3) 字节上限：从最久未使用的会话开始淘汰
+        for reason, over in (
+            ("lru", lambda: self.max_sessions and len(self._last_used) > self.max_sessions),
+            ("bytes", lambda: self.max_bytes and self._total_bytes > self.max_bytes),
+        ):
+            while over():
+                victim = next((t for t in self._last_used if self._evictable(t, keep)), None)
+                if victim is None:
+                    break
+                logger.info(f"[checkpoint] evict session {victim} ({reason})")
+                self._drop_thread(victim)
+                self._evictions[reason] += 1
+
+    # ---- BaseCheckpointSaver 接口 ----
+    def get_tuple(self, config):
+        with self._lock:
+            thread_id = config["configurable"]["thread_id"]
+            if thread_id in self._last_used:
+                self._touch(thread_id)
+            return super().get_tuple(config)
+
+    def list(self, config, **kwargs):
+        with self._lock:
+            return iter(list(super().list(config, **kwargs)))
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with self._lock:
+            result = super().put(config, checkpoint, metadata, new_versions)
+            thread_id = result["configurable"]["thread_id"]
+            checkpoint_ns = result["configurable"].get("checkpoint_ns", "")
+            checkpoint_id = result["configurable"]["checkpoint_id"]
+            self._account(thread_id, ("checkpoint", checkpoint_ns, checkpoint_id),
+                          _sizeof(self.storage[thread_id][checkpoint_ns].get(checkpoint_id)))
+            blobs = getattr(self, "blobs", None)
+            if blobs is not None:
+                for channel, version in new_versions.items():
+                    self._account(thread_id, ("blob", checkpoint_ns, channel, version),
+                                  _sizeof(blobs.get((thread_id, checkpoint_ns, channel, version))))
+                # 直接从传入的 checkpoint 记录引用的版本，裁剪时无需反序列化
+                versions = tuple((checkpoint.get("channel_versions") or {}).items())
+                self._versions.setdefault(thread_id, {})[(checkpoint_ns, checkpoint_id)] = versions
+                refs = self._blob_refs.setdefault(thread_id, {})
+                for channel, version in versions:
+                    refs[(checkpoint_ns, channel, version)] = refs.get((checkpoint_ns, channel, version), 0) + 1
+            self._trim(thread_id, checkpoint_ns)
+            self._touch(thread_id)
+            self._evict(keep=thread_id)
+            return result
+
+    def put_writes(self, config, writes, task_id, task_path: str = ""):
+        with self._lock:
+            if _PUT_WRITES_HAS_TASK_PATH:
+                super().put_writes(config, writes, task_id, task_path)
+            else:
+                super().put_writes(config, writes, task_id)
+            thread_id = config["configurable"]["thread_id"]
+            checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+            checkpoint_id = config["configurable"]["checkpoint_id"]
+            # 只重新计算这一个 checkpoint 的 writes（单步的写入量）
+            self._account(thread_id, ("writes", checkpoint_ns, checkpoint_id),
+                          _sizeof(self.writes.get((thread_id, checkpoint_ns, checkpoint_id))))
+            self._touch(thread_id)
+
+    def delete_thread(self, thread_id: str):
+        with self._lock:
+            self._drop_thread(thread_id)
+
+    # ---- 监控 ----
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._last_used),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "max_sessions": self.max_sessions,
+                "checkpoints": sum(len(ns) for t in self.storage.values() for ns in t.values()),
+                "trimmed_checkpoints": self._trimmed_checkpoints,
+                "evictions": dict(self._evictions),
+            }
@@ -0,0 +1,160 @@
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, SystemMessage, ToolMessage
+
+from agent.utils import tokens
+
+# --------------------------
+# 历史压缩
+# - chatbot 的提示超过 token 预算（AGENT_HISTORY_TOKEN_BUDGET）时分两步压缩，只作用于发给模型的提示，
+#   checkpoint 中的完整历史不变：
+#   1) 较早轮次的工具输出（搜索 JSON、网页摘要、文档片段）替换为简短摘录（确定性，重复压缩结果一致）
+#   2) 仍超预算时，把最早的若干轮折叠进会话摘要：在已有摘要之上增量总结新折叠的轮次，
+#      摘要与已折叠的消息数保存在 state["compaction"] 中，之后的轮次直接复用
+# - 当前轮与最近 AGENT_HISTORY_KEEP_TURNS 轮始终原样保留
+# - 未超预算时不做任何改写，保持提示前缀稳定（前缀缓存）
+# --------------------------
+TOKEN_BUDGET = int(os.getenv("AGENT_HISTORY_TOKEN_BUDGET", "24000"))
+KEEP_TURNS = max(1, int(os.getenv("AGENT_HISTORY_KEEP_TURNS", "2")))
+DIGEST_TOKENS = int(os.getenv("AGENT_HISTORY_DIGEST_TOKENS", "120"))
+SUMMARY_MAX_TOKENS = int(os.getenv("AGENT_HISTORY_SUMMARY_TOKENS", "800"))
+# 折叠到预算的该比例以下，避免下一轮又立刻触发
+TARGET_RATIO = 0.7
+
+
+def is_user_message(msg: Any) -> bool:
+    if isinstance(msg, tuple):
+        return msg[0] == "user"
+    return getattr(msg, "type", None) == "human"
+
+
+def split_turns(messages: List[Any]) -> List[List[Any]]:
+    """
+    按用户消息切分轮次：每轮以一条用户消息开头（第一条用户消息之前的内容归入第一轮）。
+    """
+    turns: List[List[Any]] = []
+    for msg in messages:
+        if is_user_message(msg) or not turns:
+            turns.append([])
+        turns[-1].append(msg)
+    return turns
+
+
+def digest_tool_output(msg: Any) -> Any:
+    # 工具输出 -> 简短摘录；google_search 保留前几条结果的标题与链接
+    content = getattr(msg, "content", "")
+    if not isinstance(content, str) or tokens.estimate(content) <= DIGEST_TOKENS:
+        return msg
+    name = getattr(msg, "name", "") or ""
+    digest = None
+    if name == "google_search":
+        try:
+            items = json.loads(content)
+        except ValueError:
+            items = None
+        if isinstance(items, list):
+            digest = "\n".join(f"{i + 1}. {item.get('title', '')} {item.get('link', '')}"
+                               for i, item in enumerate(items[:5]) if isinstance(item, dict))
+    if digest is None:
+        digest = tokens.truncate(content, DIGEST_TOKENS)
+    digest = f"[较早的 {name} 结果摘录]\n{digest}\n（原文 {len(content)} 字，已省略）"
+    return ToolMessage(content=digest, tool_call_id=msg.tool_call_id, name=name, id=getattr(msg, "id", None))
+
+
+def render_for_summary(messages: List[Any]) -> str:
+    # 待折叠的轮次 -> 纯文本（工具输出已是摘录）
+    lines = []
+    for msg in messages:
+        if is_user_message(msg):
+            lines.append(f"用户：{tokens.message_text(msg)}")
+        elif isinstance(msg, AIMessage):
+            calls = msg.tool_calls or []
+            if calls:
+                lines.append("助手调用工具：" + "；".join(f"{c.get('name')}({json.dumps(c.get('args'), ensure_ascii=False)})"
+                                                  for c in calls))
+            if isinstance(msg.content, str) and msg.content.strip():
+                lines.append(f"助手：{tokens.truncate(msg.content, 400)}")
+        elif getattr(msg, "type", None) == "tool":
+            lines.append(f"工具 {getattr(msg, 'name', '')}：{tokens.truncate(digest_tool_output(msg).content, 200)}")
+    return "\n".join(lines)
+
+
+def build_summary_prompt(previous: Optional[str], folded: List[Any]) -> List[Any]:
+    return [
+        SystemMessage(content=(
+            "你负责压缩一段对话历史。请在“已有摘要”的基础上，合并“新增对话”中的要点，输出新的摘要：\n"
+            "- 保留用户的问题与偏好、已确认的事实、数字、日期、结论及其来源网址/文件名\n"
+            "- 删除寒暄、重复内容和工具调用细节\n"
+            f"- 使用中文，不超过 {SUMMARY_MAX_TOKENS} 个 token，只输出摘要本身")),
+        ("user", f"已有摘要：\n{previous or '（无）'}\n\n新增对话：\n{render_for_summary(folded)}"),
+    ]
+
+
+def fallback_summary(previous: Optional[str], folded: List[Any]) -> str:
+    # LLM 总结失败时的兜底：已有摘要 + 新折叠轮次的截断文本
+    return tokens.truncate("\n".join(filter(None, [previous, render_for_summary(folded)])), SUMMARY_MAX_TOKENS)
+
+
+def summary_message(summary: str) -> SystemMessage:
+    return SystemMessage(content=f"以下是本会话较早对话的摘要（更早的原始消息已省略）：\n{summary}")
+
+
+class CompactionPlan:
+    """
+    一次 chatbot 调用的压缩结果：history 为发给模型的历史部分；
+    fold 非空时需要先把这些消息总结进摘要（由调用方执行 LLM 调用后 apply_summary）。
+    """
+    def __init__(self, head: List[Any], summary: Optional[str], covered: int, history: List[Any],
+                 fold: List[Any], fold_count: int):
+        self.head = head
+        self.summary = summary
+        self.covered = covered
+        self.history = history
+        self.fold = fold
+        self.fold_count = fold_count
+
+    def apply_summary(self, summary: str) -> Dict[str, Any]:
+        self.summary = summary
+        self.covered += self.fold_count
+        self.fold = []
+        return {"summary": summary, "covered": self.covered}
+
+    def messages(self) -> List[Any]:
+        return [*self.head, *([summary_message(self.summary)] if self.summary else []), *self.history]
+
+
+def plan(head: List[Any], messages: List[Any], state: Optional[Dict[str, Any]], prepare) -> CompactionPlan:
+    """
+    head 为固定前缀（系统提示）；messages 为 checkpoint 中的完整消息；state 为 state["compaction"]；
+    prepare(list) 对消息做提示前的过滤（无效工具调用等）。
+    """
+    state = state or {}
+    summary = state.get("summary")
+    covered = min(int(state.get("covered") or 0), len(messages))
+    turns = split_turns(messages[covered:])
+    history = prepare([m for turn in turns for m in turn])
+    result = CompactionPlan(head, summary, covered, history, [], 0)
+    if TOKEN_BUDGET <= 0 or tokens.estimate_messages(result.messages()) <= TOKEN_BUDGET:
+        return result
+
+    # 1) 较早轮次的工具输出替换为摘录
+    keep = turns[-KEEP_TURNS:]
+    older = [[digest_tool_output(m) if getattr(m, "type", None) == "tool" else m for m in turn]
+             for turn in turns[:-KEEP_TURNS]]
+    result.history = prepare([m for turn in older + keep for m in turn])
+    if tokens.estimate_messages(result.messages()) <= TOKEN_BUDGET:
+        return result
+
+    # 2) 从最早的轮次开始折叠，直到剩余部分低于目标
+    target = TOKEN_BUDGET * TARGET_RATIO
+    fold_turns = 0
+    remaining = tokens.estimate_messages(result.messages())
+    while fold_turns < len(older) and remaining > target:
+        remaining -= tokens.estimate_messages(prepare(older[fold_turns]))
+        fold_turns += 1
+    result.fold = prepare([m for turn in older[:fold_turns] for m in turn])
+    result.fold_count = sum(len(turn) for turn in turns[:fold_turns])
+    result.history = prepare([m for turn in older[fold_turns:] + keep for m in turn])
+    return result
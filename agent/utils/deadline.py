@@ -0,0 +1,100 @@
+import asyncio
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+# 默认单轮时间预算（秒），0 表示不限；请求可单独指定
+DEFAULT_TIME_BUDGET_SECONDS = float(os.getenv("AGENT_TIME_BUDGET_SECONDS", "120"))
+# 剩余预算低于该值时不再开始新的检索/重选，直接用已有信息作答（无工具兜底）
+ANSWER_RESERVE_SECONDS = float(os.getenv("AGENT_ANSWER_RESERVE_SECONDS", "20"))
+# 工具请求的最短超时：剩余预算不足该值时不再发起请求
+MIN_CALL_TIMEOUT_SECONDS = 1.0
+
+
+# --------------------------
+# 请求截止时间
+# - 每次 agent 运行绑定一个 Deadline（contextvar，与 CancelToken 一样会被复制到执行同步工具的线程中）
+# - 节点与工具通过 remaining() / clamp() 读取剩余预算，把各自的超时收缩到预算之内
+# - planning 在预算将尽时转入 exhausted，chatbot 改用无工具模型作答
+# --------------------------
+class DeadlineExceeded(Exception):
+    """本轮时间预算已用完。"""
+
+
+class Deadline:
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.at = time.monotonic() + budget
+
+    def remaining(self) -> float:
+        return max(0.0, self.at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+_current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("agent_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+def remaining() -> Optional[float]:
+    """
+    当前运行的剩余预算（秒）；未设置预算时返回 None。
+    """
+    deadline = _current_deadline.get()
+    return None if deadline is None else deadline.remaining()
+
+
+def clamp(default: float, reserve: float = ANSWER_RESERVE_SECONDS) -> float:
+    """
+    把工具请求的超时收缩到剩余预算之内（扣除为最终回答预留的 reserve 秒）；
+    可用时间不足 MIN_CALL_TIMEOUT_SECONDS 时抛 DeadlineExceeded。
+    """
+    left = remaining()
+    if left is None:
+        return default
+    left -= reserve
+    if left < MIN_CALL_TIMEOUT_SECONDS:
+        raise DeadlineExceeded(f"time budget exhausted ({max(0.0, left):.1f}s left for tools)")
+    return min(default, left)
+
+
+def budget_low(reserve: float = ANSWER_RESERVE_SECONDS) -> bool:
+    left = remaining()
+    return left is not None and left < reserve
+
+
+async def wait_for(aw, reserve: float = 0.0):
+    """
+    在剩余预算（再扣除 reserve 秒）内等待协程完成；超时取消该协程并抛 DeadlineExceeded。
+    """
+    left = remaining()
+    if left is None:
+        return await aw
+    try:
+        return await asyncio.wait_for(aw, max(0.0, left - reserve))
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"time budget exhausted after waiting {left - reserve:.1f}s")
+
+
+@contextmanager
+def bind_deadline(budget: Optional[float]):
+    """
+    为当前上下文设置时间预算；budget 为 None 或 <= 0 时不限时。
+    """
+    deadline = Deadline(budget) if budget and budget > 0 else None
+    reset = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        try:
+            _current_deadline.reset(reset)
+        except ValueError:
+            # 异步生成器被其他任务关闭时处于不同的 Context，此时无需还原
+            pass
@@ -0,0 +1,58 @@
+import os
+import threading
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# --------------------------
+# 外部 HTTP 连接
+# - 工具共用一个 requests.Session（连接池）：DNS/TLS/代理握手只在首次或连接过期时发生，预热阶段提前建立
+# - 代理与各外部端点可通过环境变量配置；AGENT_OFFLINE=1 时默认指向本地替身服务且不走代理
+# --------------------------
+OFFLINE = os.getenv("AGENT_OFFLINE", "0") == "1"
+STANDIN_URL = os.getenv("AGENT_STANDIN_URL", "http://127.0.0.1:8765").rstrip("/")
+HTTP_PROXY = os.getenv("AGENT_HTTP_PROXY", "" if OFFLINE else "http://127.0.0.1:7897")
+POOL_SIZE = int(os.getenv("AGENT_HTTP_POOL_SIZE", "32"))
+
+
+def endpoint(env_name: str, default: str, standin_path: str = "") -> str:
+    """
+    外部端点地址：环境变量优先；离线模式下默认使用本地替身服务。
+    """
+    return os.getenv(env_name) or (STANDIN_URL + standin_path if OFFLINE else default)
+
+
+LLM_BASE_URL = endpoint("AGENT_LLM_BASE_URL", "https://api.deepseek.com")
+SEARCH_URL = endpoint("AGENT_SEARCH_URL", "https://www.googleapis.com/customsearch/v1", "/customsearch/v1")
+
+
+def proxies() -> Optional[Dict[str, str]]:
+    if not HTTP_PROXY or HTTP_PROXY.lower() == "none":
+        return None
+    return {"http": HTTP_PROXY, "https": HTTP_PROXY}
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.proxies.update(proxies() or {})
+                _session = session
+    return _session
+
+
+def warm(url: str, timeout: float = 5.0):
+    """
+    对端点发一个 HEAD 请求以建立并保持池中的连接；只要收到 HTTP 响应（任意状态码）即视为连通。
+    """
+    get_session().head(url, timeout=timeout, allow_redirects=False).close()
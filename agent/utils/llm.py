@@ -0,0 +1,341 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.runnables.config import ensure_config
+
+from agent import config as agent_config
+from agent.utils import deadline
+from agent.utils.metrics import ERRORS, LLM_CACHE_TOKENS, LLM_LATENCY, LLM_TOKENS, REGISTRY
+from agent.utils.scheduler import SCHEDULER, estimate_tokens, priority_for
+from agent.utils.usage import current_usage, usage_from_response
+
+# --------------------------
+# LLM 调用入口
+# - 节点内的模型调用统一经过 invoke_llm / ainvoke_llm，并注明用途（purpose）
+# - 用途决定模型档位（config.MODEL_ROUTES），按档位记录延迟与 token 用量（/metrics 与 /stats/llm）
+# - 容错：瞬时错误（连接失败/超时/429/5xx）按带抖动的指数退避重试，仍失败时切换到备用端点
+# - 对冲（仅异步）：主请求在对冲延迟内既没完成也没吐出首个 token，则再发一个相同请求，先返回者胜出、另一个取消
+# - 每次实际发出的请求（含重试、对冲、备用）都先经过 scheduler 取得许可；对冲只在有空闲余量时发出
+# --------------------------
+MAX_RETRIES = int(os.getenv("AGENT_LLM_MAX_RETRIES", "2"))
+BACKOFF_BASE_SECONDS = float(os.getenv("AGENT_LLM_BACKOFF_SECONDS", "0.5"))
+BACKOFF_MAX_SECONDS = float(os.getenv("AGENT_LLM_BACKOFF_MAX_SECONDS", "8"))
+# 对冲延迟："auto" 取该用途最近调用延迟的 p95（样本不足时用默认值），数字为固定秒数，0 关闭对冲
+HEDGE_DELAY = os.getenv("AGENT_LLM_HEDGE_DELAY", "auto").lower()
+HEDGE_DEFAULT_SECONDS = float(os.getenv("AGENT_LLM_HEDGE_DEFAULT_SECONDS", "8"))
+HEDGE_MIN_SAMPLES = 20
+
+_TRANSIENT_ERRORS = {"APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError",
+                     "ConnectError", "ReadTimeout", "ConnectTimeout", "RemoteProtocolError", "TimeoutError"}
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, Dict[str, float]] = {}
+_resilience = {"retries": 0, "fallbacks": 0, "hedges_fired": 0, "hedge_wins": 0, "wasted_calls": 0}
+_latencies: Dict[str, Deque[float]] = {}
+
+HEDGES = REGISTRY.counter("agent_llm_hedges_total", "Hedged LLM requests by outcome", ["purpose", "outcome"])
+RETRIES = REGISTRY.counter("agent_llm_retries_total", "LLM calls retried after a transient error", ["purpose"])
+FALLBACKS = REGISTRY.counter("agent_llm_fallbacks_total", "LLM calls served by the fallback endpoint", ["purpose"])
+
+
+def _record(tier: str, purpose: str, seconds: float, response=None, error: bool = False):
+    LLM_LATENCY.observe(seconds, tier=tier, purpose=purpose)
+    usage = usage_from_response(response)
+    for direction in ("input", "output"):
+        if usage[direction]:
+            LLM_TOKENS.inc(usage[direction], tier=tier, direction=direction)
+    for result in ("hit", "miss"):
+        if usage[f"cache_{result}"]:
+            LLM_CACHE_TOKENS.inc(usage[f"cache_{result}"], tier=tier, result=result)
+    turn = current_usage()
+    if turn is not None and response is not None:
+        turn.add(purpose, usage)
+    if error:
+        ERRORS.inc(component="llm", name=purpose)
+    with _stats_lock:
+        entry = _stats.setdefault(tier, {"calls": 0, "errors": 0, "seconds": 0.0, "input_tokens": 0,
+                                         "output_tokens": 0, "cache_hit_tokens": 0, "cache_miss_tokens": 0})
+        entry["calls"] += 1
+        entry["errors"] += int(error)
+        entry["seconds"] += seconds
+        entry["input_tokens"] += usage["input"]
+        entry["output_tokens"] += usage["output"]
+        entry["cache_hit_tokens"] += usage["cache_hit"]
+        entry["cache_miss_tokens"] += usage["cache_miss"]
+        if not error:
+            _latencies.setdefault(purpose, deque(maxlen=200)).append(seconds)
+
+
+def _bump(key: str, n: int = 1):
+    with _stats_lock:
+        _resilience[key] += n
+
+
+def is_transient(e: BaseException) -> bool:
+    if type(e).__name__ in _TRANSIENT_ERRORS:
+        return True
+    status = getattr(e, "status_code", None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+
+def _backoff(attempt: int) -> float:
+    # full jitter：在 [0, base * 2^attempt] 内均匀取值，避免大量请求同时重试
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+
+def _check_budget(wait: float, error: BaseException):
+    # 剩余时间预算不足以等待重试时直接放弃
+    left = deadline.remaining()
+    if left is not None and left <= wait:
+        raise error
+
+
+def _is_rate_limited(e: BaseException) -> bool:
+    return type(e).__name__ == "RateLimitError" or getattr(e, "status_code", None) == 429
+
+
+def _retry_after(e: BaseException) -> Optional[float]:
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _estimate(model, prompt: Any) -> float:
+    return estimate_tokens(prompt, getattr(model, "max_tokens", None) or 512)
+
+
+def _settle(estimated: float, response=None, error: Optional[BaseException] = None):
+    # 调度器反馈：按实际用量校正令牌桶；429 时整体暂停发放
+    if error is not None:
+        if _is_rate_limited(error):
+            SCHEDULER.penalize(_retry_after(error))
+        return
+    usage = usage_from_response(response)
+    SCHEDULER.settle(estimated, usage["input"] + usage["output"])
+
+
+def hedge_delay(purpose: str) -> Optional[float]:
+    if HEDGE_DELAY in ("0", "off", "false"):
+        return None
+    if HEDGE_DELAY != "auto":
+        return float(HEDGE_DELAY)
+    with _stats_lock:
+        samples = sorted(_latencies.get(purpose, ()))
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_SECONDS
+    return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+# --------------------------
+# 同步调用：重试 + 备用端点
+# --------------------------
+def _invoke_scheduled(purpose: str, model, prompt: Any, **kwargs):
+    estimated = _estimate(model, prompt)
+    SCHEDULER.acquire_sync(priority_for(purpose), estimated)
+    try:
+        response = model.invoke(prompt, **kwargs)
+    except Exception as e:
+        _settle(estimated, error=e)
+        raise
+    _settle(estimated, response)
+    return response
+
+
+def _invoke_with_retry(purpose: str, model, prompt: Any, **kwargs):
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return _invoke_scheduled(purpose, model, prompt, **kwargs)
+        except Exception as e:
+            if not is_transient(e) or attempt == MAX_RETRIES:
+                raise
+            wait = _backoff(attempt)
+            _check_budget(wait, e)
+            _bump("retries")
+            RETRIES.inc(purpose=purpose)
+            time.sleep(wait)
+
+
+def invoke_llm(purpose: str, prompt: Any, model=None, **kwargs):
+    """
+    同步调用：model 缺省时按用途选择档位模型（不绑定工具）。
+    """
+    tier = agent_config.tier_for(purpose)
+    model = model or agent_config.get_llm(purpose)
+    started = time.perf_counter()
+    try:
+        try:
+            response = _invoke_with_retry(purpose, model, prompt, **kwargs)
+        except Exception as e:
+            fallback = agent_config.get_fallback(model)
+            if fallback is None or not is_transient(e):
+                raise
+            _bump("fallbacks")
+            FALLBACKS.inc(purpose=purpose)
+            response = _invoke_scheduled(purpose, fallback, prompt, **kwargs)
+    except Exception:
+        _record(tier, purpose, time.perf_counter() - started, error=True)
+        raise
+    _record(tier, purpose, time.perf_counter() - started, response)
+    return response
+
+
+# --------------------------
+# 异步调用：对冲 + 重试 + 备用端点
+# --------------------------
+class _FirstToken(AsyncCallbackHandler):
+    """
+    主请求吐出首个 token 时置位：已经开始流式输出的请求不再对冲。
+    """
+    def __init__(self):
+        self.event = asyncio.Event()
+
+    async def on_llm_new_token(self, token: str, **kwargs):
+        self.event.set()
+
+
+def _with_handler(handler) -> Dict[str, Any]:
+    # 在继承自节点的回调（含 LangGraph 的 token 流）之上追加 handler
+    callbacks = ensure_config().get("callbacks")
+    if callbacks is None:
+        callbacks = [handler]
+    elif isinstance(callbacks, list):
+        callbacks = callbacks + [handler]
+    else:
+        callbacks = callbacks.copy()
+        callbacks.add_handler(handler, inherit=True)
+    return {"callbacks": callbacks}
+
+
+async def _cancel(*tasks: asyncio.Task):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _ainvoke_settled(estimated: float, model, prompt: Any, **kwargs):
+    try:
+        response = await model.ainvoke(prompt, **kwargs)
+    except Exception as e:
+        _settle(estimated, error=e)
+        raise
+    _settle(estimated, response)
+    return response
+
+
+async def _ainvoke_scheduled(purpose: str, model, prompt: Any, **kwargs):
+    estimated = _estimate(model, prompt)
+    await SCHEDULER.acquire(priority_for(purpose), estimated)
+    return await _ainvoke_settled(estimated, model, prompt, **kwargs)
+
+
+async def _hedged(purpose: str, model, prompt: Any, **kwargs):
+    # 排队时间不计入对冲延迟：取得许可后才开始计时
+    estimated = _estimate(model, prompt)
+    await SCHEDULER.acquire(priority_for(purpose), estimated)
+    delay = hedge_delay(purpose)
+    if delay is None or "config" in kwargs:
+        return await _ainvoke_settled(estimated, model, prompt, **kwargs)
+
+    first_token = _FirstToken()
+    primary = asyncio.create_task(
+        _ainvoke_settled(estimated, model, prompt, config=_with_handler(first_token), **kwargs))
+    streaming = asyncio.create_task(first_token.event.wait())
+    try:
+        done, _ = await asyncio.wait({primary, streaming}, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+        if done or not SCHEDULER.try_acquire(estimated):
+            # 已完成/已开始输出，或调度器没有空闲余量（对冲只会加剧拥塞）：只等主请求
+            return await primary
+
+        # 对冲请求不挂回调：不向前端重复推 token，胜出后由节点的最终消息给出完整内容
+        _bump("hedges_fired")
+        hedge = asyncio.create_task(
+            _ainvoke_settled(estimated, model, prompt, config={"callbacks": []}, **kwargs))
+        try:
+            pending = {primary, hedge, streaming}
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if streaming in done:
+                    # 主请求在对冲发出后开始输出：保留主请求，放弃对冲
+                    HEDGES.inc(purpose=purpose, outcome="primary_streamed")
+                    return await primary
+                # 同一批完成时取成功的一方；都失败才抛出（主请求的错误）
+                winner = next((t for t in (primary, hedge) if t in done and t.exception() is None), None)
+                if winner is None:
+                    if not (primary.done() and hedge.done()):
+                        # 先结束的一方失败，继续等另一方
+                        pending.discard(streaming)
+                        continue
+                    winner = primary
+                won_by_hedge = winner is hedge and winner.exception() is None
+                _bump("hedge_wins", int(won_by_hedge))
+                HEDGES.inc(purpose=purpose, outcome="hedge" if won_by_hedge else "primary")
+                return winner.result()
+        finally:
+            # 未胜出的请求被取消，计为一次浪费的调用
+            _bump("wasted_calls")
+            await _cancel(hedge)
+    finally:
+        await _cancel(primary, streaming)
+
+
+async def _ainvoke_with_retry(purpose: str, model, prompt: Any, **kwargs):
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return await _hedged(purpose, model, prompt, **kwargs)
+        except Exception as e:
+            if not is_transient(e) or attempt == MAX_RETRIES:
+                raise
+            wait = _backoff(attempt)
+            _check_budget(wait, e)
+            _bump("retries")
+            RETRIES.inc(purpose=purpose)
+            await asyncio.sleep(wait)
+
+
+async def ainvoke_llm(purpose: str, prompt: Any, model=None, **kwargs):
+    """
+    invoke_llm 的异步版本，额外支持对冲请求。
+    """
+    tier = agent_config.tier_for(purpose)
+    model = model or agent_config.get_llm(purpose)
+    started = time.perf_counter()
+    try:
+        try:
+            response = await _ainvoke_with_retry(purpose, model, prompt, **kwargs)
+        except Exception as e:
+            fallback = agent_config.get_fallback(model)
+            if fallback is None or not is_transient(e):
+                raise
+            _bump("fallbacks")
+            FALLBACKS.inc(purpose=purpose)
+            response = await _ainvoke_scheduled(purpose, fallback, prompt, **kwargs)
+    except Exception:
+        _record(tier, purpose, time.perf_counter() - started, error=True)
+        raise
+    _record(tier, purpose, time.perf_counter() - started, response)
+    return response
+
+
+def stats() -> Dict[str, Any]:
+    """
+    各档位的调用次数、错误数、平均延迟与 token 用量，重试/备用/对冲统计，以及调度器排队情况。
+    """
+    with _stats_lock:
+        tiers = {tier: dict(entry) for tier, entry in _stats.items()}
+        resilience = dict(_resilience)
+    for tier, entry in tiers.items():
+        entry["avg_seconds"] = round(entry["seconds"] / entry["calls"], 4) if entry["calls"] else 0.0
+        entry["model"] = agent_config.MODEL_TIERS.get(tier, {}).get("model")
+        prompt_tokens = entry["cache_hit_tokens"] + entry["cache_miss_tokens"]
+        entry["cache_hit_rate"] = round(entry["cache_hit_tokens"] / prompt_tokens, 4) if prompt_tokens else 0.0
+    fired = resilience["hedges_fired"]
+    resilience["hedge_win_rate"] = round(resilience["hedge_wins"] / fired, 4) if fired else 0.0
+    return {"tiers": tiers, "resilience": resilience, "scheduler": SCHEDULER.stats()}
@@ -1,35 +1,48 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterable, List, Set
 import json
 from langchain_core.messages import AIMessage
 
 # --------------------------
 # 过滤掉 messages 中无效/不需要的 ToolMessage 和其触发的 AIMessage
+# - 按 tool_call_id 过滤，且被隐藏的 id 跨轮保持（hidden_ids）：同一段历史在后续轮次中形态不变，
+#   提示前缀只会向后追加，服务端的前缀缓存得以命中
+# - 兜底阶段（exhausted）另外去掉 url_summary 的调用与结果，只影响这一次无工具作答的提示
 # --------------------------
-def filter_messages_for_prompt(messages: List[Any], pl: Dict[str, Any]) -> List[Any]:
-    invalid_ids = set(pl.get("invalid_tool_call_ids", []))
-    exhausted = bool(pl.get("exhausted"))
+def _tool_calls(msg: AIMessage) -> List[Dict[str, Any]]:
+    return msg.tool_calls or msg.additional_kwargs.get("tool_calls", [])
+
+
+def _url_summary_call_ids(messages: List[Any]) -> Set[str]:
+    # 含 url_summary 调用的 AIMessage 连同它的全部工具结果一起去掉，保持调用与结果成对
+    ids = set()
+    for msg in messages:
+        if isinstance(msg, AIMessage):
+            tool_calls = _tool_calls(msg)
+            if any((tc.get("name") or (tc.get("function") or {}).get("name")) == "url_summary" for tc in tool_calls):
+                ids.update(tc.get("id") for tc in tool_calls)
+        elif getattr(msg, "type", None) == "tool" and getattr(msg, "name", "") == "url_summary":
+            ids.add(getattr(msg, "tool_call_id", None))
+    return ids
+
+
+def filter_messages_for_prompt(messages: List[Any], pl: Dict[str, Any], hidden_ids: Iterable[str] = ()) -> List[Any]:
+    invalid_ids = set(pl.get("invalid_tool_call_ids", [])) | set(hidden_ids)
+    if pl.get("exhausted"):
+        invalid_ids |= _url_summary_call_ids(messages)
+    if not invalid_ids:
+        return list(messages)
     filtered = []
     for msg in messages:
         # 过滤 ToolMessage
         if hasattr(msg, "type") and msg.type == "tool":
-            tname = getattr(msg, "name", "")
-            tid = getattr(msg, "tool_call_id", None)
-            if exhausted and tname == "url_summary":
-                continue
-            if tid in invalid_ids:
+            if getattr(msg, "tool_call_id", None) in invalid_ids:
                 continue
 
         # 过滤触发工具的 AIMessage
         if isinstance(msg, AIMessage):
-            tool_calls = msg.tool_calls or msg.additional_kwargs.get("tool_calls", [])
-            if tool_calls:
-                if exhausted and any(
-                    ((tc.get("function") or {}).get("name") == "url_summary")
-                    for tc in tool_calls
-                ):
-                    continue
-                if any(tc.get("id") in invalid_ids for tc in tool_calls):
-                    continue
+            tool_calls = _tool_calls(msg)
+            if tool_calls and any(tc.get("id") in invalid_ids for tc in tool_calls):
+                continue
 
         filtered.append(msg)
     return filtered
@@ -0,0 +1,253 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# --------------------------
+# 进程内指标（Prometheus 文本格式）
+# - 不依赖 prometheus_client；每次记录只有一次加锁 + 二分查找，开销可忽略
+# - Counter / Histogram 支持标签；collector 用于在导出时读取其他模块的实时状态（准入队列、内存等）
+# --------------------------
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [各桶计数(不累计), sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][idx] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = sorted((k, [list(v[0]), v[1], v[2]]) for k, v in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]] = []
+        self._lock = threading.Lock()
+
+    def counter(self, name, help_text, labels=()) -> Counter:
+        return self._add(Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def _add(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, fn: Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]):
+        """
+        注册导出时调用的采集函数；返回 (name, type, help, labels, value) 序列，
+        用于把其他模块已有的统计（准入、内存等）以 gauge/counter 形式导出。
+        """
+        with self._lock:
+            self._collectors.append(fn)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics, collectors = list(self._metrics), list(self._collectors)
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        declared = set()
+        for fn in collectors:
+            try:
+                samples = list(fn())
+            except Exception:
+                continue
+            for name, type_name, help_text, labels, value in samples:
+                if name not in declared:
+                    declared.add(name)
+                    lines.append(f"# HELP {name} {help_text}")
+                    lines.append(f"# TYPE {name} {type_name}")
+                names = tuple(labels)
+                lines.append(f"{name}{_format_labels(names, [labels[n] for n in names])} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# --------------------------
+# agent 指标
+# --------------------------
+NODE_LATENCY = REGISTRY.histogram("agent_node_duration_seconds", "Latency of each graph node", ["node"])
+TOOL_LATENCY = REGISTRY.histogram("agent_tool_duration_seconds", "Latency of each tool call", ["tool"])
+TIME_TO_FIRST_EVENT = REGISTRY.histogram("agent_time_to_first_event_seconds",
+                                         "Time from turn start to the first streamed event")
+TURN_DURATION = REGISTRY.histogram("agent_turn_duration_seconds", "Total duration of a turn", ["outcome"])
+PLANNING_RETRIES = REGISTRY.counter("agent_planning_retries_total", "url_summary re-selections made by planning")
+PLANNING_EXHAUSTED = REGISTRY.counter("agent_planning_exhausted_total",
+                                      "Planning rounds that fell back to the no-tools answer", ["reason"])
+ERRORS = REGISTRY.counter("agent_errors_total", "Errors raised by nodes, tools and turns", ["component", "name"])
+LLM_LATENCY = REGISTRY.histogram("agent_llm_duration_seconds", "Latency of each LLM call", ["tier", "purpose"])
+LLM_TOKENS = REGISTRY.counter("agent_llm_tokens_total", "Tokens consumed by LLM calls", ["tier", "direction"])
+LLM_CACHE_TOKENS = REGISTRY.counter("agent_llm_prompt_cache_tokens_total",
+                                    "Prompt tokens served from (hit) or missing (miss) the provider prefix cache",
+                                    ["tier", "result"])
+
+
+@contextmanager
+def track_node(node: str):
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORS.inc(component="node", name=node)
+        raise
+    finally:
+        NODE_LATENCY.observe(time.perf_counter() - started, node=node)
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    通过 LangChain 回调记录每个工具调用的耗时与异常，无需改动工具本身。
+    """
+    run_inline = True
+
+    def __init__(self):
+        self._starts: Dict[UUID, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def on_tool_start(self, serialized, input_str, *, run_id: UUID, **kwargs):
+        name = (serialized or {}).get("name") or kwargs.get("name") or "unknown"
+        with self._lock:
+            self._starts[run_id] = (name, time.perf_counter())
+
+    def _finish(self, run_id: UUID, error: bool):
+        with self._lock:
+            started = self._starts.pop(run_id, None)
+        if started is None:
+            return
+        name, t0 = started
+        TOOL_LATENCY.observe(time.perf_counter() - t0, tool=name)
+        if error:
+            ERRORS.inc(component="tool", name=name)
+
+    def on_tool_end(self, output, *, run_id: UUID, **kwargs):
+        self._finish(run_id, error=False)
+
+    def on_tool_error(self, error, *, run_id: UUID, **kwargs):
+        self._finish(run_id, error=True)
+
+
+METRICS_CALLBACK = MetricsCallbackHandler()
+
+
+class TurnTimer:
+    """
+    记录单轮对话的首个事件耗时与总耗时。
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._first = False
+
+    def event(self):
+        if not self._first:
+            self._first = True
+            TIME_TO_FIRST_EVENT.observe(time.perf_counter() - self.started)
+
+    def finish(self, outcome: str):
+        TURN_DURATION.observe(time.perf_counter() - self.started, outcome=outcome)
+        if outcome == "error":
+            ERRORS.inc(component="turn", name="agent_respond")
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
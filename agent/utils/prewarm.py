@@ -1,22 +1,216 @@
+import asyncio
+import importlib
+import os
+import sys
 import threading
 import logging
-from agent.tools.knowledge_base.kb_tool import get_model, DEFAULT_EMB_MODEL
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 
 logger = logging.getLogger(__name__)
 
-def _prewarm_model():
+# 启动预算：模块导入阶段（import agent.agent / backend.main）应在该秒数内完成
+STARTUP_BUDGET_SECONDS = float(os.getenv("AGENT_STARTUP_BUDGET_SECONDS", "2.0"))
+
+# --------------------------
+# 延迟初始化组件
+# - 重量级资源（LLM 客户端、graph、敏感词自动机、gfwlist、jieba 词典、嵌入模型……）不在 import 时构建，
+#   而是注册为组件：首次使用时按需初始化，或在显式的预热阶段统一初始化
+# - 每个组件记录状态与耗时，readiness 只看 required 组件
+# --------------------------
+class Component:
+    def __init__(self, name: str, init: Optional[Callable[[], Any]] = None, required: bool = True,
+                 ainit: Optional[Callable[[], Awaitable[Any]]] = None, refresh: bool = False):
+        self.name = name
+        self.init = init
+        self.ainit = ainit
+        self.required = required
+        # refresh=True：连接类组件，keep-warm 循环会定期重新执行，保持池中连接不过期，失败后也能恢复
+        self.refresh = refresh
+        self.state = "pending"  # pending | warming | ready | failed
+        self.seconds: Optional[float] = None
+        self.error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _begin(self, force: bool) -> bool:
+        if self.state == "ready" and not force:
+            return False
+        if self.state != "ready":
+            self.state = "warming"
+        return True
+
+    def _end(self, started: float, error: Optional[Exception]):
+        if error is None:
+            self.state = "ready"
+            self.error = None
+        else:
+            self.state = "failed"
+            self.error = f"{type(error).__name__}: {error}"
+            logger.warning(f"[prewarm] {self.name} failed: {self.error}")
+        self.seconds = round(time.perf_counter() - started, 4)
+        self.checked_at = time.time()
+
+    def warm(self, force: bool = False):
+        with self._lock:
+            if not self._begin(force):
+                return
+            started, error = time.perf_counter(), None
+            try:
+                self.init()
+            except Exception as e:
+                error = e
+            self._end(started, error)
+
+    async def awarm(self, force: bool = False):
+        # 异步组件（如 LLM 的异步 HTTP 客户端）必须在服务的事件循环上预热，连接池与事件循环绑定
+        if not self._begin(force):
+            return
+        started, error = time.perf_counter(), None
+        try:
+            await self.ainit()
+        except Exception as e:
+            error = e
+        self._end(started, error)
+
+    def status(self) -> Dict[str, Any]:
+        return {"state": self.state, "required": self.required, "seconds": self.seconds, "error": self.error,
+                "checked_at": self.checked_at}
+
+
+_components: Dict[str, Component] = {}
+_registry_lock = threading.Lock()
+_imports: List[Dict[str, Any]] = []
+_warmup_thread: Optional[threading.Thread] = None
+
+
+def register(name: str, init: Callable[[], Any], required: bool = True, refresh: bool = False):
+    """
+    注册一个预热组件；重复注册同名组件时保留首次注册。
+    """
+    with _registry_lock:
+        if name not in _components:
+            _components[name] = Component(name, init, required, refresh=refresh)
+
+
+def register_async(name: str, ainit: Callable[[], Awaitable[Any]], required: bool = True, refresh: bool = False):
+    """
+    注册一个异步预热组件：由 awarmup() 在调用方的事件循环上执行。
+    """
+    with _registry_lock:
+        if name not in _components:
+            _components[name] = Component(name, required=required, ainit=ainit, refresh=refresh)
+
+
+def _select(names: Optional[List[str]], is_async: bool, only_refresh: bool = False) -> List[Component]:
+    with _registry_lock:
+        return [c for n, c in _components.items()
+                if (names is None or n in names) and (c.ainit is not None) == is_async
+                and (c.refresh or not only_refresh)]
+
+
+def warmup(names: Optional[List[str]] = None):
+    """
+    同步执行预热阶段（按注册顺序，跳过异步组件），返回各组件状态。
+    """
+    for component in _select(names, is_async=False):
+        component.warm()
+    return status()
+
+
+async def awarmup(names: Optional[List[str]] = None):
     """
-    在后台线程中加载嵌入模型。
+    在当前事件循环上执行异步组件的预热。
     """
-    try:
-        get_model(DEFAULT_EMB_MODEL)  # 直接加载本地路径
-        logger.debug("[kb] embedding model prewarmed.")
-    except Exception as e:
-        logger.warning(f"[kb] preload failed: {e}")
+    for component in _select(names, is_async=True):
+        await component.awarm()
+    return status()
+
+
+async def keep_warm(interval: float):
+    """
+    定期重新执行连接类组件：发请求保持连接不被服务端/代理的空闲超时关闭，失败的组件自动重试恢复就绪。
+    """
+    while True:
+        await asyncio.sleep(interval)
+        for component in _select(None, is_async=False, only_refresh=True):
+            await asyncio.to_thread(component.warm, True)
+        for component in _select(None, is_async=True, only_refresh=True):
+            await component.awarm(force=True)
+
 
 def start():
     """
-    启动一个守护线程来执行模型预热。
+    启动一个守护线程执行预热阶段；重复调用不会重复启动。
+    """
+    global _warmup_thread
+    with _registry_lock:
+        if _warmup_thread is not None and _warmup_thread.is_alive():
+            return _warmup_thread
+        _warmup_thread = threading.Thread(target=warmup, name="agent-prewarm", daemon=True)
+        _warmup_thread.start()
+        return _warmup_thread
+
+
+def is_ready() -> bool:
+    with _registry_lock:
+        components = list(_components.values())
+    return all(c.state == "ready" for c in components if c.required)
+
+
+def status() -> Dict[str, Any]:
+    with _registry_lock:
+        components = dict(_components)
+    pending = [n for n, c in components.items() if c.required and c.state != "ready"]
+    return {
+        "ready": not pending,
+        "not_ready": pending,
+        "components": {name: c.status() for name, c in components.items()},
+    }
+
+
+# --------------------------
+# 导入耗时报告
+# --------------------------
+def record_import(name: str, seconds: float):
+    _imports.append({"module": name, "seconds": round(seconds, 4)})
+    if seconds > STARTUP_BUDGET_SECONDS:
+        logger.warning(f"[prewarm] import of {name} took {seconds:.2f}s (budget {STARTUP_BUDGET_SECONDS:.2f}s)")
+
+
+def import_module_timed(module: str):
+    """
+    导入模块并记录耗时（已导入则不重复计时），用于把重量级依赖的导入挪到预热阶段。
+    """
+    if module in sys.modules:
+        return sys.modules[module]
+    started = time.perf_counter()
+    mod = importlib.import_module(module)
+    _imports.append({"module": module, "seconds": round(time.perf_counter() - started, 4), "phase": "warmup"})
+    return mod
+
+
+def import_report() -> Dict[str, Any]:
+    startup = [i for i in _imports if i.get("phase") != "warmup"]
+    total = sum(i["seconds"] for i in startup)
+    return {
+        "budget_seconds": STARTUP_BUDGET_SECONDS,
+        "startup_seconds": round(total, 4),
+        "within_budget": total <= STARTUP_BUDGET_SECONDS,
+        "imports": list(_imports),
+    }
+
+
+# --------------------------
+# 嵌入模型
+# --------------------------
+def _prewarm_model():
+    """
+    加载嵌入模型（知识库检索用）。
     """
-    thread = threading.Thread(target=_prewarm_model, daemon=True)
-    thread.start()
\ No newline at end of file
+    from agent.tools.knowledge_base.kb_tool import get_model, DEFAULT_EMB_MODEL
+    get_model(DEFAULT_EMB_MODEL)  # 直接加载本地路径
+    logger.debug("[kb] embedding model prewarmed.")
+
+
+register("embedding_model", _prewarm_model, required=False)
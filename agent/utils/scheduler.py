@@ -0,0 +1,281 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from agent.utils.cancel import raise_if_cancelled
+from agent.utils.deadline import DeadlineExceeded, current_deadline
+from agent.utils.tokens import estimate, estimate_messages
+from agent.utils.metrics import REGISTRY
+
+# --------------------------
+# 进程级 LLM 调度器
+# - 所有 LLM 调用（含重试与对冲）发出前都要从调度器取得许可：请求数与 token 数两个令牌桶限速，
+#   避免同时撞上服务商限流后所有会话一起收到 429
+# - 优先级：interactive（最终回答）> planning（判定/选择）> batch（批量任务）；许可严格按优先级、同级按到达顺序发放，
+#   同步（线程）与异步调用方在同一个队列中排队
+# - 收到 429 时整体暂停发放一段时间；调用结束后按实际 token 用量校正令牌桶
+# --------------------------
+PRIORITIES = {"interactive": 0, "planning": 1, "batch": 2}
+PURPOSE_PRIORITY = {"chatbot": "interactive", "planning.judge": "planning", "planning.select": "planning",
+                    "compaction": "planning"}
+
+REQUESTS_PER_MINUTE = float(os.getenv("AGENT_LLM_RPM", "600"))
+TOKENS_PER_MINUTE = float(os.getenv("AGENT_LLM_TPM", "1000000"))
+RATE_LIMIT_PENALTY_SECONDS = float(os.getenv("AGENT_LLM_429_PENALTY_SECONDS", "2"))
+# 同步调用方分段等待许可，每段之间检查取消与截止时间
+SYNC_WAIT_SLICE_SECONDS = 0.2
+
+QUEUE_DELAY = REGISTRY.histogram("agent_llm_queue_delay_seconds", "Time LLM calls waited for a scheduler permit",
+                                 ["priority"])
+RATE_LIMITED = REGISTRY.counter("agent_llm_rate_limited_total", "429 responses received from the LLM provider")
+
+
+class TokenBucket:
+    """
+    每分钟 per_minute 个令牌、容量为一分钟用量的令牌桶；per_minute <= 0 表示不限。
+    余额可以为负（实际用量超出预估时补扣），此时后续请求需等待补足。
+    """
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, n: float, now: float) -> float:
+        if self.unlimited:
+            return 0.0
+        self._refill(now)
+        # 单次需求超过桶容量时按容量计，避免永远等不到
+        n = min(n, self.capacity)
+        return 0.0 if self.tokens >= n else (n - self.tokens) / self.rate
+
+    def take(self, n: float):
+        if not self.unlimited:
+            self.tokens -= n
+
+
+_priority_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("agent_llm_priority", default=None)
+
+
+@contextmanager
+def priority_scope(priority: str):
+    """
+    覆盖当前上下文中 LLM 调用的优先级（如批量任务整体降为 batch）。
+    """
+    reset = _priority_var.set(priority)
+    try:
+        yield
+    finally:
+        try:
+            _priority_var.reset(reset)
+        except ValueError:
+            pass
+
+
+def priority_for(purpose: str) -> str:
+    return _priority_var.get() or PURPOSE_PRIORITY.get(purpose, "interactive")
+
+
+def _resolve(fut: asyncio.Future):
+    if not fut.done():
+        fut.set_result(None)
+
+
+class _Waiter:
+    """
+    排队中的调用方：异步调用方在自己的事件循环上等 future，同步调用方（线程）等 Event。
+    granted / cancelled 只在调度器锁内读写。
+    """
+    __slots__ = ("loop", "fut", "event", "granted", "cancelled")
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.fut = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+        self.granted = False
+        self.cancelled = False
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.fut)
+
+
+class LLMScheduler:
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._lock = threading.Lock()
+        self._heap: List[Tuple[int, int, _Waiter, float]] = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._timer: Optional[threading.Timer] = None
+        self._stats = {"granted": 0, "refunded": 0, "rate_limited": 0, "queued_max": 0}
+
+    # ---- 发放许可 ----
+    def _wait_for(self, n_tokens: float, now: float) -> float:
+        return max(self._paused_until - now, self.requests.wait_time(1, now), self.tokens.wait_time(n_tokens, now))
+
+    def _grant(self, n_tokens: float):
+        self.requests.take(1)
+        self.tokens.take(n_tokens)
+        self._stats["granted"] += 1
+
+    def _refund(self, n_tokens: float):
+        # 许可已发放但调用方没有发出请求（等待中被取消）：退回令牌
+        self.requests.take(-1)
+        self.tokens.take(-n_tokens)
+        self._stats["refunded"] += 1
+
+    def _dispatch(self):
+        # 只看队首：队首等待期间低优先级请求不会插队；需要等令牌时由定时线程稍后再次发放
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            while self._heap:
+                _, _, waiter, n_tokens = self._heap[0]
+                if waiter.cancelled:
+                    heapq.heappop(self._heap)
+                    continue
+                wait = self._wait_for(n_tokens, time.monotonic())
+                if wait > 0:
+                    self._timer = threading.Timer(wait, self._dispatch)
+                    self._timer.daemon = True
+                    self._timer.start()
+                    return
+                heapq.heappop(self._heap)
+                self._grant(n_tokens)
+                waiter.granted = True
+                try:
+                    waiter.wake()
+                except RuntimeError:
+                    # 等待方的事件循环已关闭
+                    self._refund(n_tokens)
+
+    def _enqueue(self, priority: str, n_tokens: float, waiter: _Waiter) -> bool:
+        # 无人排队且有余量时直接发放（返回 True），否则入队并尝试发放
+        with self._lock:
+            if not self._heap and self._wait_for(n_tokens, time.monotonic()) <= 0:
+                self._grant(n_tokens)
+                return True
+            heapq.heappush(self._heap, (PRIORITIES.get(priority, 0), next(self._seq), waiter, n_tokens))
+            self._stats["queued_max"] = max(self._stats["queued_max"], len(self._heap))
+        # 新请求可能排在队首（优先级更高），重新计算等待
+        self._dispatch()
+        return False
+
+    async def acquire(self, priority: str, n_tokens: float):
+        started = time.monotonic()
+        waiter = _Waiter(asyncio.get_running_loop())
+        try:
+            if self._enqueue(priority, n_tokens, waiter):
+                return
+            try:
+                await waiter.fut
+            except asyncio.CancelledError:
+                self._abandon(waiter, n_tokens)
+                raise
+        finally:
+            QUEUE_DELAY.observe(time.monotonic() - started, priority=priority)
+
+    def try_acquire(self, n_tokens: float) -> bool:
+        """
+        不排队：当前立刻有余量才发放（用于对冲这类可有可无的请求）。
+        """
+        with self._lock:
+            if self._heap or self._wait_for(n_tokens, time.monotonic()) > 0:
+                return False
+            self._grant(n_tokens)
+            return True
+
+    def acquire_sync(self, priority: str, n_tokens: float):
+        """
+        同步路径（CLI / 线程中的调用）：与异步调用方进入同一个优先级队列，轮到时被唤醒。
+        """
+        started = time.monotonic()
+        waiter = _Waiter()
+        deadline = current_deadline()
+        try:
+            if self._enqueue(priority, n_tokens, waiter):
+                return
+            # 分段等待：运行被取消或时间预算用完时放弃排队（例如卡在 429 暂停之后）
+            try:
+                while not waiter.event.wait(SYNC_WAIT_SLICE_SECONDS):
+                    raise_if_cancelled()
+                    if deadline is not None and deadline.expired:
+                        raise DeadlineExceeded("time budget exhausted while waiting for an LLM permit")
+            except BaseException:
+                self._abandon(waiter, n_tokens)
+                raise
+        finally:
+            QUEUE_DELAY.observe(time.monotonic() - started, priority=priority)
+
+    def _abandon(self, waiter: _Waiter, n_tokens: float):
+        # 等待方放弃排队：标记为取消，许可已发放时退回
+        with self._lock:
+            granted, waiter.cancelled = waiter.granted, True
+            if granted:
+                self._refund(n_tokens)
+        if granted:
+            # 退回的余量可能够队首使用
+            self._dispatch()
+
+    # ---- 反馈 ----
+    def settle(self, estimated: float, actual: float):
+        # 按实际 token 用量校正（多退少补）
+        if actual > 0:
+            with self._lock:
+                self.tokens.take(actual - estimated)
+
+    def penalize(self, seconds: Optional[float] = None):
+        """
+        收到 429：在 seconds（默认 AGENT_LLM_429_PENALTY_SECONDS）内暂停发放许可。
+        """
+        RATE_LIMITED.inc()
+        with self._lock:
+            self._stats["rate_limited"] += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + (seconds or RATE_LIMIT_PENALTY_SECONDS))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            queued: Dict[str, int] = {}
+            names = {v: k for k, v in PRIORITIES.items()}
+            for prio, _, waiter, _ in self._heap:
+                if not waiter.cancelled:
+                    queued[names.get(prio, str(prio))] = queued.get(names.get(prio, str(prio)), 0) + 1
+            now = time.monotonic()
+            return {
+                **self._stats,
+                "queued": queued,
+                "paused_seconds": round(max(0.0, self._paused_until - now), 3),
+                "request_tokens": None if self.requests.unlimited else round(self.requests.tokens, 1),
+                "token_tokens": None if self.tokens.unlimited else round(self.tokens.tokens, 1),
+            }
+
+
+SCHEDULER = LLMScheduler(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
+
+
+def estimate_tokens(prompt: Any, max_output: int = 512) -> float:
+    """
+    粗略估计一次调用的 token 数（输入 + 预计输出），调用结束后按实际用量校正。
+    """
+    if isinstance(prompt, list):
+        return estimate_messages(prompt) + max_output
+    return estimate(prompt) + max_output
@@ -0,0 +1,155 @@
+import asyncio
+import re
+import threading
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Deque, Dict, Optional
+
+# --------------------------
+# 会话 id：每个会话对应 checkpointer 中独立的 thread_id
+# --------------------------
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_.:\-]{1,128}$")
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+def normalize_session_id(session_id: Optional[str]) -> Optional[str]:
+    """
+    校验外部传入的会话 id；为空返回 None，非法格式抛 ValueError。
+    """
+    if session_id is None:
+        return None
+    session_id = str(session_id).strip()
+    if not session_id:
+        return None
+    if not _SESSION_ID_RE.match(session_id):
+        raise ValueError("session_id 只能包含字母、数字和 _.:-，且长度不超过 128")
+    return session_id
+
+
+# --------------------------
+# 会话锁：不同会话完全并行，同一会话的多轮对话按到达顺序串行（同步与异步调用方共用同一把锁）
+# - 锁只在当前进程内有效：多 worker 部署（共享 SQLite checkpointer）时，同一会话的请求落到不同 worker
+#   仍可能交错执行，需要在负载均衡层按 session_id 粘性路由
+# --------------------------
+class _SessionLock:
+    """
+    同一会话的 FIFO 锁：同步（线程）与异步（协程）调用方共用，释放时按到达顺序直接交给下一个等待者。
+    所有字段只在 SessionLocks._guard 内读写。
+    """
+    def __init__(self):
+        self.held = False
+        # 等待者：threading.Event（同步）或 (loop, future)（异步）
+        self.waiters: Deque[Any] = deque()
+        # 持有 + 等待中的调用方数；归零时从锁表删除，避免锁表无限增长
+        self.refs = 0
+
+
+def _wake(fut: asyncio.Future):
+    if not fut.done():
+        fut.set_result(None)
+
+
+class SessionLocks:
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks: Dict[str, _SessionLock] = {}
+
+    def _ref(self, session_id: str) -> _SessionLock:
+        with self._guard:
+            lock = self._locks.get(session_id)
+            if lock is None:
+                lock = self._locks[session_id] = _SessionLock()
+            lock.refs += 1
+            return lock
+
+    def _unref(self, session_id: str, lock: _SessionLock):
+        with self._guard:
+            lock.refs -= 1
+            if lock.refs <= 0 and self._locks.get(session_id) is lock:
+                del self._locks[session_id]
+
+    def _release(self, lock: _SessionLock):
+        # 持有权直接交给队首等待者；所在事件循环已关闭的异步等待者跳过
+        with self._guard:
+            while lock.waiters:
+                waiter = lock.waiters.popleft()
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                    return
+                loop, fut = waiter
+                try:
+                    loop.call_soon_threadsafe(_wake, fut)
+                    return
+                except RuntimeError:
+                    continue
+            lock.held = False
+
+    def _acquire_sync(self, lock: _SessionLock):
+        with self._guard:
+            if not lock.held:
+                lock.held = True
+                return
+            event = threading.Event()
+            lock.waiters.append(event)
+        event.wait()
+
+    async def _acquire(self, lock: _SessionLock):
+        loop = asyncio.get_running_loop()
+        with self._guard:
+            if not lock.held:
+                lock.held = True
+                return
+            waiter = (loop, loop.create_future())
+            lock.waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._guard:
+                if waiter in lock.waiters:
+                    lock.waiters.remove(waiter)
+                    raise
+            # 取消前已被交接：转交给下一个等待者
+            self._release(lock)
+            raise
+
+    @asynccontextmanager
+    async def hold(self, session_id: str):
+        lock = self._ref(session_id)
+        try:
+            await self._acquire(lock)
+            try:
+                yield
+            finally:
+                self._release(lock)
+        finally:
+            self._unref(session_id, lock)
+
+    @contextmanager
+    def hold_sync(self, session_id: str):
+        lock = self._ref(session_id)
+        try:
+            self._acquire_sync(lock)
+            try:
+                yield
+            finally:
+                self._release(lock)
+        finally:
+            self._unref(session_id, lock)
+
+    def is_busy(self, session_id: str) -> bool:
+        """
+        会话当前是否有轮次在执行或排队。
+        """
+        with self._guard:
+            return session_id in self._locks
+
+    def active_sessions(self) -> int:
+        with self._guard:
+            return len(self._locks)
+
+
+SESSION_LOCKS = SessionLocks()
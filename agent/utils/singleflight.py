@@ -0,0 +1,180 @@
+import asyncio
+import contextvars
+import copy
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from agent.utils import deadline
+from agent.utils.cancel import RunCancelled, raise_if_cancelled
+from agent.utils.metrics import REGISTRY
+
+# --------------------------
+# Single-flight：合并进行中的相同请求
+# - 多个会话同时发起相同的搜索/网页抓取/判定调用时，只有第一个（leader）真正执行，其余调用等待并共享其结果
+# - 同步版（do）用于线程池中执行的工具，异步版（ado）用于事件循环上的 LLM 调用；每个调用方拿到结果的独立副本
+# - 等待方仍受自己的取消令牌与时间预算约束；只共享结果与普通错误：leader 因自身运行被取消、时间预算用完
+#   （或失败时其预算已所剩无几，超时是按它的预算收缩的）而失败时，等待方重新竞选 leader 执行
+# - 结果因 leader 的时间预算而不完整时（网页只下载了一部分、搜索只取了第一页），执行函数调用 mark_partial()，
+#   该结果同样只属于 leader，等待方重新执行
+# - 异步版中所有调用方都离开后才取消共享的执行
+# --------------------------
+COALESCED = REGISTRY.counter("agent_singleflight_coalesced_total",
+                             "Calls served by joining an identical in-flight call", ["name"])
+
+# 等待方检查自身取消令牌/时间预算的间隔
+_POLL_SECONDS = 0.25
+
+
+def _leader_scoped(error: BaseException) -> bool:
+    # 在 leader 的上下文中判断：该失败是否只属于 leader 本次运行，不应传给等待方
+    if isinstance(error, (RunCancelled, deadline.DeadlineExceeded)):
+        return True
+    left = deadline.remaining()
+    return left is not None and left < deadline.MIN_CALL_TIMEOUT_SECONDS
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+        self.leader_scoped = False
+
+
+class _AsyncCall:
+    __slots__ = ("task", "waiters", "leader_scoped")
+
+    def __init__(self):
+        self.task: Optional[asyncio.Future] = None
+        self.waiters = 0
+        self.leader_scoped = False
+
+
+# leader 正在执行的调用（供 mark_partial 标记）
+_current_call: contextvars.ContextVar[Optional[Any]] = contextvars.ContextVar("agent_singleflight_call", default=None)
+
+
+def mark_partial():
+    """
+    在合并执行的函数中调用：本次结果受 leader 自身的时间预算影响而不完整，不共享给等待方。
+    不在合并执行中时无效果。
+    """
+    call = _current_call.get()
+    if call is not None:
+        call.leader_scoped = True
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._tasks: Dict[Hashable, _AsyncCall] = {}
+        self._stats = {"calls": 0, "executions": 0, "coalesced": 0}
+        _GROUPS.append(self)
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+        if key == "coalesced":
+            COALESCED.inc(name=self.name)
+
+    # ---- 同步 ----
+    @staticmethod
+    def _wait(call: _Call):
+        while not call.done.wait(_POLL_SECONDS):
+            raise_if_cancelled()
+            if deadline.remaining() == 0:
+                raise deadline.DeadlineExceeded("time budget exhausted while waiting for a coalesced call")
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        self._count("calls")
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+            if leader:
+                self._count("executions")
+                reset = _current_call.set(call)
+                try:
+                    call.result = fn()
+                    return call.result
+                except BaseException as e:
+                    call.error = e
+                    call.leader_scoped = call.leader_scoped or _leader_scoped(e)
+                    raise
+                finally:
+                    _current_call.reset(reset)
+                    with self._lock:
+                        self._calls.pop(key, None)
+                    call.done.set()
+            self._wait(call)
+            if call.leader_scoped:
+                continue
+            self._count("coalesced")
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+    # ---- 异步 ----
+    def _forget(self, key: Hashable, call: _AsyncCall):
+        if self._tasks.get(key) is call:
+            del self._tasks[key]
+
+    @staticmethod
+    async def _run(factory: Callable[[], Awaitable[Any]], call: _AsyncCall) -> Any:
+        # 在共享执行自己的上下文中运行，mark_partial 标记到该调用
+        _current_call.set(call)
+        try:
+            return await factory()
+        except Exception as e:
+            call.leader_scoped = call.leader_scoped or _leader_scoped(e)
+            raise
+
+    async def ado(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        self._count("calls")
+        while True:
+            call = self._tasks.get(key)
+            leader = call is None
+            if leader:
+                self._count("executions")
+                # 共享执行沿用 leader 的上下文（时间预算、调度优先级、用量统计）
+                call = self._tasks[key] = _AsyncCall()
+                call.task = asyncio.ensure_future(self._run(factory, call))
+                call.task.add_done_callback(lambda _task, key=key, call=call: self._forget(key, call))
+            task = call.task
+            call.waiters += 1
+            try:
+                result = await asyncio.shield(task)
+            except Exception:
+                if leader or not call.leader_scoped:
+                    raise
+                continue
+            finally:
+                call.waiters -= 1
+                if call.waiters == 0 and not task.done():
+                    task.cancel()
+                    # 立即摘除：取消要到下一轮事件循环才生效，期间到达的调用方不能加入已取消的执行
+                    self._forget(key, call)
+            if leader:
+                return result
+            if call.leader_scoped:
+                continue
+            self._count("coalesced")
+            return copy.deepcopy(result)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "in_flight": len(self._calls) + len(self._tasks)}
+
+
+_GROUPS: List[SingleFlight] = []
+
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    """
+    各合并组的调用数、实际执行数与被合并的调用数。
+    """
+    return {group.name: group.stats() for group in _GROUPS}
@@ -0,0 +1,271 @@
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import zlib
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Tuple
+
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    CheckpointTuple,
+    get_checkpoint_id,
+)
+
+try:
+    from langgraph.checkpoint.base import get_checkpoint_metadata
+except ImportError:  # 旧版本 langgraph 没有该辅助函数，直接使用传入的 metadata
+    def get_checkpoint_metadata(config, metadata):
+        return metadata
+
+# 超过该字节数的序列化结果做 zlib 压缩（search JSON / 网页摘要压缩率很高）
+_COMPRESS_MIN_BYTES = 1024
+_COMPRESSED_PREFIX = "z:"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+
+# --------------------------
+# SQLite checkpointer
+# - 同一主机上的多个 uvicorn worker 共享一个数据库文件，任意 worker 都能续接会话
+# - WAL 模式：读写互不阻塞；synchronous=NORMAL 减少 fsync
+# - put_writes 按任务在单个事务中立即落盘（一个任务的所有写入一次提交）：其他 worker 随即可见，进程崩溃也不会丢失
+#   已完成任务的结果；put 的 checkpoint 与历史清理同在一个事务中
+# - 序列化结果超过阈值时 zlib 压缩；每个会话只保留最近 keep_last 个 checkpoint
+# - 注意：会话锁（agent/utils/session.py）只在进程内有效，多 worker 时同一会话的两轮请求若落到不同 worker，
+#   仍可能交错执行；需要严格串行时应在负载均衡层按 session_id 粘性路由
+# --------------------------
+class SqliteCheckpointSaver(BaseCheckpointSaver):
+    def __init__(self, path: str, *, keep_last: int = 10, busy_timeout_ms: int = 5000, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.keep_last = max(1, keep_last)
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    # ---- 连接：sqlite3 连接不能跨线程共享，每个线程一个 ----
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            self._local.conn = conn
+        return conn
+
+    # ---- 紧凑序列化 ----
+    def _dumps(self, obj: Any) -> Tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(obj)
+        if len(data) >= _COMPRESS_MIN_BYTES:
+            return _COMPRESSED_PREFIX + type_, zlib.compress(data, 6)
+        return type_, data
+
+    def _loads(self, type_: str, data: bytes) -> Any:
+        if type_ and type_.startswith(_COMPRESSED_PREFIX):
+            return self.serde.loads_typed((type_[len(_COMPRESSED_PREFIX):], zlib.decompress(data)))
+        return self.serde.loads_typed((type_, data))
+
+    # ---- 事务写 ----
+    def _execute(self, conn: sqlite3.Connection, statements: Sequence[Tuple[str, Any]]):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, params in statements:
+                if isinstance(params, list):
+                    conn.executemany(sql, params)
+                else:
+                    conn.execute(sql, params)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    # ---- 读取 ----
+    def _pending_writes(self, conn, thread_id: str, checkpoint_ns: str, checkpoint_id: str):
+        rows = conn.execute(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id=? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return [(task_id, channel, self._loads(type_, value)) for task_id, channel, type_, value in rows]
+
+    def _row_to_tuple(self, conn, row) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_id, type_, checkpoint, metadata_type, metadata = row
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                     "checkpoint_id": checkpoint_id}},
+            checkpoint=self._loads(type_, checkpoint),
+            metadata=self._loads(metadata_type, metadata),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                  "checkpoint_id": parent_id}}
+                if parent_id else None
+            ),
+            pending_writes=self._pending_writes(conn, thread_id, checkpoint_ns, checkpoint_id),
+        )
+
+    _SELECT = ("SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+               "metadata_type, metadata FROM checkpoints")
+
+    def get_tuple(self, config) -> Optional[CheckpointTuple]:
+        conn = self._conn()
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        if checkpoint_id:
+            row = conn.execute(
+                self._SELECT + " WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id=?",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            ).fetchone()
+        else:
+            row = conn.execute(
+                self._SELECT + " WHERE thread_id=? AND checkpoint_ns=? ORDER BY checkpoint_id DESC LIMIT 1",
+                (thread_id, checkpoint_ns),
+            ).fetchone()
+        return self._row_to_tuple(conn, row) if row else None
+
+    def list(self, config, *, filter: Optional[Dict[str, Any]] = None, before=None,
+             limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        conn = self._conn()
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id=?")
+            params.append(config["configurable"]["thread_id"])
+            checkpoint_ns = config["configurable"].get("checkpoint_ns")
+            if checkpoint_ns is not None:
+                clauses.append("checkpoint_ns=?")
+                params.append(checkpoint_ns)
+            if get_checkpoint_id(config):
+                clauses.append("checkpoint_id=?")
+                params.append(get_checkpoint_id(config))
+        if before and get_checkpoint_id(before):
+            clauses.append("checkpoint_id<?")
+            params.append(get_checkpoint_id(before))
+        sql = self._SELECT + (" WHERE " + " AND ".join(clauses) if clauses else "") + " ORDER BY checkpoint_id DESC"
+        rows = conn.execute(sql, params).fetchall()
+        count = 0
+        for row in rows:
+            item = self._row_to_tuple(conn, row)
+            if filter and not all(item.metadata.get(k) == v for k, v in filter.items()):
+                continue
+            yield item
+            count += 1
+            if limit is not None and count >= limit:
+                break
+
+    # ---- 写入 ----
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        type_, data = self._dumps(checkpoint)
+        metadata_type, metadata_data = self._dumps(get_checkpoint_metadata(config, metadata))
+        statements = [
+            ("INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, "
+             "type, checkpoint, metadata_type, metadata) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+             (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+              type_, data, metadata_type, metadata_data)),
+        ]
+        # 只保留最近 keep_last 个 checkpoint，连同其 writes 一起删除
+        keep_sql = ("SELECT checkpoint_id FROM checkpoints WHERE thread_id=? AND checkpoint_ns=? "
+                    "ORDER BY checkpoint_id DESC LIMIT ?")
+        for table in ("writes", "checkpoints"):
+            statements.append((
+                f"DELETE FROM {table} WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id NOT IN ({keep_sql})",
+                (thread_id, checkpoint_ns, thread_id, checkpoint_ns, self.keep_last),
+            ))
+        self._execute(self._conn(), statements)
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                 "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config, writes, task_id: str, task_path: str = ""):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        # 特殊通道（错误/中断等）允许覆盖，普通写入保持首次结果
+        verb = "INSERT OR REPLACE" if all(w[0] in WRITES_IDX_MAP for w in writes) else "INSERT OR IGNORE"
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, data = self._dumps(value)
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx),
+                         channel, type_, data, task_path))
+        self._execute(self._conn(), [(
+            f"{verb} INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, "
+            "task_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )])
+
+    def delete_thread(self, thread_id: str):
+        self._execute(self._conn(), [
+            ("DELETE FROM writes WHERE thread_id=?", (thread_id,)),
+            ("DELETE FROM checkpoints WHERE thread_id=?", (thread_id,)),
+        ])
+
+    def get_next_version(self, current, channel=None) -> str:
+        # 与 MemorySaver 相同的版本格式：单调递增整数 + 随机后缀
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(str(current).split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # ---- 异步接口：放到线程中执行，避免阻塞事件循环 ----
+    async def aget_tuple(self, config) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id: str, task_path: str = ""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    # ---- 监控 ----
+    def stats(self) -> Dict[str, Any]:
+        conn = self._conn()
+        sessions, checkpoints = conn.execute(
+            "SELECT COUNT(DISTINCT thread_id), COUNT(*) FROM checkpoints").fetchone()
+        size = 0
+        for suffix in ("", "-wal"):
+            try:
+                size += os.path.getsize(self.path + suffix)
+            except OSError:
+                pass
+        return {"backend": "sqlite", "path": self.path, "sessions": sessions, "checkpoints": checkpoints,
+                "bytes": size}
@@ -0,0 +1,53 @@
+import json
+import re
+from typing import Any, Iterable
+
+# --------------------------
+# token 数快速估计
+# - 不加载分词器：按字符类别估计（DeepSeek 文档给出的经验值：1 个中文字符约 0.6 token，1 个英文字符约 0.3 token）
+# - 用于提示预算（历史压缩、工具输出上限）与调度器的预估，精度以“同一量级、偏保守”为准
+# --------------------------
+CJK_TOKENS_PER_CHAR = 0.6
+OTHER_TOKENS_PER_CHAR = 0.3
+# 每条消息的角色/分隔符开销
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_CJK = re.compile(r"[　-〿㐀-䶿一-鿿豈-﫿＀-￯]")
+
+
+def estimate(text: Any) -> int:
+    if not text:
+        return 0
+    if not isinstance(text, str):
+        text = str(text)
+    cjk = len(_CJK.findall(text))
+    return int(cjk * CJK_TOKENS_PER_CHAR + (len(text) - cjk) * OTHER_TOKENS_PER_CHAR) + 1
+
+
+def message_text(msg: Any) -> str:
+    # 消息中计入提示的文本：内容 + 工具调用参数
+    if isinstance(msg, tuple):
+        return str(msg[1])
+    text = msg.content if isinstance(getattr(msg, "content", None), str) else str(getattr(msg, "content", msg))
+    tool_calls = getattr(msg, "tool_calls", None) or (getattr(msg, "additional_kwargs", None) or {}).get("tool_calls")
+    if tool_calls:
+        text += json.dumps(tool_calls, ensure_ascii=False, default=str)
+    return text
+
+
+def estimate_messages(messages: Iterable[Any]) -> int:
+    return sum(estimate(message_text(m)) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def truncate(text: str, max_tokens: int) -> str:
+    """
+    按估计的 token 数截断文本（保留开头）。
+    """
+    if estimate(text) <= max_tokens:
+        return text
+    budget = float(max_tokens)
+    for i, ch in enumerate(text):
+        budget -= CJK_TOKENS_PER_CHAR if _CJK.match(ch) else OTHER_TOKENS_PER_CHAR
+        if budget < 0:
+            return text[:i]
+    return text
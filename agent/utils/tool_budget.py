@@ -0,0 +1,169 @@
+import json
+import os
+import re
+from typing import Any, Dict, Optional, Tuple
+
+from langchain_core.runnables import RunnableLambda
+
+from agent.utils import tokens
+from agent.utils.metrics import REGISTRY
+
+# --------------------------
+# 工具输出预算
+# - 包在 ToolNode 外：工具结果写入消息之前按工具的 token 上限做确定性的截断/精简，每轮 LLM 往返的大小可预期
+#   - google_search：去掉模型用不到的字段（favicon），超限时依次截短摘要、从排序末尾丢弃条目；始终是合法 JSON 数组
+#   - docs_use：截短 content 并同步修正 next_offset / has_more，续读从实际截断处继续
+#   - url_summary 及其他文本：在句子边界截断
+# - 被丢弃的内容记录在 ToolMessage.response_metadata["output_budget"] 中（不发送给模型）
+# --------------------------
+DEFAULT_TOOL_TOKENS = int(os.getenv("AGENT_TOOL_OUTPUT_TOKENS", "2000"))
+# 各工具的上限，可用 AGENT_TOOL_TOKEN_BUDGETS="google_search=1000,docs_use=3000" 覆盖；0 表示不限
+TOOL_TOKEN_BUDGETS = {"google_search": 1500, "url_summary": 1200, "docs_use": 2500}
+for _part in os.getenv("AGENT_TOOL_TOKEN_BUDGETS", "").split(","):
+    _name, _, _limit = _part.partition("=")
+    if _name.strip() and _limit.strip():
+        TOOL_TOKEN_BUDGETS[_name.strip()] = int(_limit)
+
+# 下发给模型的搜索结果字段（planning 的重选依赖 link / score / index）
+SEARCH_FIELDS = ("title", "link", "snippet", "date", "score", "index")
+SEARCH_SNIPPET_TOKENS = 80
+
+_TRUNCATED_NOTE = "\n（内容过长，已截断）"
+_SENTENCE_END = re.compile(r"[。！？!?；;\n]|\.(?=\s)")
+
+TOOL_OUTPUT_TRIMMED = REGISTRY.counter("agent_tool_output_trimmed_total",
+                                       "Tool results trimmed to their token budget", ["tool"])
+
+
+def budget_for(tool: str) -> int:
+    return TOOL_TOKEN_BUDGETS.get(tool, DEFAULT_TOOL_TOKENS)
+
+
+def cut_at_sentence(text: str, max_tokens: int) -> str:
+    """
+    截断到 max_tokens 以内；截断点后半段内有句末标点时退到该句末尾。
+    """
+    cut = tokens.truncate(text, max_tokens)
+    if len(cut) == len(text):
+        return text
+    ends = [m.end() for m in _SENTENCE_END.finditer(cut)]
+    if ends and ends[-1] >= len(cut) // 2:
+        return cut[:ends[-1]]
+    return cut
+
+
+# ---- 各工具的精简方式：返回 (新内容, 丢弃记录)；无需改动时返回 None ----
+def _budget_search(content: str, limit: int) -> Optional[Tuple[str, Dict[str, Any]]]:
+    try:
+        items = json.loads(content)
+    except ValueError:
+        return None
+    if not isinstance(items, list):
+        return None
+    dropped: Dict[str, Any] = {}
+    fields = sorted({k for item in items if isinstance(item, dict) for k in item} - set(SEARCH_FIELDS))
+    if fields:
+        dropped["fields"] = fields
+    items = [{k: item[k] for k in SEARCH_FIELDS if k in item} for item in items if isinstance(item, dict)]
+
+    def dump():
+        return json.dumps(items, ensure_ascii=False)
+
+    if tokens.estimate(dump()) > limit:
+        truncated = 0
+        for item in items:
+            snippet = item.get("snippet")
+            if isinstance(snippet, str) and tokens.estimate(snippet) > SEARCH_SNIPPET_TOKENS:
+                item["snippet"] = cut_at_sentence(snippet, SEARCH_SNIPPET_TOKENS)
+                truncated += 1
+        if truncated:
+            dropped["snippets_truncated"] = truncated
+    # 结果已按得分排序：从末尾丢弃，至少保留一条
+    removed = 0
+    while len(items) > 1 and tokens.estimate(dump()) > limit:
+        items.pop()
+        removed += 1
+    if removed:
+        dropped["items"] = removed
+    return (dump(), dropped) if dropped else None
+
+
+def _budget_docs(content: str, limit: int) -> Optional[Tuple[str, Dict[str, Any]]]:
+    try:
+        out = json.loads(content)
+    except ValueError:
+        return None
+    text = out.get("content") if isinstance(out, dict) else None
+    if not isinstance(text, str) or tokens.estimate(content) <= limit:
+        return None
+    # 扣除 JSON 其余字段（含预算标记）后留给 content 的预算；每次估计有 1 token 的取整余量
+    out["truncated_by_budget"] = True
+    room = max(1, limit - tokens.estimate(json.dumps({**out, "content": ""}, ensure_ascii=False)) - 1)
+    start = int(out.get("offset_used") or 0)
+    overlap = int(out.get("overlap_used") or 0)
+    slice_start = max(0, start - overlap)
+    dropped: Dict[str, Any] = {}
+    kept = cut_at_sentence(text, room)
+    if slice_start + len(kept) <= start:
+        # 预算连重叠部分都放不下：去掉重叠，保证续读有进展
+        text = text[start - slice_start:]
+        slice_start = start
+        out["overlap_used"] = 0
+        dropped["overlap"] = overlap
+        kept = cut_at_sentence(text, room) or text[:1]
+    dropped["chars"] = len(text) - len(kept)
+    out["content"] = kept
+    out["next_offset"] = slice_start + len(kept)
+    out["has_more"] = out["next_offset"] < int(out.get("total_chars") or 0)
+    return json.dumps(out, ensure_ascii=False), dropped
+
+
+def _budget_text(content: str, limit: int) -> Optional[Tuple[str, Dict[str, Any]]]:
+    if tokens.estimate(content) <= limit:
+        return None
+    kept = cut_at_sentence(content, max(1, limit - tokens.estimate(_TRUNCATED_NOTE)))
+    return kept + _TRUNCATED_NOTE, {"chars": len(content) - len(kept)}
+
+
+_BUDGETERS = {"google_search": _budget_search, "docs_use": _budget_docs}
+
+
+def apply_budget(msg: Any) -> Any:
+    """
+    按工具的 token 上限精简一条 ToolMessage（原地修改内容与 response_metadata）。
+    """
+    tool = getattr(msg, "name", None) or ""
+    content = getattr(msg, "content", None)
+    limit = budget_for(tool)
+    if getattr(msg, "type", None) != "tool" or not isinstance(content, str) or limit <= 0:
+        return msg
+    result = _BUDGETERS.get(tool, _budget_text)(content, limit)
+    if result is None:
+        return msg
+    msg.content, dropped = result
+    original, final = tokens.estimate(content), tokens.estimate(msg.content)
+    msg.response_metadata = {**(msg.response_metadata or {}), "output_budget": {
+        "limit_tokens": limit, "original_tokens": original, "tokens": final, "dropped": dropped}}
+    if final < original:
+        TOOL_OUTPUT_TRIMMED.inc(tool=tool)
+    return msg
+
+
+def _apply(output: Any) -> Any:
+    if isinstance(output, dict) and isinstance(output.get("messages"), list):
+        for msg in output["messages"]:
+            apply_budget(msg)
+    return output
+
+
+def budgeted(tool_node):
+    """
+    包装 ToolNode：工具结果写入状态前应用输出预算。
+    """
+    def run(state, config):
+        return _apply(tool_node.invoke(state, config))
+
+    async def arun(state, config):
+        return _apply(await tool_node.ainvoke(state, config))
+
+    return RunnableLambda(run, afunc=arun, name="tools")
@@ -0,0 +1,134 @@
+import contextvars
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+# --------------------------
+# LLM token 用量
+# - usage_from_response 从模型响应中取出输入/输出 token，以及 DeepSeek 的前缀缓存命中/未命中 token
+# - 每轮对话绑定一个 TurnUsage（contextvar，节点在线程池或子任务中执行时同样可见），
+#   LLM 调用结束时按节点累加，最终的 chat 事件中携带本轮合计与各节点明细
+# - 每轮结束后计入 SESSION_USAGE（进程内，按会话累计，LRU 淘汰）
+# --------------------------
+USAGE_FIELDS = ("calls", "prompt_tokens", "completion_tokens", "total_tokens",
+                "prompt_cache_hit_tokens", "prompt_cache_miss_tokens")
+MAX_SESSIONS = int(os.getenv("AGENT_USAGE_MAX_SESSIONS", "10000"))
+
+
+def usage_from_response(response) -> Dict[str, int]:
+    usage = getattr(response, "usage_metadata", None) or {}
+    input_tokens = int(usage.get("input_tokens") or 0)
+    details = usage.get("input_token_details") or {}
+    cache_hit = details.get("cache_read")
+    if cache_hit is None:
+        # 非流式响应中 DeepSeek 直接给出 prompt_cache_hit_tokens
+        token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+        cache_hit = token_usage.get("prompt_cache_hit_tokens")
+    cache_hit = int(cache_hit or 0)
+    return {
+        "input": input_tokens,
+        "output": int(usage.get("output_tokens") or 0),
+        "cache_hit": cache_hit,
+        "cache_miss": max(0, input_tokens - cache_hit),
+    }
+
+
+def _empty() -> Dict[str, int]:
+    return dict.fromkeys(USAGE_FIELDS, 0)
+
+
+def _add_call(totals: Dict[str, int], usage: Dict[str, int]):
+    totals["calls"] += 1
+    totals["prompt_tokens"] += usage["input"]
+    totals["completion_tokens"] += usage["output"]
+    totals["total_tokens"] += usage["input"] + usage["output"]
+    totals["prompt_cache_hit_tokens"] += usage["cache_hit"]
+    totals["prompt_cache_miss_tokens"] += usage["cache_miss"]
+
+
+def _merge(totals: Dict[str, int], other: Dict[str, int]):
+    for field in USAGE_FIELDS:
+        totals[field] += other.get(field, 0)
+
+
+def node_for(purpose: str) -> str:
+    # 调用用途 -> 图节点："planning.judge" / "planning.select" 都属于 planning 节点
+    return purpose.split(".", 1)[0]
+
+
+class TurnUsage:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = _empty()
+        self._nodes: Dict[str, Dict[str, int]] = {}
+
+    def add(self, purpose: str, usage: Dict[str, int]):
+        with self._lock:
+            _add_call(self._totals, usage)
+            _add_call(self._nodes.setdefault(node_for(purpose), _empty()), usage)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._totals, "nodes": {node: dict(totals) for node, totals in self._nodes.items()}}
+
+
+_current_usage: contextvars.ContextVar[Optional[TurnUsage]] = contextvars.ContextVar("agent_turn_usage", default=None)
+
+
+def current_usage() -> Optional[TurnUsage]:
+    return _current_usage.get()
+
+
+@contextmanager
+def bind_usage(usage: TurnUsage):
+    reset = _current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        try:
+            _current_usage.reset(reset)
+        except ValueError:
+            # 异步生成器被其他任务关闭时处于不同的 Context，此时无需还原
+            pass
+
+
+class SessionUsage:
+    """
+    各会话的累计用量：{"turns", <USAGE_FIELDS>, "nodes": {node: {...}}}。
+    """
+    def __init__(self, max_sessions: int):
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def record(self, session_id: str, turn: Dict[str, Any]):
+        with self._lock:
+            entry = self._sessions.pop(session_id, None) or {"turns": 0, **_empty(), "nodes": {}}
+            entry["turns"] += 1
+            _merge(entry, turn)
+            for node, totals in turn.get("nodes", {}).items():
+                _merge(entry["nodes"].setdefault(node, _empty()), totals)
+            self._sessions[session_id] = entry
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            return None if entry is None else {**entry, "nodes": {n: dict(t) for n, t in entry["nodes"].items()}}
+
+    def discard(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            totals = _empty()
+            for entry in self._sessions.values():
+                _merge(totals, entry)
+            return {"sessions": len(self._sessions), **totals}
+
+
+SESSION_USAGE = SessionUsage(MAX_SESSIONS)
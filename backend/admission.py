@@ -0,0 +1,109 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, Any
+
+
+# --------------------------
+# 准入控制
+# - 同时运行的 agent 数不超过 max_concurrent，其余请求进入有界等待队列（FIFO）
+# - 队列已满立即拒绝（429）；排队超过 queue_timeout 仍未获得名额则拒绝（503）
+# - 过载时只有超出的请求被快速拒绝，已准入的请求不受拖累
+# --------------------------
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, reason: str, retry_after: int = 1):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """
+    一次准入的名额；release() 幂等，可在多个收尾路径上重复调用。
+    """
+    def __init__(self, controller: "AdmissionController", waited: float):
+        self._controller = controller
+        self.waited = waited
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release()
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int = 32, max_queue: int = 64, queue_timeout: float = 10.0):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._running = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._stats = {
+            "admitted": 0,
+            "rejected_queue_full": 0,
+            "rejected_timeout": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+
+    async def acquire(self) -> AdmissionTicket:
+        started = time.monotonic()
+        if self._running < self.max_concurrent and not self._waiters:
+            self._running += 1
+            return self._admit(started)
+
+        if len(self._waiters) >= self.max_queue:
+            self._stats["rejected_queue_full"] += 1
+            raise AdmissionRejected(429, "queue_full", retry_after=max(1, int(self.queue_timeout)))
+
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            # 名额由 _release 直接移交给队首等待者，running 计数不变
+            await asyncio.wait_for(fut, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._discard(fut)
+            self._stats["rejected_timeout"] += 1
+            raise AdmissionRejected(503, "queue_timeout", retry_after=max(1, int(self.queue_timeout)))
+        except asyncio.CancelledError:
+            # 等待期间客户端离开：若名额已移交则归还
+            if fut.done() and not fut.cancelled():
+                self._release()
+            self._discard(fut)
+            raise
+        return self._admit(started)
+
+    def _admit(self, started: float) -> AdmissionTicket:
+        waited = time.monotonic() - started
+        self._stats["admitted"] += 1
+        self._stats["wait_seconds_total"] += waited
+        self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], waited)
+        return AdmissionTicket(self, waited)
+
+    def _discard(self, fut: asyncio.Future):
+        try:
+            self._waiters.remove(fut)
+        except ValueError:
+            pass
+
+    def _release(self):
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._running = max(0, self._running - 1)
+
+    def stats(self) -> Dict[str, Any]:
+        admitted = self._stats["admitted"]
+        return {
+            "running": self._running,
+            "queued": len(self._waiters),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            **self._stats,
+            "wait_seconds_avg": (self._stats["wait_seconds_total"] / admitted) if admitted else 0.0,
+        }
@@ -1,22 +1,112 @@
+import time
+_IMPORT_STARTED = time.perf_counter()
 from pydantic import BaseModel
 from starlette.middleware.cors import CORSMiddleware
-from agent.agent import agent_respond, agent_respond_stream
-from fastapi.responses import StreamingResponse
+from agent.agent import agent_arespond, agent_respond_astream, agent_respond_batch
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 import uvicorn
+import asyncio
 import os
-import time
-from pathlib import Path
-import json
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from agent.tools.docs.docs_tool import WORKSPACE_ROOT
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, WebSocket
+from agent.tools.docs.docs_tool import PROJECT_ROOT, WORKSPACE_ROOT
+from agent.utils.session import new_session_id, normalize_session_id
+from agent import config as agent_config
+from agent.utils import cancel as cancel_stats
+from backend.admission import AdmissionController, AdmissionRejected
+from backend.runs import RunRegistry, parse_last_event_id
+from backend.ws import ChatSocket
+from backend.uploads import UploadError, UploadStore
+from backend.sse import compress_stream, format_event, negotiate_encoding
+from agent.utils.metrics import REGISTRY
+from agent.utils import prewarm
+from agent.utils import llm as llm_usage
+from agent.utils.usage import SESSION_USAGE
+from agent.utils.answer_cache import ANSWER_CACHE
+from agent.utils import singleflight
+
+# 导入耗时报告：backend.main（含 agent.agent 及其依赖）的导入应在启动预算内完成
+prewarm.record_import("backend.main", time.perf_counter() - _IMPORT_STARTED)
 
 app = FastAPI()
+
+# 连接保活间隔：定期请求 LLM / 搜索端点，避免池中连接被空闲超时关闭
+KEEP_WARM_SECONDS = float(os.getenv("AGENT_KEEP_WARM_SECONDS", "45"))
+
+@app.on_event("startup")
+async def _start_warmup():
+    # 预热阶段在后台线程执行；完成前 /ready 返回 503，负载均衡不会把流量导过来
+    prewarm.start()
+    # 异步 HTTP 客户端的连接池与事件循环绑定，必须在服务的事件循环上预热
+    app.state.awarmup = asyncio.create_task(prewarm.awarmup())
+    if KEEP_WARM_SECONDS > 0:
+        app.state.keep_warm = asyncio.create_task(prewarm.keep_warm(KEEP_WARM_SECONDS))
+
+@app.get("/ready")
+def ready():
+    # 各组件（LLM 客户端、graph、敏感词、jieba、到 LLM/搜索端点的连接……）的状态；required 组件全部就绪才返回 200
+    status = prewarm.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.get("/startup")
+def startup_report():
+    # 导入耗时与各预热组件耗时
+    return {"imports": prewarm.import_report(), "warmup": prewarm.status()}
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Session-Id", "X-Queue-Wait", "X-Run-Id"],
+)
+
+# 准入控制：限制同时运行的 agent 数，超出部分排队，队列满或等待超时则快速拒绝
+ADMISSION = AdmissionController(
+    max_concurrent=int(os.getenv("AGENT_MAX_CONCURRENT_RUNS", "32")),
+    max_queue=int(os.getenv("AGENT_MAX_QUEUE", "64")),
+    queue_timeout=float(os.getenv("AGENT_QUEUE_TIMEOUT_SECONDS", "10")),
+)
+
+async def _admit():
+    try:
+        return await ADMISSION.acquire()
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=f"服务繁忙（{e.reason}），请稍后重试",
+                            headers={"Retry-After": str(e.retry_after)})
+
+def _collect_runtime_metrics():
+    # 把准入队列、取消统计、会话存储的实时状态导出到 /metrics
+    adm = ADMISSION.stats()
+    yield "agent_admission_running", "gauge", "Agent runs currently executing", {}, adm["running"]
+    yield "agent_admission_queued", "gauge", "Requests waiting for an agent slot", {}, adm["queued"]
+    yield "agent_admission_admitted_total", "counter", "Requests admitted", {}, adm["admitted"]
+    yield ("agent_admission_rejected_total", "counter", "Requests rejected by admission control",
+           {"reason": "queue_full"}, adm["rejected_queue_full"])
+    yield ("agent_admission_rejected_total", "counter", "Requests rejected by admission control",
+           {"reason": "queue_timeout"}, adm["rejected_timeout"])
+    yield ("agent_admission_wait_seconds_total", "counter", "Total time admitted requests spent queued",
+           {}, adm["wait_seconds_total"])
+    cancelled = cancel_stats.stats()
+    yield "agent_cancelled_runs_total", "counter", "Runs cancelled by client disconnect", {}, cancelled["cancelled_runs"]
+    yield ("agent_aborted_calls_total", "counter", "Tool HTTP calls aborted by cancellation",
+           {}, cancelled["aborted_calls"])
+    runs = RUNS.stats()
+    yield "agent_runs_active", "gauge", "Agent runs executing in the background", {}, runs["active"]
+    yield "agent_runs_retained", "gauge", "Finished runs kept for replay", {}, runs["retained"]
+    memory = getattr(agent_config.MEMORY, "stats", None)
+    if memory:
+        mem = memory()
+        yield "agent_checkpoint_bytes", "gauge", "Approximate bytes held by the checkpointer", {}, mem.get("bytes", 0)
+        yield "agent_checkpoint_sessions", "gauge", "Sessions held by the checkpointer", {}, mem.get("sessions", 0)
+
+REGISTRY.register_collector(_collect_runtime_metrics)
+
+# 可续传运行：事件带 "<run_id>:<seq>" 形式的 id，断线后凭 Last-Event-ID 重连回放，不会重新执行图
+RUNS = RunRegistry(
+    buffer_events=int(os.getenv("AGENT_RUN_BUFFER_EVENTS", "2000")),
+    grace_seconds=float(os.getenv("AGENT_RESUME_GRACE_SECONDS", "30")),
+    retention_seconds=float(os.getenv("AGENT_RUN_RETENTION_SECONDS", "300")),
 )
 
 class Query(BaseModel):
@@ -25,26 +115,252 @@ class Query(BaseModel):
 
 @app.post("/chat")
 async def chat(query: Query):
-    result = agent_respond(query.message, options=query.options)
-    return {"result": result}
+    session_id = _session_id_from_options(query.options)
+    ticket = await _admit()
+    try:
+        result = await agent_arespond(
+            query.message,
+            deep_thinking=query.options.get("deep_thinking", query.options.get("deepThinking", False)),
+            web_search_mode=query.options.get("webSearchMode", "auto"),
+            session_id=session_id,
+            time_budget=_time_budget_from_options(query.options),
+        )
+    finally:
+        ticket.release()
+    return {"result": result, "session_id": session_id}
+
+class BatchQuery(BaseModel):
+    questions: list[str]
+    options: dict = {}
+
+# 批量提问的并发上限（单个请求可在 options.concurrency 中调低）与单批问题数上限
+BATCH_MAX_CONCURRENCY = int(os.getenv("AGENT_BATCH_MAX_CONCURRENCY", "8"))
+BATCH_MAX_QUESTIONS = int(os.getenv("AGENT_BATCH_MAX_QUESTIONS", "1000"))
+
+@asynccontextmanager
+async def _batch_gate():
+    # 批量中的每个问题同样占用一个准入名额；批量任务不赶时间，被拒时按 Retry-After 等待后重试
+    while True:
+        try:
+            ticket = await ADMISSION.acquire()
+            break
+        except AdmissionRejected as e:
+            await asyncio.sleep(e.retry_after)
+    try:
+        yield
+    finally:
+        ticket.release()
+
+@app.post("/chat/batch")
+async def chat_batch(query: BatchQuery, request: Request):
+    if not query.questions:
+        raise HTTPException(status_code=400, detail="questions 不能为空")
+    if len(query.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"单批最多 {BATCH_MAX_QUESTIONS} 个问题")
+    concurrency = max(1, min(int(query.options.get("concurrency", BATCH_MAX_CONCURRENCY)), BATCH_MAX_CONCURRENCY))
+    encoding = negotiate_encoding(request.headers.get("accept-encoding")) if SSE_COMPRESSION else None
+
+    async def event_stream():
+        # 每个问题在独立会话中执行，按完成先后推送 batch_result，最后推送 batch_done
+        watcher = asyncio.create_task(_watch_disconnect(request, asyncio.current_task()))
+        started = time.perf_counter()
+        done = failed = 0
+        try:
+            async for result in agent_respond_batch(
+                    query.questions,
+                    concurrency=concurrency,
+                    deep_thinking=query.options.get("deep_thinking", query.options.get("deepThinking", False)),
+                    web_search_mode=query.options.get("webSearchMode", "auto"),
+                    gate=_batch_gate,
+                    time_budget=_time_budget_from_options(query.options),
+            ):
+                done += 1
+                failed += 0 if result["ok"] else 1
+                yield format_event({"type": "batch_result", **result, "is_final": False})
+            yield format_event({"type": "batch_done", "total": done, "failed": failed,
+                                "elapsed": round(time.perf_counter() - started, 3), "is_final": True})
+        finally:
+            watcher.cancel()
+
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return StreamingResponse(compress_stream(event_stream(), encoding), media_type="text/event-stream",
+                             headers=headers)
+
+
+def _session_id_from_options(options: dict) -> str:
+    """
+    从请求 options 中读取会话 id（session_id / sessionId）；未提供时分配一个新会话，互不串话。
+    """
+    try:
+        session_id = normalize_session_id(options.get("session_id") or options.get("sessionId"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return session_id or new_session_id()
+
+async def _watch_disconnect(request: Request, task: asyncio.Task, interval: float = 1.0):
+    """
+    轮询客户端连接状态；断开后取消正在推流的任务。
+    运行本身不随连接结束：所有订阅者离开且宽限期内无人重连时才由 RunRegistry 取消。
+    """
+    while True:
+        if await request.is_disconnected():
+            task.cancel()
+            return
+        await asyncio.sleep(interval)
+
+# 按 Accept-Encoding 协商 gzip/deflate 逐帧压缩 SSE；设为 0 关闭
+SSE_COMPRESSION = os.getenv("AGENT_SSE_COMPRESSION", "1") != "0"
+
+def _sse_response(run, after: int, request: Request, headers: dict):
+    encoding = negotiate_encoding(request.headers.get("accept-encoding")) if SSE_COMPRESSION else None
+
+    async def event_stream():
+        watcher = asyncio.create_task(_watch_disconnect(request, asyncio.current_task()))
+        try:
+            async for seq, entry in run.subscribe(after):
+                # SSE协议格式：id 行供断线重连（Last-Event-ID），data 行为事件 JSON，后加两个\n
+                yield format_event(entry, f"{run.run_id}:{seq}")
+        finally:
+            watcher.cancel()
+
+    headers = {"X-Session-Id": run.session_id, "X-Run-Id": run.run_id, "Vary": "Accept-Encoding", **headers}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return StreamingResponse(compress_stream(event_stream(), encoding), media_type="text/event-stream",
+                             headers=headers)
 
+def _resume(last_event_id: str | None, request: Request):
+    """
+    按 Last-Event-ID 重连到已有运行；运行已过保留期时返回 410，客户端应重新提问。
+    """
+    parsed = parse_last_event_id(last_event_id)
+    if parsed is None:
+        raise HTTPException(status_code=400, detail="无效的 Last-Event-ID")
+    run_id, after = parsed
+    run = RUNS.get(run_id)
+    if run is None:
+        raise HTTPException(status_code=410, detail="运行已结束且回放缓冲已过期，请重新提问")
+    return _sse_response(run, after, request, {})
 
 @app.post("/chat/stream")
-async def chat_stream(query: Query):
-    deep_thinking = query.options.get("deep_thinking", False)
-    web_search_mode = query.options.get("webSearchMode", "auto")
-    def event_stream():
-        for entry in agent_respond_stream(
-                query.message,
+async def chat_stream(query: Query, request: Request):
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id:
+        return _resume(last_event_id, request)
+
+    session_id = _session_id_from_options(query.options)
+    ticket = await _admit()
+    run = _launch_run(query.message, query.options, session_id, ticket)
+    return _sse_response(run, 0, request, {"X-Queue-Wait": f"{ticket.waited:.3f}"})
+
+def _time_budget_from_options(options: dict):
+    # 单轮时间预算（秒）：options.time_budget / timeBudget，缺省或非法时使用 AGENT_TIME_BUDGET_SECONDS
+    value = options.get("time_budget", options.get("timeBudget"))
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def _launch_run(message: str, options: dict, session_id: str, ticket):
+    """
+    在后台任务中启动一次 agent 运行（/chat/stream 与 /ws/chat 共用），名额随运行结束归还。
+    """
+    deep_thinking = options.get("deep_thinking", options.get("deepThinking", False))
+    web_search_mode = options.get("webSearchMode", "auto")
+    run = RUNS.create(session_id)
+
+    async def events():
+        # 对话运行在事件循环上的后台任务中，与发起它的连接解耦
+        async for entry in agent_respond_astream(
+                message,
                 deep_thinking=deep_thinking,
-                web_search_mode=web_search_mode
+                web_search_mode=web_search_mode,
+                session_id=session_id,
+                cancel_token=run.token,
+                time_budget=_time_budget_from_options(options),
         ):
             # 实时打印最终回复内容到后端终端
             if entry.get("type") == "chat":
                 print(f'[CHATBOT] {entry.get("content")}', flush=True)
-            # SSE协议格式，每个消息前加"data: "，后加两个\n
-            yield f"data: {json.dumps(entry, ensure_ascii=False)}\n\n"
-    return StreamingResponse(event_stream(), media_type="text/event-stream")
+            yield entry
+
+    run.start(events(), on_finish=ticket.release)
+    return run
+
+@app.get("/chat/stream/{run_id}")
+async def chat_stream_resume(run_id: str, request: Request, last_event_id: str | None = None):
+    # EventSource 自动重连会在请求头带上 Last-Event-ID；也可用查询参数 ?last_event_id= 指定
+    parsed = parse_last_event_id(request.headers.get("last-event-id") or last_event_id)
+    after = parsed[1] if parsed and parsed[0] == run_id else 0
+    return _resume(f"{run_id}:{after}", request)
+
+async def _ws_start_run(message: str, options: dict):
+    # 会话 id 非法时抛 ValueError、准入被拒时抛 AdmissionRejected，由 ChatSocket 转成 error 帧
+    session_id = normalize_session_id(options.get("session_id") or options.get("sessionId")) or new_session_id()
+    ticket = await ADMISSION.acquire()
+    return _launch_run(message, options, session_id, ticket)
+
+@app.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket):
+    # 一条连接多路复用多个并发运行：start / resume / cancel / credit，帧中带 run_id 与事件 id
+    await ChatSocket(websocket, RUNS, _ws_start_run,
+                     initial_credit=int(os.getenv("AGENT_WS_INITIAL_CREDIT", "64"))).serve()
+
+@app.get("/stats/llm")
+def llm_stats():
+    # 各模型档位（strong / fast）的调用次数、平均延迟与 token 用量，以及 LLM 调度器的排队情况
+    return llm_usage.stats()
+
+@app.get("/stats/usage")
+def usage_stats():
+    # 所有会话（进程内保留的）的累计 token 用量
+    return SESSION_USAGE.stats()
+
+@app.get("/stats/usage/{session_id}")
+def session_usage(session_id: str):
+    # 单个会话的累计 token 用量：轮数、prompt/completion/缓存命中 token，以及按节点的明细
+    usage = SESSION_USAGE.get(session_id)
+    if usage is None:
+        raise HTTPException(status_code=404, detail="会话不存在或尚无用量记录")
+    return {"session_id": session_id, **usage}
+
+@app.get("/stats/answer_cache")
+def answer_cache_stats():
+    # 答案缓存的条目数、命中率（含语义命中）与写入次数
+    return ANSWER_CACHE.stats()
+
+@app.get("/stats/singleflight")
+def singleflight_stats():
+    # 搜索/网页抓取/判定调用中被合并到进行中相同请求的次数
+    return singleflight.stats()
+
+@app.get("/stats/runs")
+def run_stats():
+    # 执行中与保留待回放的运行数
+    return RUNS.stats()
+
+@app.get("/metrics")
+def metrics():
+    # Prometheus 文本格式：节点/工具耗时直方图、首事件耗时、总耗时、planning 重选次数、错误计数等
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/stats/memory")
+def memory_stats():
+    # 会话 checkpoint 的内存占用（字节数/会话数/淘汰次数），供监控告警
+    stats = getattr(agent_config.MEMORY, "stats", None)
+    return stats() if stats else {}
+
+@app.get("/stats/admission")
+def admission_stats():
+    # 运行数、排队深度、拒绝次数与排队等待时间
+    return ADMISSION.stats()
+
+@app.get("/stats/cancel")
+def cancel_stats_view():
+    # 因客户端断开而取消的运行数与中止的工具请求数
+    return cancel_stats.stats()
 
 @app.get("/stream")
 def stream():
@@ -55,37 +371,67 @@ def stream():
             time.sleep(2)
     return StreamingResponse(event_stream(), media_type="text/event-stream")
 
+# 上传：磁盘 I/O 放到线程中执行，按 sha256 去重，大文件支持分片续传
+UPLOADS = UploadStore(
+    workspace_root=WORKSPACE_ROOT,
+    state_root=os.getenv("AGENT_UPLOAD_STATE_DIR", str(PROJECT_ROOT / ".uploads")),
+    max_bytes=int(os.getenv("AGENT_UPLOAD_MAX_BYTES", str(1024 ** 3))),
+    partial_ttl=float(os.getenv("AGENT_UPLOAD_PARTIAL_TTL_SECONDS", "86400")),
+)
+
+def _upload_http_error(e: UploadError) -> HTTPException:
+    detail = {"message": e.detail, **e.extra} if e.extra else e.detail
+    return HTTPException(status_code=e.status_code, detail=detail)
+
+class UploadInit(BaseModel):
+    filename: str
+    size: int
+    sha256: str | None = None
+
 @app.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
-    # 仅允许 txt 与 pdf
-    ext = Path(file.filename).suffix.lower()
-    allowed_exts = {".txt", ".pdf", ".md", ".json", ".docx"}
-    if ext not in allowed_exts:
-        raise HTTPException(status_code=400, detail=f"仅支持 {', '.join(allowed_exts)} 文件")
-
-    # 清理文件名，防止路径穿越
-    clean_name = Path(file.filename).name
-    dest_dir = Path(WORKSPACE_ROOT)
-    dest_dir.mkdir(parents=True, exist_ok=True)
-    dest_path = dest_dir / clean_name
-
-    # 若同名文件已存在，追加时间戳避免覆盖
-    if dest_path.exists():
-        stem = dest_path.stem
-        suffix = dest_path.suffix
-        clean_name = f"{stem}_{int(time.time())}{suffix}"
-        dest_path = dest_dir / clean_name
-
-    # 流式写入，避免占用过多内存
-    with open(dest_path, "wb") as out:
+    async def chunks():
+        # 流式读取，避免占用过多内存
         while True:
             chunk = await file.read(1024 * 1024)
             if not chunk:
                 break
-            out.write(chunk)
+            yield chunk
+    try:
+        return await UPLOADS.save_stream(file.filename, chunks())
+    except UploadError as e:
+        raise _upload_http_error(e)
+
+@app.post("/upload/init")
+async def upload_init(body: UploadInit):
+    # 分片上传第一步；带 sha256 且内容已存在时直接返回已有文件（done=true）
+    try:
+        return await UPLOADS.init(body.filename, body.size, body.sha256)
+    except UploadError as e:
+        raise _upload_http_error(e)
+
+@app.put("/upload/{upload_id}")
+async def upload_chunk(upload_id: str, request: Request, offset: int = 0):
+    # 请求体为原始字节；offset 必须等于服务端已接收的字节数，否则 409 并返回正确的 offset
+    try:
+        return await UPLOADS.write_chunk(upload_id, offset, request.stream())
+    except UploadError as e:
+        raise _upload_http_error(e)
+
+@app.get("/upload/{upload_id}")
+async def upload_status(upload_id: str):
+    # 断线后查询已接收字节数，从该 offset 继续上传
+    try:
+        return await UPLOADS.status(upload_id)
+    except UploadError as e:
+        raise _upload_http_error(e)
 
-    rel_path = str(Path(clean_name))  # 相对 workspace 的路径
-    return {"ok": True, "filename": clean_name, "path": rel_path}
+@app.post("/upload/{upload_id}/complete")
+async def upload_complete(upload_id: str):
+    try:
+        return await UPLOADS.complete(upload_id)
+    except UploadError as e:
+        raise _upload_http_error(e)
 
 # if __name__ == "__main__":
 #    uvicorn.run("main:app", port=8000, reload=True)
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple
+
+from agent.utils.cancel import CancelToken
+
+logger = logging.getLogger(__name__)
+
+
+# --------------------------
+# 可续传的 agent 运行
+# - 每次运行在后台任务中执行，与 HTTP 连接解耦；产生的事件带单调递增的序号，存入有界回放缓冲区
+# - 客户端断线重连时带上 Last-Event-ID，从缓冲区补发错过的事件后继续实时推送，不会重新执行图
+# - 所有订阅者都断开后等待 grace 秒，仍无人重连才取消运行（取消传递到图、LLM 与工具请求）
+# - 同一条消息的连续 chat_delta 在缓冲区中合并存储，回放时按序号切出客户端未收到的部分
+# --------------------------
+class _Entry:
+    __slots__ = ("first", "last", "event", "pieces")
+
+    def __init__(self, seq: int, event: Dict[str, Any]):
+        self.first = seq
+        self.last = seq
+        self.event = event
+        self.pieces: Optional[List[str]] = [event.get("content", "")] if event.get("type") == "chat_delta" else None
+
+    def can_merge(self, event: Dict[str, Any]) -> bool:
+        return (self.pieces is not None and event.get("type") == "chat_delta"
+                and (event.get("meta") or {}).get("id") == (self.event.get("meta") or {}).get("id"))
+
+    def merge(self, seq: int, event: Dict[str, Any]):
+        self.pieces.append(event.get("content", ""))
+        self.last = seq
+
+    def replay(self, after: int) -> Tuple[int, Dict[str, Any]]:
+        if self.pieces is None:
+            return self.last, self.event
+        start = max(0, after - self.first + 1)
+        return self.last, {**self.event, "content": "".join(self.pieces[start:])}
+
+
+class Run:
+    def __init__(self, run_id: str, session_id: str, buffer_events: int, grace_seconds: float):
+        self.run_id = run_id
+        self.session_id = session_id
+        self.token = CancelToken()
+        self.grace_seconds = grace_seconds
+        self.created_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self.last_seq = 0
+        self._buffer: Deque[_Entry] = deque(maxlen=max(16, buffer_events))
+        self._cond = asyncio.Condition()
+        self._task: Optional[asyncio.Task] = None
+        self._subscribers = 0
+        self._grace_handle: Optional[asyncio.TimerHandle] = None
+        self._on_finish: List[Callable[[], None]] = []
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    # ---- 生产端 ----
+    def start(self, events: AsyncIterator[Dict[str, Any]], on_finish: Optional[Callable[[], None]] = None):
+        if on_finish:
+            self._on_finish.append(on_finish)
+        self._task = asyncio.create_task(self._drive(events), name=f"agent-run-{self.run_id}")
+
+    async def _drive(self, events: AsyncIterator[Dict[str, Any]]):
+        try:
+            async for entry in events:
+                await self.publish(entry)
+        except asyncio.CancelledError:
+            await self.publish({"type": "cancelled", "content": self.token.reason or "cancelled", "is_final": True})
+        except Exception as e:
+            logger.exception(f"[run] {self.run_id} failed")
+            await self.publish({"type": "error", "content": f"{type(e).__name__}: {e}", "is_final": True})
+        finally:
+            self.finished_at = time.monotonic()
+            self._cancel_grace()
+            async with self._cond:
+                self._cond.notify_all()
+            for fn in self._on_finish:
+                fn()
+
+    async def publish(self, event: Dict[str, Any]):
+        self.last_seq += 1
+        if self._buffer and self._buffer[-1].can_merge(event):
+            self._buffer[-1].merge(self.last_seq, event)
+        else:
+            self._buffer.append(_Entry(self.last_seq, event))
+        async with self._cond:
+            self._cond.notify_all()
+
+    def cancel(self, reason: str = "cancelled"):
+        self.token.cancel(reason)
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    # ---- 消费端 ----
+    def _since(self, after: int) -> List[Tuple[int, Dict[str, Any]]]:
+        out = []
+        if self._buffer and after < self._buffer[0].first - 1:
+            # 客户端落后太多，部分事件已被挤出缓冲区
+            out.append((self._buffer[0].first - 1, {"type": "replay_gap", "missed_from": after + 1,
+                                                    "resume_from": self._buffer[0].first, "is_final": False}))
+        for entry in self._buffer:
+            if entry.last > after:
+                out.append(entry.replay(after))
+        return out
+
+    async def subscribe(self, after: int = 0) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """
+        先回放 seq > after 的缓冲事件，再实时推送，直到运行结束。
+        """
+        self._attach()
+        try:
+            cursor = after
+            while True:
+                for seq, event in self._since(cursor):
+                    cursor = max(cursor, seq)
+                    yield seq, event
+                if self.done and cursor >= self.last_seq:
+                    return
+                async with self._cond:
+                    await self._cond.wait_for(lambda: self.last_seq > cursor or self.done)
+        finally:
+            self._detach()
+
+    def _attach(self):
+        self._subscribers += 1
+        self._cancel_grace()
+
+    def _detach(self):
+        self._subscribers -= 1
+        if self._subscribers <= 0 and not self.done:
+            loop = asyncio.get_running_loop()
+            self._grace_handle = loop.call_later(self.grace_seconds, self._grace_expired)
+
+    def _cancel_grace(self):
+        if self._grace_handle is not None:
+            self._grace_handle.cancel()
+            self._grace_handle = None
+
+    def _grace_expired(self):
+        self._grace_handle = None
+        if self._subscribers <= 0 and not self.done:
+            logger.info(f"[run] {self.run_id} has no subscribers for {self.grace_seconds}s, cancelling")
+            self.cancel("client_disconnected")
+
+
+class RunRegistry:
+    def __init__(self, buffer_events: int = 2000, grace_seconds: float = 30.0, retention_seconds: float = 300.0):
+        self.buffer_events = buffer_events
+        self.grace_seconds = grace_seconds
+        self.retention_seconds = retention_seconds
+        self._runs: Dict[str, Run] = {}
+
+    def create(self, session_id: str) -> Run:
+        self.gc()
+        run = Run(uuid.uuid4().hex, session_id, self.buffer_events, self.grace_seconds)
+        self._runs[run.run_id] = run
+        return run
+
+    def get(self, run_id: str) -> Optional[Run]:
+        return self._runs.get(run_id)
+
+    def gc(self):
+        # 已结束的运行保留 retention 秒，供迟到的重连回放
+        now = time.monotonic()
+        for run_id, run in list(self._runs.items()):
+            if run.done and now - run.finished_at > self.retention_seconds:
+                del self._runs[run_id]
+
+    def stats(self) -> Dict[str, int]:
+        active = sum(1 for r in self._runs.values() if not r.done)
+        return {"active": active, "retained": len(self._runs) - active}
+
+
+def parse_last_event_id(value: Optional[str]) -> Optional[Tuple[str, int]]:
+    """
+    Last-Event-ID 格式为 "<run_id>:<seq>"；无法解析返回 None。
+    """
+    if not value or ":" not in value:
+        return None
+    run_id, _, seq = value.rpartition(":")
+    try:
+        return run_id, int(seq)
+    except ValueError:
+        return None
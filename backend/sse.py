@@ -0,0 +1,56 @@
+import json
+import zlib
+from typing import Any, AsyncIterator, Dict, Optional
+
+
+# --------------------------
+# SSE 帧与流式压缩
+# - Starlette 的 GZipMiddleware 不压缩 text/event-stream（整体缓冲会破坏实时性），这里按帧压缩：
+#   整个响应共用一个 zlib 压缩上下文，每帧后 Z_SYNC_FLUSH，浏览器可立即解出该帧；
+#   相邻事件的重复字段（type/meta/链接域名……）由共享字典压掉，搜索类事件体积通常降到 1/4 以下
+# - 编码按请求的 Accept-Encoding 协商：gzip 优先，其次 deflate，都不支持则不压缩
+# --------------------------
+_WBITS = {"gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+
+
+def format_event(event: Dict[str, Any], event_id: Optional[str] = None) -> str:
+    head = f"id: {event_id}\n" if event_id else ""
+    # 紧凑 JSON：不输出多余空格
+    return f"{head}data: {json.dumps(event, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    解析 Accept-Encoding（含 q 值），返回 "gzip" / "deflate" / None。
+    """
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for name in ("gzip", "deflate"):
+        if accepted.get(name, accepted.get("*", 0.0)) > 0:
+            return name
+    return None
+
+
+async def compress_stream(frames: AsyncIterator[str], encoding: Optional[str]) -> AsyncIterator[bytes]:
+    """
+    把 SSE 文本帧编码为字节流；encoding 为 None 时只做 UTF-8 编码。
+    """
+    if encoding is None:
+        async for frame in frames:
+            yield frame.encode("utf-8")
+        return
+    compressor = zlib.compressobj(6, zlib.DEFLATED, _WBITS[encoding])
+    async for frame in frames:
+        yield compressor.compress(frame.encode("utf-8")) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush(zlib.Z_FINISH)
@@ -0,0 +1,264 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Optional
+
+ALLOWED_EXTS = {".txt", ".pdf", ".md", ".json", ".docx"}
+HASH_CHUNK = 1024 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, status_code: int, detail: str, **extra):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.extra = extra
+
+
+# --------------------------
+# 上传存储
+# - 磁盘读写全部通过 asyncio.to_thread 执行，不阻塞事件循环上的其他流式对话
+# - 边写边计算 sha256；内容相同的文件只保留一份，重复上传直接返回已有文件
+# - 大文件分片续传：init -> PUT 分片（带 offset）-> complete；断线后 GET 状态拿到已接收字节数继续上传
+# - 去重索引与未完成的分片放在工作区之外（默认 <项目根>/.uploads），不会被 docs_use 检索到
+# --------------------------
+class UploadStore:
+    def __init__(self, workspace_root: str, state_root: str, max_bytes: int, partial_ttl: float):
+        self.workspace = Path(workspace_root)
+        self.state_root = Path(state_root)
+        self.partial_dir = self.state_root / "partial"
+        self.index_path = self.state_root / "index.json"
+        self.max_bytes = max_bytes
+        self.partial_ttl = partial_ttl
+        self._index: Optional[Dict[str, str]] = None  # sha256 -> 工作区内文件名
+        self._index_lock = threading.Lock()
+        self._hashers: Dict[str, Any] = {}  # upload_id -> 进行中的 sha256 状态
+        # upload_id -> [锁, 进行中的请求数]；只在事件循环上读写
+        self._upload_locks: Dict[str, list] = {}
+
+    # ---- 公共校验 ----
+    @staticmethod
+    def clean_filename(filename: str) -> str:
+        # 清理文件名，防止路径穿越
+        clean_name = Path(filename or "").name
+        ext = Path(clean_name).suffix.lower()
+        if not clean_name or ext not in ALLOWED_EXTS:
+            raise UploadError(400, f"仅支持 {', '.join(sorted(ALLOWED_EXTS))} 文件")
+        return clean_name
+
+    # ---- 去重索引 ----
+    def _load_index(self) -> Dict[str, str]:
+        if self._index is None:
+            try:
+                self._index = json.loads(self.index_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def _save_index(self):
+        self.state_root.mkdir(parents=True, exist_ok=True)
+        tmp = self.index_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self._index, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.index_path)
+
+    def _lookup(self, digest: str, size: Optional[int] = None) -> Optional[str]:
+        with self._index_lock:
+            name = self._load_index().get(digest)
+            if name is None:
+                return None
+            path = self.workspace / name
+            # 文件已被删除或改动：索引项失效
+            if not path.is_file() or (size is not None and path.stat().st_size != size):
+                del self._index[digest]
+                self._save_index()
+                return None
+            return name
+
+    def _remember(self, digest: str, name: str):
+        with self._index_lock:
+            self._load_index()[digest] = name
+            self._save_index()
+
+    @staticmethod
+    def _hash_file(path: Path) -> str:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_CHUNK), b""):
+                h.update(block)
+        return h.hexdigest()
+
+    def _finalize(self, tmp: Path, filename: str, digest: str, size: int) -> Dict[str, Any]:
+        """
+        （线程中执行）把已写完的临时文件落到工作区；内容重复时删除临时文件并返回已有文件。
+        """
+        existing = self._lookup(digest, size)
+        if existing:
+            tmp.unlink(missing_ok=True)
+            return {"ok": True, "filename": existing, "path": existing, "sha256": digest, "deduplicated": True}
+
+        self.workspace.mkdir(parents=True, exist_ok=True)
+        name = filename
+        dest = self.workspace / name
+        if dest.exists():
+            # 同名文件：内容相同（索引之外的旧文件）直接复用，否则追加时间戳避免覆盖
+            if dest.stat().st_size == size and self._hash_file(dest) == digest:
+                tmp.unlink(missing_ok=True)
+                self._remember(digest, name)
+                return {"ok": True, "filename": name, "path": name, "sha256": digest, "deduplicated": True}
+            name = f"{dest.stem}_{int(time.time())}{dest.suffix}"
+            dest = self.workspace / name
+        os.replace(tmp, dest)
+        self._remember(digest, name)
+        return {"ok": True, "filename": name, "path": name, "sha256": digest, "deduplicated": False}
+
+    # ---- 一次性上传 ----
+    async def save_stream(self, filename: str, chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+        clean_name = self.clean_filename(filename)
+        await asyncio.to_thread(self.partial_dir.mkdir, parents=True, exist_ok=True)
+        tmp = self.partial_dir / f"{uuid.uuid4().hex}.tmp"
+        h = hashlib.sha256()
+        size = 0
+        out = await asyncio.to_thread(open, tmp, "wb")
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise UploadError(413, f"文件超过上限 {self.max_bytes} 字节")
+                h.update(chunk)
+                await asyncio.to_thread(out.write, chunk)
+        except BaseException:
+            await asyncio.to_thread(out.close)
+            await asyncio.to_thread(tmp.unlink, missing_ok=True)
+            raise
+        await asyncio.to_thread(out.close)
+        return await asyncio.to_thread(self._finalize, tmp, clean_name, h.hexdigest(), size)
+
+    # ---- 分片续传 ----
+    def _meta_path(self, upload_id: str) -> Path:
+        if not upload_id.isalnum():
+            raise UploadError(404, "上传任务不存在")
+        return self.partial_dir / f"{upload_id}.json"
+
+    def _read_meta(self, upload_id: str) -> Dict[str, Any]:
+        try:
+            return json.loads(self._meta_path(upload_id).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            raise UploadError(404, "上传任务不存在或已过期")
+
+    def _part_path(self, upload_id: str) -> Path:
+        return self.partial_dir / f"{upload_id}.part"
+
+    def _gc_partials(self):
+        # 清理超过 TTL 未完成的分片上传
+        if not self.partial_dir.is_dir():
+            return
+        cutoff = time.time() - self.partial_ttl
+        for path in self.partial_dir.iterdir():
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    # 对应的哈希状态一并丢弃（锁只在请求进行中存在，无需清理）
+                    self._hashers.pop(path.stem, None)
+            except OSError:
+                continue
+
+    def _init(self, filename: str, size: int, sha256: Optional[str]) -> Dict[str, Any]:
+        clean_name = self.clean_filename(filename)
+        if size < 0 or size > self.max_bytes:
+            raise UploadError(413, f"文件超过上限 {self.max_bytes} 字节")
+        # 客户端预先给出哈希且内容已存在：秒传
+        if sha256:
+            existing = self._lookup(sha256.lower(), size)
+            if existing:
+                return {"ok": True, "done": True, "filename": existing, "path": existing,
+                        "sha256": sha256.lower(), "deduplicated": True}
+        self._gc_partials()
+        self.partial_dir.mkdir(parents=True, exist_ok=True)
+        upload_id = uuid.uuid4().hex
+        meta = {"filename": clean_name, "size": size, "sha256": sha256.lower() if sha256 else None,
+                "created": time.time()}
+        self._meta_path(upload_id).write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        self._part_path(upload_id).touch()
+        self._hashers[upload_id] = (0, hashlib.sha256())
+        return {"ok": True, "done": False, "upload_id": upload_id, "offset": 0, "size": size}
+
+    async def init(self, filename: str, size: int, sha256: Optional[str] = None) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._init, filename, size, sha256)
+
+    def _status(self, upload_id: str) -> Dict[str, Any]:
+        meta = self._read_meta(upload_id)
+        part = self._part_path(upload_id)
+        offset = part.stat().st_size if part.exists() else 0
+        return {"upload_id": upload_id, "filename": meta["filename"], "size": meta["size"], "offset": offset}
+
+    async def status(self, upload_id: str) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._status, upload_id)
+
+    @asynccontextmanager
+    async def _locked(self, upload_id: str):
+        # 同一上传任务的请求串行；锁只在有请求进行中时存在，最后一个请求结束（含 complete）即删除，
+        # 被放弃或伪造的 upload_id 不会在锁表中留下条目
+        entry = self._upload_locks.get(upload_id)
+        if entry is None:
+            entry = self._upload_locks[upload_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] <= 0 and self._upload_locks.get(upload_id) is entry:
+                del self._upload_locks[upload_id]
+
+    async def write_chunk(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+        async with self._locked(upload_id):
+            state = await self.status(upload_id)
+            if offset != state["offset"]:
+                # 偏移不一致（重复或乱序的分片）：返回服务端实际已接收的字节数，客户端从这里继续
+                raise UploadError(409, "offset 与已接收字节数不一致", offset=state["offset"])
+            hashed_upto, h = self._hashers.get(upload_id, (None, None))
+            if hashed_upto != offset:
+                h = None  # 进程重启或状态丢失：complete 时重新计算整体哈希
+            received = offset
+            out = await asyncio.to_thread(open, self._part_path(upload_id), "ab")
+            try:
+                async for chunk in chunks:
+                    received += len(chunk)
+                    if received > state["size"]:
+                        raise UploadError(413, "分片超出声明的文件大小")
+                    if h is not None:
+                        h.update(chunk)
+                    await asyncio.to_thread(out.write, chunk)
+            finally:
+                await asyncio.to_thread(out.close)
+                if h is not None:
+                    self._hashers[upload_id] = (received, h)
+                else:
+                    self._hashers.pop(upload_id, None)
+            return {**state, "offset": received}
+
+    def _complete(self, upload_id: str) -> Dict[str, Any]:
+        meta = self._read_meta(upload_id)
+        part = self._part_path(upload_id)
+        size = part.stat().st_size
+        if size != meta["size"]:
+            raise UploadError(409, "文件尚未上传完整", offset=size)
+        hashed_upto, h = self._hashers.pop(upload_id, (None, None))
+        digest = h.hexdigest() if h is not None and hashed_upto == size else self._hash_file(part)
+        if meta.get("sha256") and meta["sha256"] != digest:
+            part.unlink(missing_ok=True)
+            self._meta_path(upload_id).unlink(missing_ok=True)
+            raise UploadError(400, "文件校验失败（sha256 不一致），请重新上传")
+        result = self._finalize(part, meta["filename"], digest, size)
+        self._meta_path(upload_id).unlink(missing_ok=True)
+        return result
+
+    async def complete(self, upload_id: str) -> Dict[str, Any]:
+        async with self._locked(upload_id):
+            return await asyncio.to_thread(self._complete, upload_id)
@@ -0,0 +1,175 @@
+import asyncio
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from backend.admission import AdmissionRejected
+from backend.runs import Run, RunRegistry
+
+logger = logging.getLogger(__name__)
+
+
+# --------------------------
+# WebSocket 多路复用
+# - 一条连接上并行多个 agent 运行，每帧带 run_id 与事件序号 id，事件本身与 /chat/stream 完全相同
+# - 客户端消息：
+#     {"type": "start", "message": ..., "options": {...}, "ref": 任意客户端标识}
+#     {"type": "resume", "run_id": ..., "session_id": ..., "last_id": 已收到的最大序号}
+#     {"type": "cancel", "run_id": ...}
+#     {"type": "credit", "run_id": ..., "n": 追加可接收的事件数}
+# - 服务端帧：started / event / end / error
+# - 归属：连接只能取消自己启动或已续接的运行；续接其他连接启动的运行需提供该运行的 session_id
+# - 流控：每个运行有独立的信用额度，额度耗尽时暂停推送（事件继续进入运行的回放缓冲，不阻塞 agent）
+# --------------------------
+# 单条 credit 消息最多追加的额度
+MAX_CREDIT_PER_FRAME = 1024
+
+
+def _non_negative_int(msg: Dict[str, Any], key: str) -> int:
+    # 客户端帧中的计数字段：缺省为 0，非整数或负数视为格式错误
+    value = msg.get(key)
+    if value is None:
+        return 0
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"{key} must be a non-negative integer")
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f"{key} must be a non-negative integer") from None
+    if value < 0:
+        raise ValueError(f"{key} must be a non-negative integer")
+    return value
+
+
+class _Subscription:
+    def __init__(self, run: Run, credit: int):
+        self.run = run
+        self.credit = asyncio.Semaphore(credit)
+        self.task: asyncio.Task | None = None
+
+
+class ChatSocket:
+    def __init__(self, websocket: WebSocket, runs: RunRegistry,
+                 start_run: Callable[[str, Dict[str, Any]], Awaitable[Run]], initial_credit: int = 64):
+        self.ws = websocket
+        self.runs = runs
+        self.start_run = start_run
+        self.initial_credit = max(1, initial_credit)
+        self._subs: Dict[str, _Subscription] = {}
+        # 本连接启动或已续接的 run_id
+        self._owned: set[str] = set()
+        self._pending: set[asyncio.Task] = set()
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, frame: Dict[str, Any]):
+        # 多个运行的推送任务共用一条连接，串行写出
+        async with self._send_lock:
+            await self.ws.send_json(frame)
+
+    async def serve(self):
+        await self.ws.accept()
+        try:
+            while True:
+                try:
+                    msg = json.loads(await self.ws.receive_text())
+                except ValueError:
+                    await self.send({"type": "error", "status": 400, "detail": "invalid JSON"})
+                    continue
+                await self._dispatch(msg if isinstance(msg, dict) else {})
+        except WebSocketDisconnect:
+            pass
+        finally:
+            # 连接断开只停止推送；运行在宽限期内无人重连（SSE 或新连接）才会被取消
+            for task in list(self._pending):
+                task.cancel()
+            for sub in self._subs.values():
+                if sub.task:
+                    sub.task.cancel()
+
+    async def _dispatch(self, msg: Dict[str, Any]):
+        # 格式错误的帧只对该 run_id 回复错误，不影响同一连接上的其他运行
+        try:
+            await self._handle(msg)
+        except ValueError as e:
+            await self.send({"type": "error", "run_id": msg.get("run_id"), "status": 400, "detail": str(e)})
+
+    async def _handle(self, msg: Dict[str, Any]):
+        kind = msg.get("type")
+        run_id = msg.get("run_id")
+        if run_id is not None and not isinstance(run_id, str):
+            raise ValueError("run_id must be a string")
+        if kind == "start":
+            # 准入可能排队，放到独立任务里，不阻塞同一连接上的其他消息
+            self._spawn(self._start(msg))
+        elif kind == "resume":
+            last_id = _non_negative_int(msg, "last_id")
+            run = self.runs.get(run_id)
+            if run is None:
+                await self.send({"type": "error", "run_id": run_id, "status": 410, "detail": "run expired"})
+                return
+            if run_id not in self._owned and msg.get("session_id") != run.session_id:
+                await self.send({"type": "error", "run_id": run_id, "status": 403,
+                                 "detail": "run belongs to another session"})
+                return
+            self._owned.add(run_id)
+            self._subscribe(run, last_id)
+        elif kind == "cancel":
+            if run_id not in self._owned:
+                await self.send({"type": "error", "run_id": run_id, "status": 403,
+                                 "detail": "run was not started or resumed on this connection"})
+                return
+            run = self.runs.get(run_id)
+            if run is not None:
+                run.cancel("client_cancelled")
+        elif kind == "credit":
+            n = min(_non_negative_int(msg, "n"), MAX_CREDIT_PER_FRAME)
+            sub = self._subs.get(run_id)
+            if sub is not None:
+                for _ in range(n):
+                    sub.credit.release()
+        else:
+            await self.send({"type": "error", "status": 400, "detail": f"unknown message type: {kind!r}"})
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _start(self, msg: Dict[str, Any]):
+        ref = msg.get("ref")
+        try:
+            run = await self.start_run(str(msg.get("message") or ""), dict(msg.get("options") or {}))
+        except AdmissionRejected as e:
+            await self.send({"type": "error", "ref": ref, "status": e.status_code, "detail": e.reason,
+                             "retry_after": e.retry_after})
+            return
+        except (TypeError, ValueError) as e:
+            await self.send({"type": "error", "ref": ref, "status": 400, "detail": str(e)})
+            return
+        self._owned.add(run.run_id)
+        await self.send({"type": "started", "ref": ref, "run_id": run.run_id, "session_id": run.session_id})
+        self._subscribe(run, 0)
+
+    def _subscribe(self, run: Run, after: int):
+        old = self._subs.pop(run.run_id, None)
+        if old and old.task:
+            old.task.cancel()
+        sub = _Subscription(run, self.initial_credit)
+        self._subs[run.run_id] = sub
+        sub.task = asyncio.create_task(self._pump(sub, after))
+
+    async def _pump(self, sub: _Subscription, after: int):
+        run = sub.run
+        try:
+            async for seq, entry in run.subscribe(after):
+                await sub.credit.acquire()
+                await self.send({"type": "event", "run_id": run.run_id, "id": seq, "event": entry})
+            await self.send({"type": "end", "run_id": run.run_id, "id": run.last_seq})
+        except (WebSocketDisconnect, RuntimeError):
+            # 连接已关闭，写出失败；由 serve 收尾
+            pass
+        finally:
+            if self._subs.get(run.run_id) is sub:
+                del self._subs[run.run_id]
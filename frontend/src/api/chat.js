@@ -19,45 +19,136 @@ export async function fetchAgentReply(message, options = {}) {
   }
 }
 
+// 会话 id：同一页面（标签页）内的多轮对话共用一个后端会话，不同标签页互相隔离
+export function getSessionId() {
+  let sid = sessionStorage.getItem('collab-ai-session-id')
+  if (!sid) {
+    sid = (crypto.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(16).slice(2)}`).replace(/-/g, '')
+    sessionStorage.setItem('collab-ai-session-id', sid)
+  }
+  return sid
+}
+
+// 解析一帧 SSE：返回 { id, data }，无 data 行时 data 为 null
+function parseSseFrame(frame) {
+  let id = null
+  const data = []
+  for (const line of frame.split('\n')) {
+    if (line.startsWith('id: ')) id = line.slice(4)
+    else if (line.startsWith('data: ')) data.push(line.slice(6))
+  }
+  return { id, data: data.length ? data.join('\n') : null }
+}
+
+const MAX_RESUME_ATTEMPTS = 5
+
 export async function fetchAgentReplyStream(message, options = {}, onData) {
   const controller = new AbortController()
-  const payload = { message, options }
-  const resp = await fetch('http://localhost:8000/chat/stream', {
-    method: 'POST',
-    body: JSON.stringify(payload),
-    headers: { 'Content-Type': 'application/json' },
-    signal: controller.signal
-  })
-  const reader = resp.body.getReader()
-  const decoder = new TextDecoder('utf-8')
-  let buffer = ''
+  const payload = { message, options: { sessionId: getSessionId(), ...options } }
+  // 最近收到的事件 id（"<run_id>:<seq>"）；连接中断后凭它重连，后端补发错过的事件，不会重新执行
+  let lastEventId = null
+  let attempts = 0
   // eslint-disable-next-line no-constant-condition
   while (true) {
-    const { done, value } = await reader.read()
-    if (done) break
-    buffer += decoder.decode(value, { stream: true })
-    let idx
-    while ((idx = buffer.indexOf('\n\n')) !== -1) {
-      const chunk = buffer.slice(0, idx)
-      buffer = buffer.slice(idx + 2)
-      if (chunk.startsWith('data: ')) {
-        const line = chunk.slice(6)
-        try {
-          console.log('收到流式数据:', line) // 直接打印原始字符串
-          const parsed = JSON.parse(line)
-          console.log('解析后的对象:', parsed) // 打印解析后的对象
-          onData(parsed)
-        } catch (err) {
-          console.warn('JSON parse error:', err, line)
+    const headers = { 'Content-Type': 'application/json' }
+    if (lastEventId) headers['Last-Event-ID'] = lastEventId
+    try {
+      const resp = await fetch('http://localhost:8000/chat/stream', {
+        method: 'POST',
+        body: JSON.stringify(payload),
+        headers,
+        signal: controller.signal
+      })
+      if (!resp.ok) throw Object.assign(new Error(`HTTP ${resp.status}`), { status: resp.status })
+      const reader = resp.body.getReader()
+      const decoder = new TextDecoder('utf-8')
+      let buffer = ''
+      let finished = false
+      // eslint-disable-next-line no-constant-condition
+      while (true) {
+        const { done, value } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+        let idx
+        while ((idx = buffer.indexOf('\n\n')) !== -1) {
+          const chunk = buffer.slice(0, idx)
+          buffer = buffer.slice(idx + 2)
+          const frame = parseSseFrame(chunk)
+          if (frame.id) lastEventId = frame.id
+          if (frame.data === null) continue
+          try {
+            const parsed = JSON.parse(frame.data)
+            if (parsed.is_final) finished = true
+            onData(parsed)
+          } catch (err) {
+            console.warn('JSON parse error:', err, frame.data)
+          }
         }
       }
+      if (finished || !lastEventId) break
+      throw new Error('stream closed before final event')
+    } catch (err) {
+      // 主动中断、未拿到事件 id、或运行已过期（410）时不再重连
+      if (controller.signal.aborted || !lastEventId || err.status === 410 || err.status === 400) throw err
+      if (++attempts > MAX_RESUME_ATTEMPTS) throw err
+      console.warn(`流式连接中断，第 ${attempts} 次重连`, err)
+      await new Promise((r) => setTimeout(r, Math.min(1000 * attempts, 5000)))
     }
   }
   // 返回 controller 以便后续中断流式（可选）
   return controller
 }
 
+// 超过该大小的文件走分片续传：每片失败后查询服务端已接收的 offset 并从那里继续
+const CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024
+const UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+const MAX_CHUNK_RETRIES = 5
+
+async function readUploadError(resp, fallback) {
+  try {
+    const err = await resp.json()
+    return err?.detail?.message || err?.detail || fallback
+  } catch (_) {
+    return fallback
+  }
+}
+
+async function uploadFileChunked(file) {
+  const base = 'http://localhost:8000/upload'
+  const initResp = await fetch(`${base}/init`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ filename: file.name, size: file.size })
+  })
+  if (!initResp.ok) throw new Error(await readUploadError(initResp, '上传失败'))
+  const init = await initResp.json()
+  if (init.done) return init
+  let offset = init.offset
+  let retries = 0
+  while (offset < file.size) {
+    try {
+      const resp = await fetch(`${base}/${init.upload_id}?offset=${offset}`, {
+        method: 'PUT',
+        body: file.slice(offset, offset + UPLOAD_CHUNK_SIZE)
+      })
+      if (!resp.ok) throw new Error(await readUploadError(resp, '分片上传失败'))
+      offset = (await resp.json()).offset
+      retries = 0
+    } catch (e) {
+      if (++retries > MAX_CHUNK_RETRIES) throw e
+      await new Promise((r) => setTimeout(r, 1000 * retries))
+      const status = await fetch(`${base}/${init.upload_id}`)
+      if (!status.ok) throw e
+      offset = (await status.json()).offset
+    }
+  }
+  const done = await fetch(`${base}/${init.upload_id}/complete`, { method: 'POST' })
+  if (!done.ok) throw new Error(await readUploadError(done, '上传失败'))
+  return done.json()
+}
+
 export async function uploadFile(file) {
+  if (file.size > CHUNKED_UPLOAD_THRESHOLD) return uploadFileChunked(file)
   const form = new FormData()
   form.append('file', file, file.name)
   const resp = await fetch('http://localhost:8000/upload', {
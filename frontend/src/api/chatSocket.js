@@ -0,0 +1,100 @@
+// WebSocket 多路复用客户端：一条连接上并行多个对话运行，事件格式与 /chat/stream 相同
+// 用法：const run = await startAgentRun(text, options, onData)；run.cancel() 取消该运行
+import { getSessionId } from './chat.js'
+
+const WS_URL = 'ws://localhost:8000/ws/chat'
+// 每处理完这么多事件向服务端补充一次信用额度（服务端初始额度默认 64）
+const CREDIT_BATCH = 32
+
+let socket = null
+let opening = null
+let refSeq = 0
+const pendingStarts = new Map() // ref -> { resolve, reject, onData }
+const runs = new Map() // run_id -> { onData, sessionId, lastId, consumed }
+
+function send(msg) {
+  socket.send(JSON.stringify(msg))
+}
+
+function handleFrame(frame) {
+  if (frame.type === 'started') {
+    const pending = pendingStarts.get(frame.ref)
+    if (!pending) return
+    pendingStarts.delete(frame.ref)
+    runs.set(frame.run_id, { onData: pending.onData, sessionId: frame.session_id, lastId: 0, consumed: 0 })
+    pending.resolve(frame.run_id)
+    return
+  }
+  if (frame.type === 'event') {
+    const run = runs.get(frame.run_id)
+    if (!run || frame.id <= run.lastId) return
+    run.lastId = frame.id
+    run.onData(frame.event)
+    if (++run.consumed >= CREDIT_BATCH) {
+      send({ type: 'credit', run_id: frame.run_id, n: run.consumed })
+      run.consumed = 0
+    }
+    return
+  }
+  if (frame.type === 'end') {
+    runs.delete(frame.run_id)
+    return
+  }
+  if (frame.type === 'error') {
+    const pending = frame.ref !== undefined && pendingStarts.get(frame.ref)
+    if (pending) {
+      pendingStarts.delete(frame.ref)
+      pending.reject(Object.assign(new Error(frame.detail), { status: frame.status, retryAfter: frame.retry_after }))
+    } else {
+      console.warn('chat socket error', frame)
+    }
+  }
+}
+
+function connect() {
+  if (socket && socket.readyState === WebSocket.OPEN) return Promise.resolve(socket)
+  if (opening) return opening
+  opening = new Promise((resolve, reject) => {
+    const ws = new WebSocket(WS_URL)
+    ws.onopen = () => {
+      socket = ws
+      opening = null
+      // 重连后续传未结束的运行：服务端核对 session_id 后从回放缓冲补发 lastId 之后的事件
+      for (const [runId, run] of runs) {
+        send({ type: 'resume', run_id: runId, session_id: run.sessionId, last_id: run.lastId })
+      }
+      resolve(ws)
+    }
+    ws.onmessage = (ev) => {
+      try {
+        handleFrame(JSON.parse(ev.data))
+      } catch (err) {
+        console.warn('chat socket frame parse error:', err, ev.data)
+      }
+    }
+    ws.onclose = () => {
+      socket = null
+      opening = null
+      for (const pending of pendingStarts.values()) pending.reject(new Error('连接已断开'))
+      pendingStarts.clear()
+      if (runs.size) setTimeout(() => connect().catch(() => {}), 1000)
+    }
+    ws.onerror = (err) => reject(err)
+  })
+  return opening
+}
+
+export async function startAgentRun(message, options = {}, onData) {
+  await connect()
+  const ref = String(++refSeq)
+  const runId = await new Promise((resolve, reject) => {
+    pendingStarts.set(ref, { resolve, reject, onData })
+    send({ type: 'start', ref, message, options: { sessionId: getSessionId(), ...options } })
+  })
+  return {
+    runId,
+    cancel() {
+      if (socket) send({ type: 'cancel', run_id: runId })
+    }
+  }
+}
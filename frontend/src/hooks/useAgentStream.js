@@ -1,3 +1,13 @@
+// 事件中不再携带 favicon，按链接域名生成
+function withFavicon(item) {
+  if (item.favicon || !item.link) return item
+  try {
+    return { ...item, favicon: `https://www.google.com/s2/favicons?domain=${new URL(item.link).host}` }
+  } catch (e) {
+    return item
+  }
+}
+
 // Agent 流式回复管理：创建占位、处理分片回调、落盘思维与工具调用结果
 // 依赖：messages（响应式）、pushAgentPlaceholder、setWebLinksToMsg、fetchAgentReplyStream
 export function useAgentStream({ messages, pushAgentPlaceholder, setWebLinksToMsg, fetchAgentReplyStream }) {
@@ -9,13 +19,18 @@ export function useAgentStream({ messages, pushAgentPlaceholder, setWebLinksToMs
       return
     }
     if (tool === 'google_search') {
-      let results = []
-      try {
-        results = JSON.parse(content)
-      } catch (e) {
-        // ESLint: 避免空 catch（no-empty），并保证 results 为数组
-        results = []
+      // 新版事件直接下发数组；兼容旧版的 JSON 字符串
+      let results = content
+      if (typeof content === 'string') {
+        try {
+          results = JSON.parse(content)
+        } catch (e) {
+          // ESLint: 避免空 catch（no-empty），并保证 results 为数组
+          results = []
+        }
       }
+      if (!Array.isArray(results)) results = []
+      results = results.map(withFavicon)
       setWebLinksToMsg(msg.id, results)
       const n = Array.isArray(results) ? results.length : 0
       let str = `调用“google_search”工具，搜索关键词为：“${msg.searchQuery || ''}”，得到了${n}个搜索结果：`
@@ -37,7 +52,7 @@ export function useAgentStream({ messages, pushAgentPlaceholder, setWebLinksToMs
     msg.thoughts.push(`调用“${tool}”工具，得到结果：${content}`)
   }
 
-  // 处理每个流式分片（工具结果 / 中间思维 / 最终聊天文本）
+  // 处理每个流式分片（工具结果 / 中间思维 / 最终回答增量 / 最终聊天文本）
   function handleEntry(agentMsgId, entry) {
     if (!entry.content || entry.content.trim() === '') return
     const msg = messages.value.find(m => m.id === agentMsgId)
@@ -47,13 +62,35 @@ export function useAgentStream({ messages, pushAgentPlaceholder, setWebLinksToMs
       handleToolResult(msg, entry)
       return
     }
+    if (entry.type === 'chat_delta') {
+      // 最终回答的 token 增量：边生成边展示；换了一条 LLM 消息则重新开始拼接
+      const streamId = entry.meta?.id || null
+      if (msg.streamId !== streamId) {
+        msg.streamId = streamId
+        msg.text = ''
+      }
+      msg.text += entry.content
+      return
+    }
     if (entry.type === 'intermediate_step') {
+      // 该消息最终是工具调用：丢弃其已流出的增量文本
+      if (msg.streamId && msg.streamId === entry.meta?.id) {
+        msg.text = ''
+        msg.streamId = null
+      }
       msg.thoughts.push(entry.content)
       if (entry.query) msg.searchQuery = entry.query
       return
     }
     if (entry.type === 'chat') {
       msg.text = entry.content
+      // 命中答案缓存：未重新检索，直接返回之前的回答
+      msg.cached = Boolean(entry.meta?.cached)
+      msg.isLoading = false
+    }
+    if (entry.type === 'error' || entry.type === 'cancelled') {
+      // 后台运行异常结束或因长时间无人重连被取消
+      if (!msg.text) msg.text = entry.type === 'error' ? '运行出错，请重试。' : '运行已取消。'
       msg.isLoading = false
     }
   }
@@ -0,0 +1,57 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+# 从任意目录运行 pytest 时都能导入 agent / backend
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from agent import config as agent_config  # noqa: E402
+import agent.agent as agent_module  # noqa: E402
+from agent.utils import prewarm  # noqa: E402
+from agent.utils.answer_cache import ANSWER_CACHE  # noqa: E402
+from agent.utils.checkpoint import BoundedMemorySaver  # noqa: E402
+from agent.utils.session import SESSION_LOCKS  # noqa: E402
+from fakes import FakeChatModel, llm_table  # noqa: E402
+
+
+# --------------------------
+# 公共夹具
+# - llm：用脚本化的 FakeChatModel 替换 strong / fast 两档模型，graph 重新编译到全新的有界内存 checkpointer
+# - client：FastAPI TestClient（跳过预热与 keep-warm，上传目录、运行表与准入控制均为本测试独享）
+# --------------------------
+@pytest.fixture
+def llm(monkeypatch):
+    strong, fast = FakeChatModel(), FakeChatModel()
+    monkeypatch.setattr(agent_config, "_llms", llm_table(strong, fast))
+    monkeypatch.setattr(agent_config, "MEMORY", BoundedMemorySaver(in_use=SESSION_LOCKS.is_busy))
+    monkeypatch.setattr(agent_module, "_graph", None)
+    # 嵌入模型不参与测试：答案缓存只按归一化文本命中
+    monkeypatch.setattr(ANSWER_CACHE, "use_embeddings", False)
+    ANSWER_CACHE.clear()
+    yield SimpleNamespace(strong=strong, fast=fast)
+    ANSWER_CACHE.clear()
+
+
+async def _no_awarmup(names=None):
+    return prewarm.status()
+
+
+@pytest.fixture
+def client(llm, monkeypatch, tmp_path):
+    from fastapi.testclient import TestClient
+    from backend import main
+    from backend.admission import AdmissionController
+    from backend.runs import RunRegistry
+    from backend.uploads import UploadStore
+
+    monkeypatch.setattr(prewarm, "start", lambda: None)
+    monkeypatch.setattr(prewarm, "awarmup", _no_awarmup)
+    monkeypatch.setattr(main, "KEEP_WARM_SECONDS", 0)
+    monkeypatch.setattr(main, "RUNS", RunRegistry(buffer_events=2000, grace_seconds=30, retention_seconds=300))
+    monkeypatch.setattr(main, "ADMISSION", AdmissionController(max_concurrent=8, max_queue=8, queue_timeout=5))
+    monkeypatch.setattr(main, "UPLOADS", UploadStore(str(tmp_path / "workspace"), str(tmp_path / ".uploads"),
+                                                     max_bytes=1024 * 1024, partial_ttl=3600))
+    with TestClient(main.app) as test_client:
+        yield test_client
@@ -0,0 +1,159 @@
+import asyncio
+import itertools
+import json
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import Field
+
+_call_ids = itertools.count(1)
+
+
+def tool_call(name: str, **args) -> Dict[str, Any]:
+    """
+    脚本中的一步工具调用（FakeChatModel.replies 的元素）。
+    """
+    return {"tool": name, "args": args}
+
+
+def last_user_text(messages: List[Any]) -> str:
+    for msg in reversed(messages):
+        if isinstance(msg, tuple) and msg[0] == "user":
+            return str(msg[1])
+        if getattr(msg, "type", None) == "human":
+            return str(msg.content)
+    return ""
+
+
+# --------------------------
+# 离线的脚本化聊天模型
+# - 按顺序取 replies：字符串为回答，tool_call(...) 为工具调用，可调用对象按收到的消息生成回答；
+#   用完后回答 "回答：<最后一条用户消息>"
+# - errors 中的异常依次在调用时抛出（None 表示该次正常返回）；delays 依次作为每次调用的延迟，用完后用 delay
+# - 流式输出时每 chunk_chars 个字符一个分片，delay 为分片间隔；usage 附在最后一个分片/最终消息上
+# - calls 记录每次调用收到的消息
+# --------------------------
+class FakeChatModel(BaseChatModel):
+    replies: List[Any] = Field(default_factory=list)
+    errors: List[Any] = Field(default_factory=list)
+    delays: List[float] = Field(default_factory=list)
+    delay: float = 0.0
+    chunk_chars: int = 2
+    usage: Optional[Dict[str, Any]] = None
+    max_tokens: Optional[int] = None
+    calls: List[List[Any]] = Field(default_factory=list)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        # 工具由测试脚本决定是否调用，绑定与否不影响回复
+        return self
+
+    # ---- 脚本 ----
+    def _next(self, messages: List[Any]) -> Tuple[Any, float]:
+        self.calls.append(list(messages))
+        delay = self.delays.pop(0) if self.delays else self.delay
+        error = self.errors.pop(0) if self.errors else None
+        if error is not None:
+            return error, delay
+        reply = self.replies.pop(0) if self.replies else None
+        if callable(reply):
+            reply = reply(messages)
+        if reply is None:
+            reply = f"回答：{last_user_text(messages)}"
+        if isinstance(reply, dict):
+            msg = AIMessage(content="", tool_calls=[{"name": reply["tool"], "args": reply["args"],
+                                                     "id": f"call_{next(_call_ids)}"}])
+        else:
+            msg = AIMessage(content=reply)
+        if self.usage:
+            msg.usage_metadata = dict(self.usage)
+        return msg, delay
+
+    def _chunks(self, msg: AIMessage) -> Iterator[ChatGenerationChunk]:
+        if msg.tool_calls:
+            call = msg.tool_calls[0]
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content="", usage_metadata=msg.usage_metadata,
+                tool_call_chunks=[{"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"],
+                                   "index": 0}]))
+            return
+        text = msg.content
+        pieces = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)] or [""]
+        for i, piece in enumerate(pieces):
+            last = i == len(pieces) - 1
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content=piece, usage_metadata=msg.usage_metadata if last else None))
+
+    # ---- BaseChatModel 接口 ----
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        msg, delay = self._next(messages)
+        time.sleep(delay)
+        if isinstance(msg, BaseException):
+            raise msg
+        return ChatResult(generations=[ChatGeneration(message=msg)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        msg, delay = self._next(messages)
+        await asyncio.sleep(delay)
+        if isinstance(msg, BaseException):
+            raise msg
+        return ChatResult(generations=[ChatGeneration(message=msg)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        msg, delay = self._next(messages)
+        if isinstance(msg, BaseException):
+            time.sleep(delay)
+            raise msg
+        for chunk in self._chunks(msg):
+            time.sleep(delay)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        msg, delay = self._next(messages)
+        if isinstance(msg, BaseException):
+            await asyncio.sleep(delay)
+            raise msg
+        for chunk in self._chunks(msg):
+            await asyncio.sleep(delay)
+            yield chunk
+
+
+def llm_table(strong: BaseChatModel, fast: BaseChatModel, fallback: Optional[BaseChatModel] = None) -> Dict[str, Any]:
+    """
+    与 agent.config._build_llms 结构相同的模型表（工具绑定由 FakeChatModel 忽略）。
+    """
+    return {
+        "LLM_BASE": strong,
+        "LLM_WITH_TOOLS": strong,
+        "LLM_TOOLS_DISABLED": strong,
+        "LLM_NO_TOOLS": strong,
+        "tiers": {"strong": strong, "fast": fast},
+        "fallbacks": {id(strong): fallback} if fallback is not None else {},
+    }
+
+
+def read_sse(text: str) -> List[Tuple[Optional[str], Dict[str, Any]]]:
+    """
+    SSE 响应体 -> [(id, 事件), ...]。
+    """
+    events = []
+    for frame in text.split("\n\n"):
+        event_id, data = None, None
+        for line in frame.split("\n"):
+            if line.startswith("id: "):
+                event_id = line[4:]
+            elif line.startswith("data: "):
+                data = json.loads(line[6:])
+        if data is not None:
+            events.append((event_id, data))
+    return events
+
+
+async def collect(agen) -> List[Dict[str, Any]]:
+    return [entry async for entry in agen]
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from backend import main
+from backend.admission import AdmissionController, AdmissionRejected
+
+
+# --------------------------
+# 准入控制：并发上限 + 有界 FIFO 等待队列
+# --------------------------
+def test_queue_full_is_rejected_with_429():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=1)
+        first = await controller.acquire()
+        queued = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire()
+        first.release()
+        second = await queued
+        return controller, rejected.value, second
+
+    controller, rejected, second = asyncio.run(scenario())
+
+    assert rejected.status_code == 429 and rejected.reason == "queue_full"
+    assert second.waited > 0
+    assert controller.stats()["running"] == 1 and controller.stats()["rejected_queue_full"] == 1
+
+
+def test_queue_timeout_is_rejected_with_503():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=0.05)
+        await controller.acquire()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire()
+        return controller, rejected.value
+
+    controller, rejected = asyncio.run(scenario())
+
+    assert rejected.status_code == 503 and rejected.reason == "queue_timeout"
+    assert controller.stats()["queued"] == 0
+
+
+def test_release_is_idempotent_and_hands_over_in_fifo_order():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=1)
+        ticket = await controller.acquire()
+        order = []
+
+        async def wait(name):
+            (await controller.acquire()).release()
+            order.append(name)
+
+        waiters = [asyncio.create_task(wait(n)) for n in ("a", "b", "c")]
+        await asyncio.sleep(0)
+        ticket.release()
+        ticket.release()
+        await asyncio.gather(*waiters)
+        return controller, order
+
+    controller, order = asyncio.run(scenario())
+
+    assert order == ["a", "b", "c"]
+    assert controller.stats()["running"] == 0
+
+
+def test_chat_stream_is_rejected_when_saturated(client, monkeypatch):
+    controller = AdmissionController(max_concurrent=1, max_queue=0, queue_timeout=1)
+    monkeypatch.setattr(main, "ADMISSION", controller)
+    ticket = asyncio.run(controller.acquire())
+
+    response = client.post("/chat/stream", json={"message": "hi"})
+
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "1"
+    ticket.release()
+    assert client.post("/chat/stream", json={"message": "hi"}).status_code == 200
+    assert client.get("/stats/admission").json()["running"] == 0
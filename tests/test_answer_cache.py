@@ -0,0 +1,107 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from agent.agent import _AnswerRecorder, agent_respond_astream, get_graph
+from agent.utils.answer_cache import ANSWER_CACHE, AnswerCache, expires_at, normalize_question
+from fakes import collect, tool_call
+
+
+# --------------------------
+# 答案缓存：会话第一轮的重复问题直接返回缓存的回答，不执行图
+# --------------------------
+def _ask(question, session_id, **kwargs):
+    return asyncio.run(collect(agent_respond_astream(question, session_id=session_id, **kwargs)))
+
+
+def test_repeated_first_turn_is_served_from_cache(llm):
+    _ask("太阳为什么是圆的", "s-1")
+
+    events = _ask("太阳为什么是圆的？", "s-2")
+
+    assert len(events) == 1
+    assert events[0]["content"] == "回答：太阳为什么是圆的"
+    assert events[0]["meta"]["cached"] and events[0]["meta"]["similarity"] == 1.0
+    assert len(llm.strong.calls) == 1
+    # 命中的问答写入新会话历史，追问仍有上下文
+    history = get_graph().get_state({"configurable": {"thread_id": "s-2"}}).values["messages"]
+    assert [m.content for m in history] == ["太阳为什么是圆的？", "回答：太阳为什么是圆的"]
+
+
+def test_follow_up_turns_and_other_modes_are_not_cached(llm):
+    _ask("月亮有多远", "s-1")
+
+    _ask("月亮有多远", "s-1")
+    _ask("月亮有多远", "s-2", deep_thinking=False, web_search_mode="off")
+
+    assert len(llm.strong.calls) == 3
+
+
+def test_answers_that_read_workspace_files_are_not_cached(llm, monkeypatch):
+    llm.strong.replies = [tool_call("docs_use", path="missing.txt"), "文件里写着……"]
+
+    _ask("总结 missing.txt", "s-1")
+
+    assert ANSWER_CACHE.lookup("总结 missing.txt", "fast:auto") is None
+
+
+def test_normalization_ignores_case_width_and_punctuation():
+    assert normalize_question("ＧＰＵ 是什么？") == normalize_question("gpu是什么")
+
+
+def test_time_sensitive_questions_expire_at_midnight():
+    now = datetime(2026, 3, 1, 22, 0).timestamp()
+    midnight = datetime(2026, 3, 2).timestamp()
+
+    assert expires_at("今天北京天气", "qa", now) == midnight
+    assert expires_at("北京天气", "weather", now) == now + 30 * 60
+    assert expires_at("量子力学是什么", "qa", now) == (datetime(2026, 3, 1, 22) + timedelta(days=1)).timestamp()
+
+
+def test_semantic_hits_require_matching_numbers(monkeypatch):
+    cache = AnswerCache(max_entries=10, threshold=0.9, use_embeddings=True)
+    vectors = {normalize_question(q): v for q, v in (("苹果15怎么样", [1.0, 0.0]), ("苹果15评价如何", [0.99, 0.14]),
+                                                         ("苹果16评价如何", [0.99, 0.14]))}
+    monkeypatch.setattr(cache, "_embed", lambda text: vectors.get(text))
+    cache.put("苹果15怎么样", "fast:auto", "不错")
+
+    hit = cache.lookup("苹果15评价如何", "fast:auto")
+
+    assert hit["answer"] == "不错" and hit["similarity"] < 1.0
+    assert cache.lookup("苹果16评价如何", "fast:auto") is None
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_lru_limit():
+    cache = AnswerCache(max_entries=2, threshold=0.95, use_embeddings=False)
+    for question in ("问题一", "问题二", "问题三"):
+        cache.put(question, "m", "答")
+
+    assert cache.lookup("问题一", "m") is None
+    assert cache.stats()["entries"] == 2
+
+
+def test_stats_endpoint(client):
+    stats = client.get("/stats/answer_cache").json()
+
+    assert {"enabled", "entries", "hits", "misses", "hit_rate"} <= set(stats)
+
+
+def test_budget_low_answers_are_not_cached(llm):
+    # 预算低于作答预留：chatbot 直接转入兜底作答
+    _ask("黑洞是什么", "s-1", time_budget=5)
+
+    assert ANSWER_CACHE.lookup("黑洞是什么", "fast:auto") is None
+    assert ANSWER_CACHE.stats()["entries"] == 0
+
+
+def test_exhausted_planning_turns_are_not_cached():
+    recorder = _AnswerRecorder(first_turn=True)
+    recorder.observe("updates", {"planning": {"planning": {"exhausted": True}, "next": "chatbot"}})
+    recorder.feed({"type": "chat", "content": "当前无法继续调用工具检索，我将基于已知信息作答。", "is_final": True})
+
+    assert recorder.cacheable_answer() is None
+
+    normal = _AnswerRecorder(first_turn=True)
+    normal.observe("updates", {"chatbot": {"messages": []}})
+    normal.feed({"type": "chat", "content": "答案", "is_final": True})
+    assert normal.cacheable_answer() == "答案"
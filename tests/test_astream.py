@@ -0,0 +1,51 @@
+import asyncio
+
+from agent.agent import agent_respond_astream, get_graph
+from agent.utils.session import new_session_id
+from fakes import collect, read_sse, tool_call
+
+
+# --------------------------
+# /chat/stream 的异步路径：graph.astream 驱动，节点走 ainvoke
+# --------------------------
+def test_astream_answers_with_final_chat_event(llm):
+    events = asyncio.run(collect(agent_respond_astream("你好", session_id=new_session_id())))
+
+    final = events[-1]
+    assert final["type"] == "chat" and final["is_final"]
+    assert final["content"] == "回答：你好"
+    assert len(llm.strong.calls) == 1
+
+
+def test_astream_runs_tools_between_chatbot_steps(llm):
+    llm.strong.replies = [tool_call("today_date"), "今天是个好日子"]
+    session_id = new_session_id()
+
+    events = asyncio.run(collect(agent_respond_astream("今天几号", session_id=session_id)))
+
+    kinds = [e["type"] for e in events if e["type"] != "chat_delta"]
+    assert kinds == ["intermediate_step", "tool_result", "chat"]
+    assert events[[e["type"] for e in events].index("tool_result")]["tool"] == "today_date"
+    # 第二次 chatbot 调用看得到工具结果
+    assert llm.strong.calls[1][-1].type == "tool"
+    state = get_graph().get_state({"configurable": {"thread_id": session_id}})
+    assert [m.type for m in state.values["messages"]] == ["human", "ai", "tool", "ai"]
+
+
+def test_chat_stream_endpoint_streams_events(client):
+    response = client.post("/chat/stream", json={"message": "流式", "options": {}})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.headers["x-session-id"] and response.headers["x-run-id"]
+    events = read_sse(response.text)
+    assert all(event_id.startswith(response.headers["x-run-id"] + ":") for event_id, _ in events)
+    assert events[-1][1]["type"] == "chat"
+    assert events[-1][1]["content"] == "回答：流式"
+
+
+def test_chat_endpoint_returns_answer_and_session(client):
+    response = client.post("/chat", json={"message": "非流式", "options": {"session_id": "s-chat"}})
+
+    assert response.status_code == 200
+    assert response.json() == {"result": "回答：非流式", "session_id": "s-chat"}
@@ -0,0 +1,72 @@
+import asyncio
+
+from agent import config as agent_config
+from agent.agent import agent_respond, agent_respond_batch
+from agent.utils.scheduler import priority_for
+from fakes import read_sse
+
+
+# --------------------------
+# 批量提问与非流式调用
+# --------------------------
+def test_agent_respond_returns_the_final_answer(llm):
+    assert agent_respond("同步调用") == "回答：同步调用"
+
+
+def test_batch_runs_concurrently_in_fresh_sessions(llm):
+    llm.strong.delay = 0.05
+    questions = [f"问题{i}" for i in range(6)]
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        results = [r async for r in agent_respond_batch(questions, concurrency=6)]
+        return results, loop.time() - started
+
+    results, elapsed = asyncio.run(scenario())
+
+    assert sorted(r["index"] for r in results) == list(range(6))
+    assert all(r["ok"] and r["answer"] == f"回答：{r['question']}" for r in results)
+    assert len({r["session_id"] for r in results}) == 6
+    # 6 个问题并发执行，总耗时远小于串行
+    assert elapsed < 6 * 0.05 * 3
+    # 默认不保留会话
+    assert agent_config.MEMORY.stats()["sessions"] == 0
+
+
+def test_batch_reports_failures_per_question(llm):
+    llm.strong.errors = [ValueError("boom")]
+
+    async def scenario():
+        return [r async for r in agent_respond_batch(["坏", "好"], concurrency=1, keep_sessions=True)]
+
+    results = sorted(asyncio.run(scenario()), key=lambda r: r["index"])
+
+    assert not results[0]["ok"] and "boom" in results[0]["error"]
+    assert results[1]["ok"]
+    assert agent_config.MEMORY.stats()["sessions"] == 2
+
+
+def test_batch_calls_run_at_batch_priority(llm):
+    seen = []
+    llm.strong.replies = [lambda messages: seen.append(priority_for("chatbot")) or "ok"]
+
+    async def scenario():
+        return [r async for r in agent_respond_batch(["优先级"])]
+
+    asyncio.run(scenario())
+
+    assert seen == ["batch"]
+
+
+def test_batch_endpoint_streams_results(client):
+    response = client.post("/chat/batch", json={"questions": ["甲", "乙", "丙"], "options": {"concurrency": 2}})
+
+    events = [e for _, e in read_sse(response.text)]
+    assert [e["type"] for e in events] == ["batch_result"] * 3 + ["batch_done"]
+    assert {e["answer"] for e in events[:3]} == {"回答：甲", "回答：乙", "回答：丙"}
+    assert events[-1]["total"] == 3 and events[-1]["failed"] == 0
+
+
+def test_batch_endpoint_validates_questions(client):
+    assert client.post("/chat/batch", json={"questions": []}).status_code == 400
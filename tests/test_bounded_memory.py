@@ -0,0 +1,114 @@
+import operator
+from typing import Annotated, List, TypedDict
+
+from langgraph.graph import START, StateGraph
+
+from agent.utils.checkpoint import BoundedMemorySaver, _sizeof
+
+
+# --------------------------
+# 有界内存 checkpointer：keep_last 裁剪、LRU/字节/TTL 淘汰与增量记账
+# --------------------------
+class _State(TypedDict):
+    items: Annotated[List[str], operator.add]
+
+
+def _graph(saver):
+    builder = StateGraph(_State)
+    builder.add_node("step", lambda state: {"items": ["x" * 200]})
+    builder.add_edge(START, "step")
+    return builder.compile(checkpointer=saver)
+
+
+def _run(graph, thread_id: str, turns: int = 1):
+    for _ in range(turns):
+        graph.invoke({"items": []}, {"configurable": {"thread_id": thread_id}})
+
+
+def _recount(saver: BoundedMemorySaver) -> int:
+    # 从存储内容重新计算的字节数，用于核对增量记账
+    total = sum(_sizeof(c) for t in saver.storage.values() for ns in t.values() for c in ns.values())
+    total += sum(_sizeof(w) for w in saver.writes.values())
+    total += sum(_sizeof(b) for b in getattr(saver, "blobs", {}).values())
+    return total
+
+
+def test_keeps_only_the_last_checkpoints_per_session():
+    saver = BoundedMemorySaver(keep_last=3)
+    graph = _graph(saver)
+
+    _run(graph, "s", turns=5)
+
+    assert len(saver.storage["s"][""]) == 3
+    assert saver.stats()["trimmed_checkpoints"] > 0
+    # 最新状态不受裁剪影响
+    assert len(graph.get_state({"configurable": {"thread_id": "s"}}).values["items"]) == 5
+    assert saver.total_bytes() == _recount(saver)
+
+
+def test_evicts_least_recently_used_session():
+    saver = BoundedMemorySaver(max_sessions=2)
+    graph = _graph(saver)
+
+    _run(graph, "a")
+    _run(graph, "b")
+    graph.get_state({"configurable": {"thread_id": "a"}})  # a 变为最近使用
+    _run(graph, "c")
+
+    assert set(saver.storage) == {"a", "c"}
+    assert saver.stats()["evictions"]["lru"] == 1
+    assert saver.total_bytes() == _recount(saver)
+
+
+def test_byte_limit_evicts_until_under_budget():
+    saver = BoundedMemorySaver(max_bytes=10 ** 9)
+    graph = _graph(saver)
+    _run(graph, "a")
+    one_session = saver.total_bytes()
+    saver.max_bytes = int(one_session * 1.5)
+
+    _run(graph, "b")
+
+    assert saver.total_bytes() <= saver.max_bytes
+    assert "b" in saver.storage and "a" not in saver.storage
+    assert saver.stats()["evictions"]["bytes"] == 1
+
+
+def test_busy_sessions_are_never_evicted():
+    busy = {"a"}
+    saver = BoundedMemorySaver(max_sessions=1, in_use=lambda thread_id: thread_id in busy)
+    graph = _graph(saver)
+
+    _run(graph, "a")
+    _run(graph, "b")
+
+    # a 有轮次在执行：即使超出会话上限也保留，等其空闲后再淘汰
+    assert set(saver.storage) == {"a", "b"}
+    busy.clear()
+    _run(graph, "c")
+    assert set(saver.storage) == {"c"}
+
+
+def test_ttl_evicts_idle_sessions():
+    saver = BoundedMemorySaver(ttl_seconds=60)
+    graph = _graph(saver)
+    _run(graph, "old")
+    saver._last_used["old"] -= 120
+
+    _run(graph, "new")
+
+    assert set(saver.storage) == {"new"}
+    assert saver.stats()["evictions"]["ttl"] == 1
+
+
+def test_delete_thread_releases_its_bytes():
+    saver = BoundedMemorySaver()
+    graph = _graph(saver)
+    _run(graph, "a", turns=2)
+    _run(graph, "b")
+
+    saver.delete_thread("a")
+
+    assert "a" not in saver.storage
+    assert saver.stats()["sessions"] == 1
+    assert saver.total_bytes() == _recount(saver)
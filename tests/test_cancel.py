@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from agent.agent import agent_respond_astream
+from agent.utils import cancel as cancel_stats
+from agent.utils.cancel import CancelToken, RunCancelled, bind_token, raise_if_cancelled
+from agent.utils.session import new_session_id
+from backend.runs import RunRegistry
+
+
+# --------------------------
+# 客户端断开时取消图的执行
+# --------------------------
+def test_token_is_visible_through_the_context():
+    token = CancelToken()
+    with bind_token(token):
+        raise_if_cancelled()
+        token.cancel("client_disconnected")
+        with pytest.raises(RunCancelled, match="client_disconnected"):
+            raise_if_cancelled()
+    raise_if_cancelled()
+
+
+def test_cancelled_token_stops_the_turn_before_calling_the_llm(llm):
+    token = CancelToken()
+    token.cancel("client_disconnected")
+    before = cancel_stats.stats()["cancelled_runs"]
+
+    with pytest.raises(RunCancelled):
+        asyncio.run(_drain(agent_respond_astream("hi", session_id=new_session_id(), cancel_token=token)))
+
+    assert llm.strong.calls == []
+    assert cancel_stats.stats()["cancelled_runs"] == before + 1
+
+
+def test_cancelling_a_run_interrupts_the_streaming_llm(llm):
+    llm.strong.replies = ["很长的回答" * 50]
+    llm.strong.delay = 0.01
+    registry = RunRegistry()
+
+    async def scenario():
+        run = registry.create("s-cancel")
+        run.start(agent_respond_astream("hi", session_id="s-cancel", cancel_token=run.token))
+        events = []
+        async for _, event in run.subscribe():
+            events.append(event)
+            if event["type"] == "chat_delta":
+                run.cancel("client_cancelled")
+        return run, events
+
+    run, events = asyncio.run(asyncio.wait_for(scenario(), 5))
+
+    assert events[-1]["type"] == "cancelled" and events[-1]["content"] == "client_cancelled"
+    assert run.done and run.token.cancelled
+    assert sum(e["type"] == "chat_delta" for e in events) < len("很长的回答" * 50) // 2
+
+
+def test_run_is_cancelled_when_no_subscriber_returns_within_grace(llm):
+    llm.strong.delay = 0.05
+    registry = RunRegistry(grace_seconds=0.05)
+
+    async def scenario():
+        run = registry.create("s-grace")
+        run.start(agent_respond_astream("一个问题", session_id="s-grace", cancel_token=run.token))
+        async for _, event in run.subscribe():
+            break  # 客户端断开
+        while not run.done:
+            await asyncio.sleep(0.01)
+        return run
+
+    run = asyncio.run(asyncio.wait_for(scenario(), 5))
+
+    assert run.token.reason == "client_disconnected"
+    assert list(run._since(0))[-1][1]["type"] == "cancelled"
+
+
+async def _drain(agen):
+    async for _ in agen:
+        pass
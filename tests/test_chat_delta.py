@@ -0,0 +1,47 @@
+import asyncio
+
+from langchain_core.messages import AIMessageChunk
+
+from agent.agent import _delta_from_message, agent_respond_astream, agent_respond_stream
+from agent.utils.session import new_session_id
+from fakes import collect, tool_call
+
+
+# --------------------------
+# 最终回答的 token 级流式输出（chat_delta）
+# --------------------------
+def test_deltas_add_up_to_the_final_answer(llm):
+    llm.strong.replies = ["北京今天晴，气温二十度。"]
+
+    events = asyncio.run(collect(agent_respond_astream("北京天气", session_id=new_session_id())))
+
+    deltas = [e for e in events if e["type"] == "chat_delta"]
+    final = events[-1]
+    assert len(deltas) > 1
+    assert "".join(d["content"] for d in deltas) == final["content"]
+    assert {d["meta"]["id"] for d in deltas} == {final["meta"]["id"]}
+    assert events.index(final) > events.index(deltas[-1])
+
+
+def test_tool_call_messages_do_not_stream_deltas(llm):
+    llm.strong.replies = [tool_call("today_date"), "好"]
+
+    events = asyncio.run(collect(agent_respond_astream("今天几号", session_id=new_session_id())))
+
+    step = next(e for e in events if e["type"] == "intermediate_step")
+    assert all(d["meta"]["id"] != step["meta"]["id"] for d in events if d["type"] == "chat_delta")
+
+
+def test_sync_stream_emits_deltas_too(llm):
+    events = list(agent_respond_stream("同步", session_id=new_session_id()))
+
+    assert "".join(e["content"] for e in events if e["type"] == "chat_delta") == "回答：同步"
+
+
+def test_only_chatbot_text_is_forwarded():
+    chunk = AIMessageChunk(content="判定", id="m1")
+
+    assert _delta_from_message((chunk, {"langgraph_node": "planning"})) is None
+    assert _delta_from_message((AIMessageChunk(content="", id="m1"), {"langgraph_node": "chatbot"})) is None
+    assert _delta_from_message((chunk, {"langgraph_node": "chatbot"})) == {
+        "type": "chat_delta", "content": "判定", "meta": {"id": "m1"}, "is_final": False}
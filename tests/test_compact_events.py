@@ -0,0 +1,82 @@
+import asyncio
+import json
+import zlib
+
+import pytest
+
+from agent import agent as agent_module
+from agent.agent import _compact, _tool_event
+from backend.sse import compress_stream, format_event, negotiate_encoding
+from fakes import read_sse
+
+
+# --------------------------
+# 紧凑的 SSE 事件：搜索结果为原生数组、长文本只下发预览、逐帧压缩
+# --------------------------
+def test_search_results_are_sent_as_arrays_with_display_fields():
+    raw = json.dumps([{"title": "t", "link": "https://a", "snippet": "s", "favicon": "f", "score": 0.9,
+                       "date": "", "index": 1}])
+
+    assert _tool_event("google_search", raw) == {
+        "content": [{"title": "t", "link": "https://a", "snippet": "s", "index": 1}]}
+
+
+def test_long_tool_output_is_previewed(monkeypatch):
+    monkeypatch.setattr(agent_module, "EVENT_PREVIEW_CHARS", 10)
+
+    event = _tool_event("url_summary", "摘" * 25)
+
+    assert event == {"content": "摘" * 10, "truncated": True, "length": 25}
+    assert _tool_event("url_summary", "短") == {"content": "短"}
+
+
+def test_empty_fields_are_dropped():
+    assert _compact({"type": "chat", "query": None, "meta": {}, "is_final": True}) == {"type": "chat", "is_final": True}
+
+
+def test_frames_use_compact_json():
+    assert format_event({"type": "chat", "content": "你好"}, "r:1") == 'id: r:1\ndata: {"type":"chat","content":"你好"}\n\n'
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("gzip, deflate, br", "gzip"),
+    ("deflate", "deflate"),
+    ("gzip;q=0, deflate;q=0.5", "deflate"),
+    ("*", "gzip"),
+    ("identity", None),
+])
+def test_negotiate_encoding(header, expected):
+    assert negotiate_encoding(header) == expected
+
+
+def test_each_frame_is_decodable_as_soon_as_it_arrives():
+    frames = [format_event({"type": "chat_delta", "content": f"片段{i}"}) for i in range(3)]
+
+    async def frame_source():
+        for frame in frames:
+            yield frame
+
+    async def encode():
+        return [chunk async for chunk in compress_stream(frame_source(), "gzip")]
+
+    chunks = asyncio.run(encode())
+    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    # 每个分片单独解压即得到完整的一帧（Z_SYNC_FLUSH），不必等后续数据
+    assert [decoder.decompress(chunk).decode("utf-8") for chunk in chunks[:3]] == frames
+
+
+def test_chat_stream_is_gzip_encoded_when_accepted(client):
+    response = client.post("/chat/stream", json={"message": "压缩"}, headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert read_sse(response.text)[-1][1]["content"] == "回答：压缩"
+
+
+def test_chat_stream_is_plain_without_accept_encoding(client):
+    response = client.post("/chat/stream", json={"message": "不压缩"}, headers={"Accept-Encoding": "identity"})
+
+    assert "content-encoding" not in response.headers
+    assert read_sse(response.text)[-1][1]["content"] == "回答：不压缩"
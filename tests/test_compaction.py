@@ -0,0 +1,100 @@
+import asyncio
+import json
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from agent.agent import agent_arespond, get_graph
+from agent.utils import compaction
+
+
+# --------------------------
+# 历史压缩：超预算时先摘录较早的工具输出，再把最早的轮次折叠进摘要；checkpoint 中的历史不变
+# --------------------------
+HEAD = [SystemMessage(content="系统提示")]
+
+
+def _turn(i, tool_chars=0):
+    messages = [HumanMessage(content=f"第{i}个问题"), ]
+    if tool_chars:
+        call_id = f"call-{i}"
+        results = [{"title": f"结果{n}", "link": f"https://e.com/{i}/{n}", "snippet": "x" * tool_chars}
+                   for n in range(8)]
+        messages += [AIMessage(content="", tool_calls=[{"name": "google_search", "args": {"query": "q"}, "id": call_id}]),
+                     ToolMessage(content=json.dumps(results), tool_call_id=call_id, name="google_search")]
+    messages.append(AIMessage(content=f"第{i}个回答"))
+    return messages
+
+
+def _same(messages):
+    return messages
+
+
+def test_under_budget_history_is_untouched(monkeypatch):
+    monkeypatch.setattr(compaction, "TOKEN_BUDGET", 10 ** 6)
+    messages = _turn(1, tool_chars=500) + _turn(2)
+
+    result = compaction.plan(HEAD, messages, None, _same)
+
+    assert result.messages() == HEAD + messages and result.fold == []
+
+
+def test_old_tool_outputs_are_digested_first(monkeypatch):
+    messages = _turn(1, tool_chars=500) + _turn(2) + _turn(3)
+    monkeypatch.setattr(compaction, "TOKEN_BUDGET", 400)
+
+    result = compaction.plan(HEAD, messages, None, _same)
+
+    digest = result.history[2]
+    assert digest.content.startswith("[较早的 google_search 结果摘录]")
+    assert "https://e.com/1/0" in digest.content
+    assert result.fold == []
+    # 原消息不被修改
+    assert messages[2].content.startswith("[{")
+
+
+def test_oldest_turns_are_folded_into_summary(monkeypatch):
+    messages = [m for i in range(1, 7) for m in _turn(i, tool_chars=200)]
+    monkeypatch.setattr(compaction, "TOKEN_BUDGET", 150)
+    monkeypatch.setattr(compaction, "KEEP_TURNS", 2)
+
+    result = compaction.plan(HEAD, messages, {"summary": "旧摘要", "covered": 0}, _same)
+
+    assert result.fold and result.fold[0].content == "第1个问题"
+    assert result.history[-1].content == "第6个回答"
+    state = result.apply_summary("新摘要")
+    assert state == {"summary": "新摘要", "covered": result.covered} and result.covered > 0
+    assert result.messages()[1].content.endswith("新摘要")
+    # 下一轮从已折叠处继续
+    again = compaction.plan(HEAD, messages, state, _same)
+    assert again.history[0] is messages[state["covered"]]
+
+
+def test_summary_prompt_builds_on_previous_summary():
+    prompt = compaction.build_summary_prompt("旧摘要", _turn(1, tool_chars=500))
+
+    assert "旧摘要" in prompt[1][1] and "用户：第1个问题" in prompt[1][1]
+    assert "助手调用工具：google_search" in prompt[1][1]
+    assert compaction.fallback_summary("旧摘要", _turn(2)).startswith("旧摘要")
+
+
+def test_graph_summarizes_long_sessions_and_keeps_checkpoint(llm, monkeypatch):
+    monkeypatch.setattr(compaction, "TOKEN_BUDGET", 120)
+    monkeypatch.setattr(compaction, "KEEP_TURNS", 1)
+    # 总结请求回答固定摘要，其余按默认回答
+    llm.strong.replies = [lambda messages: "会话摘要" if "压缩一段对话历史" in messages[0].content else None] * 20
+
+    async def scenario():
+        for i in range(6):
+            await agent_arespond(f"这是第{i}个比较长的问题，" + "内容" * 40, session_id="s-compact")
+
+    asyncio.run(scenario())
+
+    state = get_graph().get_state({"configurable": {"thread_id": "s-compact"}}).values
+    assert state["compaction"]["covered"] > 0
+    assert state["compaction"]["summary"] == "会话摘要"
+    assert len(state["messages"]) == 12
+    chatbot_prompts = [call for call in llm.strong.calls if "压缩一段对话历史" not in call[0].content]
+    assert len(chatbot_prompts) == 6
+    last_prompt = chatbot_prompts[-1]
+    assert any("会话摘要" in m.content for m in last_prompt if m.type == "system")
+    assert len(last_prompt) < 12
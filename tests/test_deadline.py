@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from agent import config as agent_config
+from agent.agent import agent_respond_astream
+from agent.utils import deadline
+from agent.utils.deadline import DeadlineExceeded, bind_deadline
+from agent.utils.session import new_session_id
+from fakes import collect
+
+
+# --------------------------
+# 单轮时间预算：工具超时收缩到剩余预算内，预算将尽时无工具作答，用完则给出截断的回答
+# --------------------------
+def test_clamp_shrinks_timeouts_to_the_remaining_budget():
+    assert deadline.clamp(10) == 10
+    with bind_deadline(5):
+        assert deadline.clamp(10, reserve=1) <= 4
+        assert deadline.clamp(2, reserve=1) == 2
+        with pytest.raises(DeadlineExceeded):
+            deadline.clamp(10, reserve=4.5)
+        assert deadline.budget_low(reserve=10)
+    assert deadline.remaining() is None
+
+
+def test_zero_budget_means_unlimited():
+    with bind_deadline(0) as dl:
+        assert dl is None and deadline.remaining() is None
+
+
+def test_wait_for_raises_when_the_budget_runs_out():
+    async def scenario():
+        with bind_deadline(0.05):
+            await deadline.wait_for(asyncio.sleep(1))
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(scenario())
+
+
+def test_low_budget_answers_without_tools(llm):
+    events = asyncio.run(collect(agent_respond_astream("快答", session_id=new_session_id(), time_budget=5)))
+
+    # 预算低于回答预留：直接走无工具兜底，提示末尾追加 SYS_MSG_NO_TOOLS（开头的系统提示不变）
+    prompt = llm.strong.calls[0]
+    assert prompt[0] is agent_config.SYS_MSG_WITH_TOOLS and prompt[-1] is agent_config.SYS_MSG_NO_TOOLS
+    assert events[-1]["type"] == "chat" and events[-1]["content"] == "回答：快答"
+
+
+def test_exhausted_budget_ends_the_turn_with_a_truncated_answer(llm):
+    llm.strong.replies = ["这是一个很长的回答" * 20]
+    llm.strong.delay = 0.02
+
+    events = asyncio.run(collect(agent_respond_astream("慢答", session_id=new_session_id(), time_budget=0.3)))
+
+    final = events[-1]
+    streamed = "".join(e["content"] for e in events if e["type"] == "chat_delta")
+    assert final["type"] == "chat" and final["meta"] == {"timeout": True}
+    assert "时间预算" in final["content"]
+    assert final["content"].startswith(streamed)
+
+
+def test_time_budget_option_reaches_the_turn(client, llm):
+    llm.strong.delay = 0.05
+    llm.strong.replies = ["很长" * 50]
+
+    response = client.post("/chat", json={"message": "慢", "options": {"time_budget": 0.2}})
+
+    assert "时间预算" in response.json()["result"]
@@ -0,0 +1,63 @@
+import agent.agent as agent_module
+from agent import config as agent_config
+from agent.utils import prewarm
+from fakes import FakeChatModel, llm_table
+
+
+# --------------------------
+# 延迟初始化：LLM 客户端与 graph 在首次使用或预热阶段才构建
+# --------------------------
+def test_llm_clients_are_built_once_on_first_use(monkeypatch):
+    builds = []
+
+    def build():
+        builds.append(1)
+        return llm_table(FakeChatModel(), FakeChatModel())
+
+    monkeypatch.setattr(agent_config, "_llms", None)
+    monkeypatch.setattr(agent_config, "_build_llms", build)
+
+    assert builds == []
+    model = agent_config.LLM_WITH_TOOLS
+    assert agent_config.LLM_BASE is model and agent_config.get_llm("chatbot") is model
+    assert builds == [1]
+
+
+def test_graph_is_compiled_lazily(llm):
+    assert agent_module._graph is None
+
+    graph = agent_module.get_graph()
+
+    assert agent_module.get_graph() is graph
+    assert agent_module.graph is graph
+
+
+def test_components_record_state_and_timing(monkeypatch):
+    monkeypatch.setattr(prewarm, "_components", {})
+    calls = []
+    prewarm.register("ok", lambda: calls.append("ok"))
+    prewarm.register("ok", lambda: calls.append("duplicate"))
+    prewarm.register("broken", lambda: 1 / 0, required=False)
+
+    status = prewarm.warmup()
+    prewarm.warmup()
+
+    assert calls == ["ok"]
+    assert status["ready"] and status["not_ready"] == []
+    assert status["components"]["ok"]["state"] == "ready"
+    assert status["components"]["ok"]["seconds"] is not None
+    assert status["components"]["broken"]["state"] == "failed"
+    assert "ZeroDivisionError" in status["components"]["broken"]["error"]
+
+
+def test_import_report_checks_the_startup_budget(monkeypatch):
+    monkeypatch.setattr(prewarm, "_imports", [])
+    monkeypatch.setattr(prewarm, "STARTUP_BUDGET_SECONDS", 1.0)
+    prewarm.record_import("backend.main", 0.4)
+    prewarm.import_module_timed("json")
+
+    report = prewarm.import_report()
+
+    assert report["startup_seconds"] == 0.4 and report["within_budget"]
+    prewarm.record_import("agent.agent", 0.8)
+    assert not prewarm.import_report()["within_budget"]
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from agent import config as agent_config
+from agent.utils import llm as llm_module
+from agent.utils.llm import ainvoke_llm, invoke_llm, is_transient
+from agent.utils.scheduler import SCHEDULER
+from fakes import FakeChatModel, llm_table
+
+
+# --------------------------
+# LLM 容错：瞬时错误重试、备用端点、对冲请求
+# --------------------------
+class APIConnectionError(Exception):
+    """与 openai SDK 同名：按类名识别为瞬时错误。"""
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+@pytest.fixture(autouse=True)
+def _no_backoff(monkeypatch):
+    monkeypatch.setattr(llm_module, "BACKOFF_BASE_SECONDS", 0)
+    monkeypatch.setattr(llm_module, "HEDGE_DELAY", "0")
+
+
+def _resilience(key):
+    return llm_module.stats()["resilience"][key]
+
+
+def test_transient_errors_are_recognised():
+    assert is_transient(APIConnectionError())
+    assert is_transient(_StatusError(429)) and is_transient(_StatusError(503))
+    assert not is_transient(_StatusError(400)) and not is_transient(ValueError())
+
+
+def test_transient_errors_are_retried(llm):
+    llm.strong.errors = [APIConnectionError(), APIConnectionError()]
+    retries = _resilience("retries")
+
+    assert invoke_llm("chatbot", "重试").content == "回答：重试"
+    assert asyncio.run(ainvoke_llm("chatbot", "异步重试")).content == "回答：异步重试"
+
+    assert len(llm.strong.calls) == 4
+    assert _resilience("retries") == retries + 2
+
+
+def test_permanent_errors_are_not_retried(llm):
+    llm.strong.errors = [_StatusError(400)]
+
+    with pytest.raises(_StatusError):
+        invoke_llm("chatbot", "x")
+    assert len(llm.strong.calls) == 1
+
+
+def test_fallback_endpoint_serves_after_retries_fail(llm, monkeypatch):
+    fallback = FakeChatModel(replies=["备用回答", "备用回答"])
+    monkeypatch.setattr(agent_config, "_llms", llm_table(llm.strong, llm.fast, fallback))
+    llm.strong.errors = [APIConnectionError()] * (2 * (llm_module.MAX_RETRIES + 1))
+    granted = SCHEDULER.stats()["granted"]
+
+    assert invoke_llm("chatbot", "x").content == "备用回答"
+    assert asyncio.run(ainvoke_llm("chatbot", "x")).content == "备用回答"
+
+    # 备用请求同样经过调度器取得许可
+    attempts = 2 * (llm_module.MAX_RETRIES + 1) + 2
+    assert SCHEDULER.stats()["granted"] - granted == attempts
+    assert len(fallback.calls) == 2
+
+
+def test_hedge_wins_when_primary_stalls(llm, monkeypatch):
+    monkeypatch.setattr(llm_module, "HEDGE_DELAY", "0.05")
+    llm.strong.delays = [2.0, 0.0]
+    llm.strong.replies = ["慢的主请求", "对冲回答"]
+    wins = _resilience("hedge_wins")
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        response = await ainvoke_llm("chatbot", "x")
+        return response, loop.time() - started
+
+    response, elapsed = asyncio.run(scenario())
+
+    assert response.content == "对冲回答" and elapsed < 1.0
+    assert _resilience("hedge_wins") == wins + 1
+
+
+def test_failed_hedge_waits_for_the_primary(llm, monkeypatch):
+    monkeypatch.setattr(llm_module, "HEDGE_DELAY", "0.05")
+    llm.strong.delays = [0.2, 0.0]
+    llm.strong.errors = [None, ValueError("hedge failed")]
+
+    response = asyncio.run(ainvoke_llm("chatbot", "主请求"))
+
+    # 先结束的对冲失败：继续等主请求，而不是抛出对冲的错误
+    assert response.content == "回答：主请求"
+
+
+def test_hedge_delay_auto_uses_recent_latency(monkeypatch):
+    monkeypatch.setattr(llm_module, "HEDGE_DELAY", "auto")
+    monkeypatch.setitem(llm_module._latencies, "test.purpose", llm_module.deque([0.1] * 19 + [3.0], maxlen=200))
+
+    assert llm_module.hedge_delay("test.purpose") == 3.0
+    assert llm_module.hedge_delay("never.called") == llm_module.HEDGE_DEFAULT_SECONDS
@@ -0,0 +1,53 @@
+from agent.utils.metrics import Registry
+from fakes import tool_call
+
+
+# --------------------------
+# /metrics：Prometheus 文本格式的节点/工具耗时直方图与运行时状态
+# --------------------------
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    latency = registry.histogram("x_seconds", "help", ["node"], buckets=(0.1, 1))
+    latency.observe(0.05, node="a")
+    latency.observe(0.5, node="a")
+    latency.observe(5, node="a")
+
+    text = registry.render()
+
+    assert 'x_seconds_bucket{node="a",le="0.1"} 1' in text
+    assert 'x_seconds_bucket{node="a",le="1"} 2' in text
+    assert 'x_seconds_bucket{node="a",le="+Inf"} 3' in text
+    assert 'x_seconds_count{node="a"} 3' in text
+    assert "# TYPE x_seconds histogram" in text
+
+
+def test_counter_labels_are_escaped_and_collectors_exported():
+    registry = Registry()
+    registry.counter("errors_total", "help", ["name"]).inc(name='a"b')
+    registry.register_collector(lambda: [("queue_depth", "gauge", "help", {}, 3)])
+    registry.register_collector(lambda: 1 / 0)  # 出错的采集函数不影响其他指标
+
+    text = registry.render()
+
+    assert 'errors_total{name="a\\"b"} 1' in text
+    assert "# TYPE queue_depth gauge\nqueue_depth 3" in text
+
+
+def test_metrics_endpoint_reports_nodes_tools_and_runtime_state(client, llm):
+    llm.strong.replies = [tool_call("today_date"), "好"]
+    client.post("/chat/stream", json={"message": "今天几号"})
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    for line in ('agent_node_duration_seconds_count{node="chatbot"}',
+                 'agent_node_duration_seconds_count{node="tools"}',
+                 'agent_tool_duration_seconds_count{tool="today_date"}',
+                 'agent_turn_duration_seconds_count{outcome="ok"}',
+                 "agent_time_to_first_event_seconds_count",
+                 "agent_admission_running 0",
+                 "agent_runs_retained 1",
+                 "agent_checkpoint_sessions 1"):
+        assert line in text
@@ -0,0 +1,43 @@
+import asyncio
+
+from agent import config as agent_config
+from agent.utils import llm as llm_module
+from agent.utils.llm import ainvoke_llm, invoke_llm
+
+
+# --------------------------
+# 模型分级：planning 的判定/选择走 fast 档，最终回答与历史压缩走 strong 档
+# --------------------------
+def test_routes_map_purposes_to_tiers():
+    assert agent_config.tier_for("chatbot") == "strong"
+    assert agent_config.tier_for("planning.judge") == "fast"
+    assert agent_config.tier_for("planning.select") == "fast"
+    assert agent_config.tier_for("compaction") == "strong"
+    assert agent_config.tier_for("unknown") == "strong"
+
+
+def test_route_overrides_ignore_unknown_tiers():
+    assert agent_config._parse_routes("planning.judge=strong, x=fast,y=huge,=fast") == {
+        "planning.judge": "strong", "x": "fast"}
+
+
+def test_calls_go_to_the_model_of_their_tier(llm):
+    llm.fast.replies = ["是"]
+
+    judged = invoke_llm("planning.judge", "判定")
+    answered = asyncio.run(ainvoke_llm("chatbot", "回答"))
+
+    assert judged.content == "是" and len(llm.fast.calls) == 1
+    assert answered.content == "回答：回答" and len(llm.strong.calls) == 1
+
+
+def test_stats_are_reported_per_tier(llm):
+    before = llm_module.stats()["tiers"].get("fast", {}).get("calls", 0)
+    llm.fast.usage = {"input_tokens": 30, "output_tokens": 2, "total_tokens": 32}
+
+    invoke_llm("planning.select", "选择")
+
+    fast = llm_module.stats()["tiers"]["fast"]
+    assert fast["calls"] == before + 1
+    assert fast["model"] == agent_config.MODEL_TIERS["fast"]["model"]
+    assert fast["output_tokens"] >= 2
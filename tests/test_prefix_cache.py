@@ -0,0 +1,82 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from agent import agent as agent_module
+from agent import config as agent_config
+from agent.agent import agent_arespond
+from agent.utils import deadline
+from agent.utils import llm as llm_module
+from agent.utils.message import filter_messages_for_prompt
+from agent.utils.usage import usage_from_response
+
+
+# --------------------------
+# 提示前缀缓存：各轮提示只向后追加，兜底阶段的说明追加在末尾；统计服务端前缀缓存命中
+# --------------------------
+def _render(messages):
+    return [(m.type, m.content) for m in messages]
+
+
+def test_each_turn_extends_the_previous_prompt(llm):
+    async def scenario():
+        for question in ("第一问", "第二问", "第三问"):
+            await agent_arespond(question, session_id="s-prefix")
+
+    asyncio.run(scenario())
+
+    prompts = [_render(call) for call in llm.strong.calls]
+    assert prompts[0][0] == ("system", agent_config.SYS_MSG_WITH_TOOLS.content)
+    for previous, current in zip(prompts, prompts[1:]):
+        assert current[:len(previous)] == previous
+
+
+def test_cache_hits_are_read_from_both_response_formats():
+    streamed = AIMessage(content="", usage_metadata={"input_tokens": 100, "output_tokens": 5, "total_tokens": 105,
+                                                     "input_token_details": {"cache_read": 80}})
+    plain = AIMessage(content="", usage_metadata={"input_tokens": 100, "output_tokens": 5, "total_tokens": 105},
+                      response_metadata={"token_usage": {"prompt_cache_hit_tokens": 64}})
+
+    assert usage_from_response(streamed) == {"input": 100, "output": 5, "cache_hit": 80, "cache_miss": 20}
+    assert usage_from_response(plain)["cache_hit"] == 64
+    assert usage_from_response(None) == {"input": 0, "output": 0, "cache_hit": 0, "cache_miss": 0}
+
+
+def test_cache_hit_rate_is_reported_per_tier(llm):
+    llm.strong.usage = {"input_tokens": 1000, "output_tokens": 10, "total_tokens": 1010,
+                        "input_token_details": {"cache_read": 900}}
+
+    asyncio.run(agent_arespond("缓存命中", session_id="s-cache"))
+
+    strong = llm_module.stats()["tiers"]["strong"]
+    assert strong["cache_hit_tokens"] >= 900
+    assert 0 < strong["cache_hit_rate"] <= 1
+
+
+def _history():
+    return [
+        HumanMessage(content="总结这个网页"),
+        AIMessage(content="", tool_calls=[{"name": "google_search", "args": {"query": "q"}, "id": "s1"}]),
+        ToolMessage(content="[]", tool_call_id="s1", name="google_search"),
+        AIMessage(content="", tool_calls=[{"name": "url_summary", "args": {"url": "https://e.com"}, "id": "u1"}]),
+        ToolMessage(content="网页摘要", tool_call_id="u1", name="url_summary"),
+    ]
+
+
+def test_exhausted_prompt_drops_url_summary_calls_and_results():
+    history = _history()
+
+    assert filter_messages_for_prompt(history, {"exhausted": False}) == history
+    assert filter_messages_for_prompt(history, {"exhausted": True}) == history[:3]
+
+
+def test_deadline_exhausted_prompt_message_list(llm, monkeypatch):
+    monkeypatch.setattr(deadline, "budget_low", lambda reserve=0: True)
+
+    pl, model, compact = agent_module._chatbot_prompt({"messages": _history()})
+    prompt = agent_module._chatbot_messages(pl, compact)
+
+    assert pl["exhausted"] and model is agent_config.LLM_TOOLS_DISABLED
+    assert [(m.type, getattr(m, "name", None)) for m in prompt] == [
+        ("system", None), ("human", None), ("ai", None), ("tool", "google_search"), ("system", None)]
+    assert prompt[0] is agent_config.SYS_MSG_WITH_TOOLS and prompt[-1] is agent_config.SYS_MSG_NO_TOOLS
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from agent.utils import prewarm
+
+
+# --------------------------
+# 连接预热与 /ready：required 组件全部就绪才返回 200，连接类组件由 keep-warm 定期刷新
+# --------------------------
+@pytest.fixture
+def components(monkeypatch):
+    monkeypatch.setattr(prewarm, "_components", {})
+    return prewarm._components
+
+
+class _Flaky:
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("endpoint unreachable")
+
+    async def acall(self):
+        self()
+
+
+def test_ready_waits_for_required_components(client, components):
+    connection = _Flaky(failures=1)
+    prewarm.register("llm_connection", connection, refresh=True)
+    prewarm.register("optional", lambda: 1 / 0, required=False)
+
+    prewarm.warmup()
+    not_ready = client.get("/ready")
+    prewarm.warmup()
+    recovered = client.get("/ready")
+
+    assert not_ready.status_code == 503
+    assert not_ready.json()["not_ready"] == ["llm_connection"]
+    assert "ConnectionError" in not_ready.json()["components"]["llm_connection"]["error"]
+    # 再次预热时重试失败的组件
+    assert recovered.status_code == 200 and connection.calls == 2
+
+
+def test_keep_warm_refreshes_connections_and_recovers(components):
+    connection = _Flaky(failures=1)
+    async_connection = _Flaky(failures=0)
+    static = _Flaky(failures=0)
+    prewarm.register("search_connection", connection, refresh=True)
+    prewarm.register_async("llm_connection_async", async_connection.acall, refresh=True)
+    prewarm.register("graph", static)
+
+    async def scenario():
+        prewarm.warmup()
+        await prewarm.awarmup()
+        assert not prewarm.is_ready()
+        task = asyncio.create_task(prewarm.keep_warm(0.01))
+        while not prewarm.is_ready() or async_connection.calls < 2:
+            await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(asyncio.wait_for(scenario(), 5))
+
+    assert connection.calls >= 2 and async_connection.calls >= 2
+    # 非连接类组件只初始化一次
+    assert static.calls == 1
+
+
+def test_ready_is_200_when_everything_is_warm(client, components):
+    prewarm.register("graph", lambda: None)
+    prewarm.warmup()
+
+    response = client.get("/ready")
+
+    assert response.status_code == 200 and response.json()["ready"]
+    assert response.json()["components"]["graph"]["state"] == "ready"
+
+
+def test_startup_report_lists_imports(client):
+    report = client.get("/startup").json()
+
+    assert "backend.main" in {entry["module"] for entry in report["imports"]["imports"]}
+    assert "warmup" in report
@@ -0,0 +1,80 @@
+import asyncio
+
+from backend.runs import Run, parse_last_event_id
+from fakes import read_sse
+
+
+# --------------------------
+# 可续传 SSE：事件 id 为 "<run_id>:<seq>"，凭 Last-Event-ID 回放错过的事件
+# --------------------------
+def _answer_text(events):
+    return "".join(e["content"] for _, e in events if e["type"] == "chat_delta")
+
+
+def test_last_event_id_replays_only_missed_events(client, llm):
+    llm.strong.replies = ["第一段，第二段，第三段。"]
+    first = read_sse(client.post("/chat/stream", json={"message": "续传"}).text)
+    run_id = first[0][0].split(":")[0]
+    cut = next(i for i, (_, e) in enumerate(first) if e["type"] == "chat_delta")
+    last_id = first[cut][0]
+
+    response = client.post("/chat/stream", json={"message": "续传"}, headers={"Last-Event-ID": last_id})
+
+    replay = read_sse(response.text)
+    assert response.headers["x-run-id"] == run_id
+    assert all(int(event_id.split(":")[1]) > int(last_id.split(":")[1]) for event_id, _ in replay)
+    assert _answer_text(first[:cut + 1]) + _answer_text(replay) == "第一段，第二段，第三段。"
+    assert replay[-1][1] == first[-1][1]
+    # 续传不会重新执行图
+    assert len(llm.strong.calls) == 1
+
+
+def test_resume_by_run_id_uses_query_parameter(client):
+    first = read_sse(client.post("/chat/stream", json={"message": "续传"}).text)
+    run_id, seq = first[-2][0].split(":")
+
+    replay = read_sse(client.get(f"/chat/stream/{run_id}", params={"last_event_id": f"{run_id}:{seq}"}).text)
+
+    assert replay == first[-1:]
+
+
+def test_unknown_or_malformed_ids_are_rejected(client):
+    assert client.post("/chat/stream", json={"message": "x"}, headers={"Last-Event-ID": "gone:3"}).status_code == 410
+    assert client.post("/chat/stream", json={"message": "x"}, headers={"Last-Event-ID": "nonsense"}).status_code == 400
+
+
+def test_parse_last_event_id():
+    assert parse_last_event_id("abc:12") == ("abc", 12)
+    assert parse_last_event_id("a:b:3") == ("a:b", 3)
+    assert parse_last_event_id("abc") is None
+    assert parse_last_event_id("abc:x") is None
+
+
+def test_consecutive_deltas_are_merged_and_sliced_on_replay():
+    async def scenario():
+        run = Run("r", "s", buffer_events=16, grace_seconds=1)
+        for piece in ("ab", "cd", "ef"):
+            await run.publish({"type": "chat_delta", "content": piece, "meta": {"id": "m"}, "is_final": False})
+        await run.publish({"type": "chat", "content": "abcdef", "is_final": True})
+        return run
+
+    run = asyncio.run(scenario())
+
+    assert len(run._buffer) == 2
+    assert run._since(1) == [(3, {"type": "chat_delta", "content": "cdef", "meta": {"id": "m"}, "is_final": False}),
+                             (4, {"type": "chat", "content": "abcdef", "is_final": True})]
+
+
+def test_buffer_overflow_reports_a_replay_gap():
+    async def scenario():
+        run = Run("r", "s", buffer_events=16, grace_seconds=1)
+        for i in range(20):
+            await run.publish({"type": "tool_result", "content": i, "is_final": False})
+        return run
+
+    run = asyncio.run(scenario())
+    events = run._since(0)
+
+    assert events[0][1]["type"] == "replay_gap"
+    assert events[0][1]["missed_from"] == 1 and events[0][1]["resume_from"] == 5
+    assert [e["content"] for _, e in events[1:]] == list(range(4, 20))
@@ -0,0 +1,158 @@
+import asyncio
+import threading
+
+import pytest
+
+from agent.utils.cancel import CancelToken, RunCancelled, bind_token
+from agent.utils.deadline import DeadlineExceeded, bind_deadline
+from agent.utils.scheduler import LLMScheduler, TokenBucket, priority_for, priority_scope
+
+
+# --------------------------
+# LLM 调度器：令牌桶限速，按优先级发放许可，同步与异步调用方同队列
+# --------------------------
+def _drained(rpm: float = 600) -> LLMScheduler:
+    # 请求桶为空：之后每 60/rpm 秒补充一个许可
+    scheduler = LLMScheduler(requests_per_minute=rpm, tokens_per_minute=0)
+    scheduler.requests.tokens = 0
+    return scheduler
+
+
+def test_token_bucket_wait_time():
+    bucket = TokenBucket(60)
+    bucket.tokens = 0
+    now = bucket.updated
+
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    # 超过容量的需求按容量计
+    assert bucket.wait_time(1000, now) == pytest.approx(60.0)
+    assert TokenBucket(0).wait_time(10 ** 9, now) == 0
+
+
+def test_priority_scope_overrides_purpose_priority():
+    assert priority_for("chatbot") == "interactive"
+    assert priority_for("planning.judge") == "planning"
+    assert priority_for("compaction") == "planning"
+    with priority_scope("batch"):
+        assert priority_for("chatbot") == "batch"
+    assert priority_for("chatbot") == "interactive"
+
+
+def test_permits_are_granted_by_priority():
+    scheduler = _drained()
+    order = []
+
+    async def call(priority, name):
+        await scheduler.acquire(priority, 1)
+        order.append(name)
+
+    async def scenario():
+        tasks = [asyncio.create_task(call("batch", "batch"))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(call("planning", "planning")))
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(call("interactive", "interactive")))
+        await asyncio.gather(*tasks)
+
+    asyncio.run(asyncio.wait_for(scenario(), 5))
+
+    assert order == ["interactive", "planning", "batch"]
+
+
+def test_sync_callers_share_the_priority_queue():
+    scheduler = _drained()
+    order = []
+
+    def sync_call():
+        scheduler.acquire_sync("interactive", 1)
+        order.append("sync")
+
+    async def scenario():
+        batch = asyncio.create_task(scheduler.acquire("batch", 1))
+        await asyncio.sleep(0)
+        thread = threading.Thread(target=sync_call)
+        thread.start()
+        await batch
+        order.append("batch")
+        await asyncio.to_thread(thread.join)
+
+    asyncio.run(asyncio.wait_for(scenario(), 5))
+
+    assert order == ["sync", "batch"]
+
+
+def test_cancelled_waiter_before_grant_is_skipped():
+    scheduler = _drained(rpm=60)
+
+    async def scenario():
+        waiter = asyncio.create_task(scheduler.acquire("interactive", 1))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    asyncio.run(scenario())
+
+    assert scheduler.stats()["granted"] == 0 and scheduler.stats()["queued"] == {}
+
+
+def test_permit_is_refunded_when_waiter_is_cancelled_after_grant():
+    scheduler = _drained(rpm=60)
+
+    async def scenario():
+        waiter = asyncio.create_task(scheduler.acquire("interactive", 1))
+        await asyncio.sleep(0)
+        scheduler.requests.tokens = 1
+        scheduler._dispatch()  # 发放许可，唤醒尚未执行
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    asyncio.run(scenario())
+
+    stats = scheduler.stats()
+    assert stats["granted"] == 1 and stats["refunded"] == 1
+    assert scheduler.requests.tokens == pytest.approx(1, abs=0.1)
+
+
+def test_sync_waiter_gives_up_when_its_run_is_cancelled():
+    scheduler = _drained(rpm=6)
+    token = CancelToken()
+    errors = []
+
+    def sync_call():
+        with bind_token(token):
+            try:
+                scheduler.acquire_sync("interactive", 1)
+            except RunCancelled as e:
+                errors.append(e)
+
+    thread = threading.Thread(target=sync_call)
+    thread.start()
+    token.cancel("client_cancelled")
+    thread.join(2)
+
+    assert not thread.is_alive() and len(errors) == 1
+    assert scheduler.stats()["queued"] == {} and scheduler.stats()["granted"] == 0
+
+
+def test_sync_waiter_gives_up_at_the_deadline():
+    scheduler = _drained(rpm=6)
+
+    with bind_deadline(0.3), pytest.raises(DeadlineExceeded):
+        scheduler.acquire_sync("interactive", 1)
+
+    assert scheduler.stats()["queued"] == {}
+
+
+def test_rate_limit_pauses_and_settle_corrects_estimates():
+    scheduler = LLMScheduler(requests_per_minute=600, tokens_per_minute=6000)
+
+    scheduler.penalize(0.5)
+    assert not scheduler.try_acquire(1)
+    assert scheduler.stats()["paused_seconds"] > 0
+
+    scheduler._paused_until = 0
+    assert scheduler.try_acquire(100)
+    scheduler.settle(estimated=100, actual=400)
+    assert scheduler.tokens.tokens == pytest.approx(6000 - 400, abs=5)
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from agent import config as agent_config
+from agent.agent import agent_arespond, get_graph
+from agent.utils.session import SessionLocks, normalize_session_id
+
+
+# --------------------------
+# 会话隔离：每个会话独立的 thread_id，同一会话的轮次串行
+# --------------------------
+def test_make_graph_config_never_shares_a_default_thread():
+    first = agent_config.make_graph_config()["configurable"]["thread_id"]
+    second = agent_config.make_graph_config(None)["configurable"]["thread_id"]
+
+    assert first != second
+    assert agent_config.make_graph_config("s-1")["configurable"]["thread_id"] == "s-1"
+
+
+@pytest.mark.parametrize("raw, expected", [(None, None), ("  ", None), (" abc-1.2:3 ", "abc-1.2:3")])
+def test_normalize_session_id(raw, expected):
+    assert normalize_session_id(raw) == expected
+
+
+@pytest.mark.parametrize("raw", ["a b", "x" * 129, "../etc"])
+def test_normalize_session_id_rejects_bad_ids(raw):
+    with pytest.raises(ValueError):
+        normalize_session_id(raw)
+
+
+def test_sessions_keep_separate_histories(llm):
+    async def scenario():
+        await agent_arespond("我是甲", session_id="s-a")
+        await agent_arespond("我是乙", session_id="s-b")
+        await agent_arespond("我是谁", session_id="s-a")
+
+    asyncio.run(scenario())
+
+    history = [m.content for m in get_graph().get_state({"configurable": {"thread_id": "s-a"}}).values["messages"]]
+    assert history == ["我是甲", "回答：我是甲", "我是谁", "回答：我是谁"]
+    # 第三轮的提示只包含会话 s-a 的历史
+    assert "我是乙" not in [getattr(m, "content", None) for m in llm.strong.calls[2]]
+
+
+def test_same_session_turns_run_one_at_a_time(llm):
+    llm.strong.delay = 0.02
+
+    async def scenario():
+        return await asyncio.gather(*(agent_arespond(f"问题{i}", session_id="s-serial") for i in range(3)))
+
+    answers = asyncio.run(scenario())
+
+    assert answers == [f"回答：问题{i}" for i in range(3)]
+    # 串行执行：每一轮都看得到前面所有轮次
+    assert [len(call) for call in llm.strong.calls] == [2, 4, 6]
+
+
+def test_session_lock_is_fifo_across_sync_and_async_callers():
+    locks = SessionLocks()
+    order = []
+
+    async def scenario():
+        async with locks.hold("s"):
+            thread = threading.Thread(target=sync_turn)
+            thread.start()
+            while locks._locks["s"].refs < 2:
+                await asyncio.sleep(0.01)
+            waiter = asyncio.create_task(async_turn())
+            await asyncio.sleep(0.05)
+            order.append("first")
+        await waiter
+        await asyncio.to_thread(thread.join)
+
+    def sync_turn():
+        with locks.hold_sync("s"):
+            order.append("sync")
+            time.sleep(0.02)
+
+    async def async_turn():
+        async with locks.hold("s"):
+            order.append("async")
+
+    asyncio.run(scenario())
+
+    assert order == ["first", "sync", "async"]
+    assert not locks.is_busy("s") and locks.active_sessions() == 0
+
+
+def test_cancelled_waiter_does_not_leak_the_lock():
+    locks = SessionLocks()
+
+    async def scenario():
+        async with locks.hold("s"):
+            waiter = asyncio.create_task(_enter(locks))
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+        async with locks.hold("s"):
+            pass
+
+    asyncio.run(asyncio.wait_for(scenario(), 2))
+    assert locks.active_sessions() == 0
+
+
+async def _enter(locks):
+    async with locks.hold("s"):
+        pass
+
+
+def test_chat_stream_rejects_invalid_session_id(client):
+    response = client.post("/chat/stream", json={"message": "hi", "options": {"session_id": "bad id"}})
+
+    assert response.status_code == 400
@@ -0,0 +1,226 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from agent.utils.deadline import DeadlineExceeded
+from agent.utils.singleflight import SingleFlight, mark_partial
+
+
+# --------------------------
+# Single-flight：合并进行中的相同请求
+# --------------------------
+def _threads(n, target):
+    threads = [threading.Thread(target=target) for _ in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+
+def test_concurrent_identical_calls_execute_once():
+    group = SingleFlight("test-sync")
+    executions, results = [], []
+
+    def fetch():
+        executions.append(1)
+        time.sleep(0.1)
+        return {"items": [1, 2]}
+
+    _threads(5, lambda: results.append(group.do("q", fetch)))
+
+    assert len(executions) == 1
+    assert results == [{"items": [1, 2]}] * 5
+    # 每个调用方拿到独立的副本
+    assert len({id(r) for r in results}) == 5
+    assert group.stats()["coalesced"] == 4 and group.stats()["in_flight"] == 0
+
+
+def test_ordinary_errors_are_shared():
+    group = SingleFlight("test-sync-error")
+    errors = []
+
+    def fail():
+        time.sleep(0.1)
+        raise ValueError("search failed")
+
+    def call():
+        try:
+            group.do("q", fail)
+        except ValueError as e:
+            errors.append(e)
+
+    _threads(3, call)
+
+    assert len(errors) == 3 and group.stats()["executions"] == 1
+
+
+def test_waiters_re_run_when_the_leader_runs_out_of_time():
+    group = SingleFlight("test-sync-deadline")
+    calls, results = [], []
+    started = threading.Event()
+
+    def leader_fn():
+        calls.append("leader")
+        started.set()
+        time.sleep(0.1)
+        raise DeadlineExceeded("leader budget")
+
+    def leader():
+        with pytest.raises(DeadlineExceeded):
+            group.do("q", leader_fn)
+
+    def follower():
+        started.wait(1)
+        results.append(group.do("q", lambda: calls.append("follower") or "ok"))
+
+    threads = [threading.Thread(target=leader), threading.Thread(target=follower)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == ["leader", "follower"] and results == ["ok"]
+
+
+def test_async_calls_are_coalesced():
+    group = SingleFlight("test-async")
+    executions = []
+
+    async def judge():
+        executions.append(1)
+        await asyncio.sleep(0.05)
+        return ["yes"]
+
+    async def scenario():
+        return await asyncio.gather(*(group.ado("k", judge) for _ in range(4)))
+
+    results = asyncio.run(scenario())
+
+    assert len(executions) == 1 and results == [["yes"]] * 4
+    assert group.stats()["coalesced"] == 3
+
+
+def test_async_waiters_re_elect_after_leader_deadline():
+    group = SingleFlight("test-async-deadline")
+    calls = []
+
+    async def leader_fn():
+        calls.append("leader")
+        await asyncio.sleep(0.05)
+        raise DeadlineExceeded("leader budget")
+
+    async def follower_fn():
+        calls.append("follower")
+        return "ok"
+
+    async def scenario():
+        leader = asyncio.create_task(group.ado("k", leader_fn))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(group.ado("k", follower_fn))
+        with pytest.raises(DeadlineExceeded):
+            await leader
+        return await follower
+
+    assert asyncio.run(scenario()) == "ok"
+    assert calls == ["leader", "follower"]
+
+
+def test_shared_execution_is_cancelled_when_every_caller_leaves():
+    group = SingleFlight("test-async-cancel")
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    async def scenario():
+        callers = [asyncio.create_task(group.ado("k", slow)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        callers[0].cancel()
+        await asyncio.sleep(0.01)
+        assert cancelled == []
+        callers[1].cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+
+    assert cancelled == [1] and group.stats()["in_flight"] == 0
+
+
+def test_partial_results_are_not_shared():
+    group = SingleFlight("test-sync-partial")
+    calls, results = [], []
+    started = threading.Event()
+
+    def leader_fn():
+        calls.append("leader")
+        started.set()
+        time.sleep(0.1)
+        # 例如 leader 预算将尽，只下载了部分网页
+        mark_partial()
+        return "partial"
+
+    def follower():
+        started.wait(1)
+        results.append(group.do("q", lambda: calls.append("follower") or "full"))
+
+    threads = [threading.Thread(target=lambda: results.append(group.do("q", leader_fn))),
+               threading.Thread(target=follower)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == ["leader", "follower"] and sorted(results) == ["full", "partial"]
+
+
+def test_async_partial_results_are_not_shared():
+    group = SingleFlight("test-async-partial")
+    calls = []
+
+    async def leader_fn():
+        calls.append("leader")
+        await asyncio.sleep(0.05)
+        mark_partial()
+        return "partial"
+
+    async def follower_fn():
+        calls.append("follower")
+        return "full"
+
+    async def scenario():
+        leader = asyncio.create_task(group.ado("k", leader_fn))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(group.ado("k", follower_fn))
+        return await leader, await follower
+
+    assert asyncio.run(scenario()) == ("partial", "full")
+    assert calls == ["leader", "follower"]
+
+
+def test_caller_arriving_while_the_abandoned_execution_is_cancelled_runs_fresh():
+    group = SingleFlight("test-async-cancel-window")
+
+    async def slow():
+        await asyncio.sleep(5)
+
+    async def fast():
+        return "ok"
+
+    async def scenario():
+        first = asyncio.create_task(group.ado("k", slow))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        # 共享执行的取消尚未完成（done 回调未触发）时到达的新调用方
+        return await group.ado("k", fast)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert group.stats()["executions"] == 2
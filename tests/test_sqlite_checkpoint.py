@@ -0,0 +1,82 @@
+import operator
+from typing import Annotated, List, TypedDict
+
+from langgraph.graph import START, StateGraph
+
+from agent.utils.sqlite_checkpoint import SqliteCheckpointSaver
+
+
+# --------------------------
+# SQLite checkpointer：多个实例（worker）共享同一个数据库文件
+# --------------------------
+class _State(TypedDict):
+    items: Annotated[List[str], operator.add]
+
+
+def _graph(saver, payload: str = "x"):
+    builder = StateGraph(_State)
+    builder.add_node("step", lambda state: {"items": [payload]})
+    builder.add_edge(START, "step")
+    return builder.compile(checkpointer=saver)
+
+
+def _config(thread_id: str):
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def test_sessions_are_shared_between_instances(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    worker_a, worker_b = _graph(SqliteCheckpointSaver(path)), _graph(SqliteCheckpointSaver(path))
+
+    worker_a.invoke({"items": ["a"]}, _config("s"))
+    worker_b.invoke({"items": ["b"]}, _config("s"))
+
+    assert worker_a.get_state(_config("s")).values["items"] == ["a", "x", "b", "x"]
+
+
+def test_task_writes_are_visible_to_other_instances_immediately(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    writer, reader = SqliteCheckpointSaver(path), SqliteCheckpointSaver(path)
+    graph = _graph(writer)
+    graph.invoke({"items": []}, _config("s"))
+    latest = writer.get_tuple(_config("s")).config
+
+    writer.put_writes(latest, [("items", ["pending"])], task_id="task-1")
+
+    assert reader.get_tuple(_config("s")).pending_writes == [("task-1", "items", ["pending"])]
+
+
+def test_keeps_only_the_last_checkpoints(tmp_path):
+    saver = SqliteCheckpointSaver(str(tmp_path / "checkpoints.sqlite"), keep_last=2)
+    graph = _graph(saver)
+
+    for _ in range(4):
+        graph.invoke({"items": []}, _config("s"))
+
+    assert len(list(saver.list(_config("s")))) == 2
+    assert graph.get_state(_config("s")).values["items"] == ["x"] * 4
+    assert saver.stats()["checkpoints"] == 2
+
+
+def test_large_payloads_are_compressed(tmp_path):
+    saver = SqliteCheckpointSaver(str(tmp_path / "checkpoints.sqlite"))
+    graph = _graph(saver, payload="搜索结果" * 2000)
+
+    graph.invoke({"items": []}, _config("s"))
+
+    types = {row[0] for row in saver._conn().execute("SELECT type FROM checkpoints")}
+    assert any(t.startswith("z:") for t in types)
+    assert graph.get_state(_config("s")).values["items"] == ["搜索结果" * 2000]
+
+
+def test_delete_thread_removes_checkpoints_and_writes(tmp_path):
+    saver = SqliteCheckpointSaver(str(tmp_path / "checkpoints.sqlite"))
+    graph = _graph(saver)
+    graph.invoke({"items": []}, _config("a"))
+    graph.invoke({"items": []}, _config("b"))
+
+    saver.delete_thread("a")
+
+    assert saver.get_tuple(_config("a")) is None
+    assert saver.get_tuple(_config("b")) is not None
+    assert saver._conn().execute("SELECT COUNT(*) FROM writes WHERE thread_id='a'").fetchone() == (0,)
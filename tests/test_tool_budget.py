@@ -0,0 +1,66 @@
+import json
+
+from langchain_core.messages import ToolMessage
+
+from agent.utils import tokens
+from agent.utils.tool_budget import _TRUNCATED_NOTE, apply_budget, budget_for, cut_at_sentence
+
+
+# --------------------------
+# 工具输出预算：按工具的 token 上限确定性地精简结果
+# --------------------------
+def _tool(name, content):
+    return ToolMessage(content=content, tool_call_id="call-1", name=name)
+
+
+def test_token_estimate_weighs_cjk_heavier():
+    assert tokens.estimate("") == 0
+    assert tokens.estimate("中文" * 100) > tokens.estimate("ab" * 100)
+    assert tokens.estimate(tokens.truncate("中文" * 100, 30)) <= 31
+
+
+def test_search_results_stay_valid_json_within_budget():
+    results = [{"title": f"标题{i}", "link": f"https://e.com/{i}", "snippet": "很长的摘要。" * 100,
+                "favicon": "data:image/png;base64,AAAA", "score": 10 - i, "index": i} for i in range(40)]
+    msg = apply_budget(_tool("google_search", json.dumps(results, ensure_ascii=False)))
+
+    items = json.loads(msg.content)
+    assert tokens.estimate(msg.content) <= budget_for("google_search")
+    assert all("favicon" not in item for item in items)
+    assert [item["index"] for item in items] == list(range(len(items)))
+    dropped = msg.response_metadata["output_budget"]["dropped"]
+    assert dropped["fields"] == ["favicon"] and dropped["snippets_truncated"] == 40
+    assert dropped["items"] == 40 - len(items)
+
+
+def test_small_outputs_are_untouched():
+    msg = apply_budget(_tool("google_search", json.dumps([{"title": "a", "link": "b"}])))
+
+    assert "output_budget" not in msg.response_metadata
+
+
+def test_docs_continuation_offsets_follow_the_cut():
+    text = "第一句话。" * 2000
+    out = {"path": "a.txt", "content": text, "offset_used": 0, "overlap_used": 0,
+           "next_offset": len(text), "has_more": False, "total_chars": len(text)}
+    msg = apply_budget(_tool("docs_use", json.dumps(out, ensure_ascii=False)))
+
+    trimmed = json.loads(msg.content)
+    assert tokens.estimate(msg.content) <= budget_for("docs_use")
+    assert trimmed["truncated_by_budget"] and trimmed["has_more"]
+    assert trimmed["next_offset"] == len(trimmed["content"])
+    assert trimmed["content"].endswith("。")
+
+
+def test_text_is_cut_at_a_sentence_boundary():
+    msg = apply_budget(_tool("url_summary", "这是一句完整的话。" * 500))
+
+    assert msg.content.endswith("。" + _TRUNCATED_NOTE)
+    assert tokens.estimate(msg.content) <= budget_for("url_summary")
+    assert msg.response_metadata["output_budget"]["original_tokens"] > budget_for("url_summary")
+
+
+def test_cut_without_sentence_end_keeps_the_prefix():
+    cut = cut_at_sentence("x" * 1000, 30)
+
+    assert 90 <= len(cut) <= 100 and tokens.estimate(cut) <= 31
@@ -0,0 +1,90 @@
+import hashlib
+
+from backend import main
+
+
+# --------------------------
+# 上传：按 sha256 去重、分片续传
+# --------------------------
+def _upload(client, name: str, data: bytes):
+    return client.post("/upload", files={"file": (name, data, "text/plain")})
+
+
+def test_upload_saves_file_and_deduplicates_by_content(client):
+    first = _upload(client, "notes.txt", b"hello world").json()
+    second = _upload(client, "copy.txt", b"hello world").json()
+
+    assert first["filename"] == "notes.txt" and not first["deduplicated"]
+    assert first["sha256"] == hashlib.sha256(b"hello world").hexdigest()
+    assert second["filename"] == "notes.txt" and second["deduplicated"]
+    assert (main.UPLOADS.workspace / "notes.txt").read_bytes() == b"hello world"
+    assert not (main.UPLOADS.workspace / "copy.txt").exists()
+
+
+def test_same_name_with_different_content_is_not_overwritten(client):
+    _upload(client, "a.txt", b"v1")
+    second = _upload(client, "a.txt", b"v2").json()
+
+    assert second["filename"] != "a.txt" and second["filename"].startswith("a_")
+    assert (main.UPLOADS.workspace / "a.txt").read_bytes() == b"v1"
+
+
+def test_rejects_unsupported_extensions_and_oversized_files(client):
+    assert _upload(client, "run.exe", b"x").status_code == 400
+    assert _upload(client, "big.txt", b"x" * (main.UPLOADS.max_bytes + 1)).status_code == 413
+    assert list(main.UPLOADS.partial_dir.iterdir()) == []
+
+
+def test_resumable_upload_in_chunks(client):
+    data = "分片上传的内容".encode("utf-8") * 100
+    init = client.post("/upload/init", json={"filename": "big.md", "size": len(data)}).json()
+    upload_id = init["upload_id"]
+
+    client.put(f"/upload/{upload_id}", params={"offset": 0}, content=data[:500])
+    # 断线后查询已接收字节数，从该位置继续
+    offset = client.get(f"/upload/{upload_id}").json()["offset"]
+    mismatch = client.put(f"/upload/{upload_id}", params={"offset": 0}, content=data[:10])
+    client.put(f"/upload/{upload_id}", params={"offset": offset}, content=data[offset:])
+    done = client.post(f"/upload/{upload_id}/complete").json()
+
+    assert offset == 500
+    assert mismatch.status_code == 409 and mismatch.json()["detail"]["offset"] == 500
+    assert done["sha256"] == hashlib.sha256(data).hexdigest()
+    assert (main.UPLOADS.workspace / "big.md").read_bytes() == data
+    # 请求结束后不留下锁与哈希状态
+    assert main.UPLOADS._upload_locks == {} and main.UPLOADS._hashers == {}
+
+
+def test_incomplete_or_corrupted_uploads_are_rejected(client):
+    data = b"0123456789"
+    upload_id = client.post("/upload/init", json={"filename": "x.txt", "size": 10,
+                                                  "sha256": "0" * 64}).json()["upload_id"]
+
+    client.put(f"/upload/{upload_id}", params={"offset": 0}, content=data[:4])
+    incomplete = client.post(f"/upload/{upload_id}/complete")
+    too_long = client.put(f"/upload/{upload_id}", params={"offset": 4}, content=b"x" * 20)
+    offset = client.get(f"/upload/{upload_id}").json()["offset"]
+    client.put(f"/upload/{upload_id}", params={"offset": offset}, content=data[offset:])
+    corrupted = client.post(f"/upload/{upload_id}/complete")
+
+    assert incomplete.status_code == 409 and incomplete.json()["detail"]["offset"] == 4
+    assert too_long.status_code == 413 and offset == 4
+    assert corrupted.status_code == 400
+    assert client.get(f"/upload/{upload_id}").status_code == 404
+
+
+def test_known_hash_completes_without_uploading(client):
+    data = b"already here"
+    _upload(client, "known.txt", data)
+
+    init = client.post("/upload/init", json={"filename": "other.txt", "size": len(data),
+                                             "sha256": hashlib.sha256(data).hexdigest()}).json()
+
+    assert init["done"] and init["deduplicated"] and init["filename"] == "known.txt"
+
+
+def test_unknown_or_forged_upload_ids_leave_no_state(client):
+    assert client.get("/upload/doesnotexist").status_code == 404
+    assert client.put("/upload/../../etc", params={"offset": 0}, content=b"x").status_code in (404, 405)
+    assert client.put("/upload/abc123", params={"offset": 0}, content=b"x").status_code == 404
+    assert main.UPLOADS._upload_locks == {}
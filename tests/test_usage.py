@@ -0,0 +1,64 @@
+import asyncio
+
+from agent.agent import agent_respond_astream
+from agent.utils.usage import SessionUsage, TurnUsage
+from fakes import collect, read_sse, tool_call
+
+USAGE = {"input_tokens": 100, "output_tokens": 20, "total_tokens": 120, "input_token_details": {"cache_read": 60}}
+
+
+# --------------------------
+# token 用量：最终 chat 事件携带本轮合计与按节点明细，按会话累计
+# --------------------------
+def test_final_event_carries_turn_usage(llm):
+    llm.strong.usage = USAGE
+    llm.strong.replies = [tool_call("today_date"), "今天"]
+
+    events = asyncio.run(collect(agent_respond_astream("今天几号", session_id="s-usage")))
+
+    usage = events[-1]["usage"]
+    assert usage["calls"] == 2
+    assert usage["prompt_tokens"] == 200 and usage["completion_tokens"] == 40 and usage["total_tokens"] == 240
+    assert usage["prompt_cache_hit_tokens"] == 120 and usage["prompt_cache_miss_tokens"] == 80
+    assert usage["nodes"]["chatbot"]["calls"] == 2
+    assert all("usage" not in e for e in events[:-1])
+
+
+def test_turn_usage_groups_purposes_by_node():
+    usage = TurnUsage()
+    usage.add("planning.judge", {"input": 10, "output": 1, "cache_hit": 0, "cache_miss": 10})
+    usage.add("planning.select", {"input": 20, "output": 2, "cache_hit": 5, "cache_miss": 15})
+
+    snapshot = usage.snapshot()
+
+    assert snapshot["calls"] == 2 and snapshot["total_tokens"] == 33
+    assert list(snapshot["nodes"]) == ["planning"]
+
+
+def test_session_usage_accumulates_and_evicts_oldest():
+    sessions = SessionUsage(max_sessions=2)
+    turn = {"calls": 1, "prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12,
+            "nodes": {"chatbot": {"calls": 1, "total_tokens": 12}}}
+    sessions.record("a", turn)
+    sessions.record("a", turn)
+    sessions.record("b", turn)
+    sessions.record("c", turn)
+
+    assert sessions.get("a") is None
+    assert sessions.get("c")["turns"] == 1
+    assert sessions.stats()["sessions"] == 2 and sessions.stats()["total_tokens"] == 24
+
+
+def test_usage_endpoints(client, llm):
+    llm.strong.usage = USAGE
+    for question in ("第一轮", "第二轮"):
+        events = read_sse(client.post("/chat/stream", json={"message": question,
+                                                            "options": {"session_id": "s-http"}}).text)
+
+    session = client.get("/stats/usage/s-http").json()
+
+    assert events[-1][1]["usage"]["total_tokens"] == 120
+    assert session["turns"] == 2 and session["total_tokens"] == 240
+    assert session["nodes"]["chatbot"]["calls"] == 2
+    assert client.get("/stats/usage").json()["sessions"] >= 1
+    assert client.get("/stats/usage/unknown").status_code == 404
@@ -0,0 +1,129 @@
+from backend.ws import MAX_CREDIT_PER_FRAME
+
+
+# --------------------------
+# /ws/chat：一条连接上多路复用多个运行
+# --------------------------
+def _start(ws, ref, message):
+    ws.send_json({"type": "start", "ref": ref, "message": message, "options": {}})
+
+
+def _collect(ws, runs: int):
+    """
+    收集帧，直到 runs 个运行都已开始并收到 end；返回 (ref -> run_id, run_id -> 事件帧列表)。
+    """
+    refs, events, ended = {}, {}, set()
+    while len(refs) < runs or ended != set(refs.values()):
+        frame = ws.receive_json()
+        if frame["type"] == "started":
+            refs[frame["ref"]] = frame["run_id"]
+        elif frame["type"] == "event":
+            events.setdefault(frame["run_id"], []).append(frame)
+        elif frame["type"] == "end":
+            ended.add(frame["run_id"])
+        else:
+            raise AssertionError(f"unexpected frame {frame}")
+    return refs, events
+
+
+def test_concurrent_runs_on_one_socket(client):
+    with client.websocket_connect("/ws/chat") as ws:
+        _start(ws, "a", "问题甲")
+        _start(ws, "b", "问题乙")
+        refs, events = _collect(ws, runs=2)
+
+    assert refs["a"] != refs["b"]
+    assert events[refs["a"]][-1]["event"]["content"] == "回答：问题甲"
+    assert events[refs["b"]][-1]["event"]["content"] == "回答：问题乙"
+    for frames in events.values():
+        ids = [f["id"] for f in frames]
+        assert ids == sorted(ids)
+
+
+def test_resume_replays_after_last_id(client):
+    with client.websocket_connect("/ws/chat") as ws:
+        _start(ws, "a", "续传")
+        refs, events = _collect(ws, runs=1)
+        run_id = refs["a"]
+        ws.send_json({"type": "resume", "run_id": run_id, "last_id": events[run_id][-2]["id"]})
+        replay = [ws.receive_json(), ws.receive_json()]
+
+    assert replay[0]["type"] == "event" and replay[0]["event"] == events[run_id][-1]["event"]
+    assert replay[1] == {"type": "end", "run_id": run_id, "id": events[run_id][-1]["id"]}
+
+
+def test_malformed_frames_get_an_error_and_keep_the_socket(client):
+    with client.websocket_connect("/ws/chat") as ws:
+        ws.send_text("not json")
+        invalid_json = ws.receive_json()
+        ws.send_json({"type": "credit", "run_id": "r1", "n": -1})
+        bad_credit = ws.receive_json()
+        ws.send_json({"type": "resume", "run_id": "r2", "last_id": "abc"})
+        bad_resume = ws.receive_json()
+        ws.send_json({"type": "resume", "run_id": "gone", "last_id": 0})
+        expired = ws.receive_json()
+        ws.send_json({"type": "bogus"})
+        unknown = ws.receive_json()
+        # 连接仍可用
+        _start(ws, "a", "还在吗")
+        refs, events = _collect(ws, runs=1)
+
+    assert invalid_json["status"] == 400
+    assert bad_credit["status"] == 400 and bad_credit["run_id"] == "r1"
+    assert bad_resume["status"] == 400 and bad_resume["run_id"] == "r2"
+    assert expired["status"] == 410 and expired["run_id"] == "gone"
+    assert unknown["status"] == 400
+    assert events[refs["a"]][-1]["event"]["content"] == "回答：还在吗"
+
+
+def test_invalid_session_id_is_reported_per_start(client):
+    with client.websocket_connect("/ws/chat") as ws:
+        ws.send_json({"type": "start", "ref": "x", "message": "hi", "options": {"session_id": "bad id"}})
+        error = ws.receive_json()
+
+    assert error["type"] == "error" and error["ref"] == "x" and error["status"] == 400
+
+
+def test_credit_pauses_and_resumes_delivery(client, monkeypatch, llm):
+    monkeypatch.setenv("AGENT_WS_INITIAL_CREDIT", "1")
+    llm.strong.replies = ["一二三四五六"]
+    with client.websocket_connect("/ws/chat") as ws:
+        _start(ws, "a", "流控")
+        started = ws.receive_json()
+        first = ws.receive_json()
+        # 额度用完：补充额度后才继续推送
+        ws.send_json({"type": "credit", "run_id": started["run_id"], "n": MAX_CREDIT_PER_FRAME * 10})
+        rest = []
+        while not rest or rest[-1]["type"] != "end":
+            rest.append(ws.receive_json())
+
+    assert first["type"] == "event" and first["id"] == 1
+    assert rest[-2]["event"]["content"] == "一二三四五六"
+
+
+def test_runs_started_elsewhere_need_the_session_to_resume_or_cancel(client):
+    with client.websocket_connect("/ws/chat") as owner:
+        _start(owner, "a", "归属")
+        started = owner.receive_json()
+        while owner.receive_json()["type"] != "end":
+            pass
+        run_id = started["run_id"]
+
+    with client.websocket_connect("/ws/chat") as other:
+        other.send_json({"type": "cancel", "run_id": run_id})
+        cancel = other.receive_json()
+        other.send_json({"type": "resume", "run_id": run_id, "session_id": "someone-else", "last_id": 0})
+        wrong_session = other.receive_json()
+        other.send_json({"type": "resume", "run_id": run_id, "session_id": started["session_id"], "last_id": 0})
+        frames = [other.receive_json()]
+        while frames[-1]["type"] != "end":
+            frames.append(other.receive_json())
+        # 续接之后可以取消
+        other.send_json({"type": "cancel", "run_id": run_id})
+        other.send_json({"type": "bogus"})
+        after_resume = other.receive_json()
+
+    assert cancel["status"] == 403 and cancel["run_id"] == run_id
+    assert wrong_session["status"] == 403
+    assert frames[-2]["event"]["content"] == "回答：归属"
+    assert after_resume["detail"].startswith("unknown message type")